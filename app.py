@@ -1,13 +1,32 @@
 from flask import Flask, request, Response, jsonify, Blueprint
 from flask_cors import CORS
-from supabase import create_client, Client
 from dotenv import load_dotenv
-import os, time, threading, json, uuid
-from datetime import datetime
+import os, sys, time, threading, json, uuid, hmac, functools, atexit, subprocess, secrets
+from datetime import datetime, timedelta
 from collections import Counter
-import cv2
-from inference_sdk import InferenceHTTPClient
+import metrics
+import tracing
+import app_logging
+import profiler
+from lot_cache import LotCache
+from departures import DepartureIndex, to_minute
+from events import Broadcaster, ALL_TOPICS, lot_topic
+import streams
+import scheduler
+from counters import DeltaAggregator
+from ids import MAX_WORKER_ID, IdGenerator
+from write_buffer import BufferedInserter
+from repository import create_repository, lot_state
+import cv_ipc
+import roles
+import leases
+import budget
+import conditional
+import geo
+import resilience
 load_dotenv()
+app_logging.configure()
+log = app_logging.get_logger()
 
 app = Flask(__name__)
 
@@ -24,75 +43,35 @@ CORS(app, resources={
 # Create a Blueprint with /api prefix
 api = Blueprint('api', __name__, url_prefix='/api')
 
-url = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-key = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
-supabase: Client = create_client(url, key)
-global_id = 0
+# Lots/schedules storage: Supabase by default, embedded SQLite with DATASTORE=sqlite
+REPOSITORY = create_repository()
+# Background jobs run in exactly one process however many workers serve the app
+LEASE_BACKEND = leases.create_backend(REPOSITORY)
 
-# Initialize Roboflow client for CV
-ROBOFLOW_API_KEY = os.getenv("ROBOFLOW_API_KEY")
-CV_CLIENT = InferenceHTTPClient(
-    api_url="https://serverless.roboflow.com",
-    api_key=ROBOFLOW_API_KEY
-)
-MODEL_ID = "parking-d1qyt/1"
-VIDEO_PATH = "public/parking_lot_video_slow.mp4"
-CONFIDENCE_THRESHOLD = 0.28
+# CV runs in cv_service.py and reports over local IPC:
+#   CV_MODE=spawn     start cv_service.py as a child process (default)
+#   CV_MODE=external  only listen; the service is run/supervised separately
+#   CV_MODE=off       no occupancy updates from CV
+CV_MODE = os.getenv("CV_MODE", "spawn").lower()
 
-# Global flag to control the background thread
-cv_thread_running = False
+# Bearer token for /api/admin/* routes; admin routes are disabled when unset
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
 
-# ============================================
-# COMPUTER VISION BACKGROUND PROCESSING
-# ============================================
-
-def parse_prediction(pred):
-    """Interpret classes for the parking model."""
-    cls = pred["class"].lower().strip()
-    if cls == "free":
-        return "free"
-    if cls == "car":
-        return "occupied"
-    return "occupied"
+# Fan-out of lot changes to /api/lot/<name>/events and /api/lots/events subscribers
+EVENTS = Broadcaster()
+metrics.REGISTRY.gauge(
+    "parkabull_sse_subscribers", "Connected Server-Sent Events clients",
+).set_function(lambda: {(): EVENTS.subscriber_count})
 
+# One thread owns every timed transition (leaving-soon reverts, schedule expiry)
+LEAVING_SOON_TTL = 300  # seconds a "leaving soon" tap counts for
+# Each worker journals its own timers (scheduler_journal.<pid>.json); a dead worker's are adopted once
+EXPIRY = scheduler.ExpiryScheduler(journal_path=os.getenv("SCHEDULER_JOURNAL", "scheduler_journal.json"))
 
-def analyze_frame_from_video(frame):
-    """
-    Analyze a video frame and return occupancy counts.
-    Saves frame temporarily for inference.
-    """
-    temp_frame_path = "temp_frame.jpg"
-    cv2.imwrite(temp_frame_path, frame)
-    
-    try:
-        result = CV_CLIENT.infer(temp_frame_path, model_id=MODEL_ID)
-        
-        free = 0
-        occupied = 0
-        
-        for pred in result.get("predictions", []):
-            if pred.get("confidence", 0) < CONFIDENCE_THRESHOLD:
-                continue
-            status = parse_prediction(pred)
-            if status == "free":
-                free += 1
-            else:
-                occupied += 1
-        
-        total = free + occupied
-        
-        # Clean up temp file
-        if os.path.exists(temp_frame_path):
-            os.remove(temp_frame_path)
-        
-        return {"free": free, "occupied": occupied, "total": total}
-    
-    except Exception as e:
-        print(f"❌ Error analyzing frame: {e}")
-        if os.path.exists(temp_frame_path):
-            os.remove(temp_frame_path)
-        return {"free": 0, "occupied": 0, "total": 0}
 
+# ============================================
+# COMPUTER VISION BACKGROUND PROCESSING
+# ============================================
 
 def update_occupancy_in_db(lot_name, occupied_spots):
     """
@@ -103,91 +82,150 @@ def update_occupancy_in_db(lot_name, occupied_spots):
         # Update the lots table with new occupancy data
         # occupancy = number of OCCUPIED spots (not free!)
         # max_occupancy = total spots available
-        response = supabase.table('lots').update({
-            'occupancy': occupied_spots,      # Number of OCCUPIED spots
-        }).eq('name', lot_name).execute()
+        REPOSITORY.set_occupancy(lot_name, occupied_spots)  # Number of OCCUPIED spots
         
-        print(f"✅ Updated DB")
-        return response
+        metrics.mark_lot_updated(lot_name)
+        previous = LOT_CACHE.peek(lot_name)
+        LOT_CACHE.update(lot_name, occupancy=occupied_spots)
+        if previous is None or previous["occupancy"] != occupied_spots:
+            publish_lot_update(lot_name, occupancy=occupied_spots)
+        log.debug("✅ Updated DB", extra={"lot": lot_name, "occupied": occupied_spots})
+        return True
     
     except Exception as e:
-        print(f"❌ Error updating database: {e}")
+        log.error("❌ Error updating database: %s", e)
         return None
 
 
-def cv_background_worker():
-    """
-    Background thread that processes video frames every 5 seconds
-    and updates the database with occupancy data.
-    """
-    global cv_thread_running
-    
-    print("\n🎥 Starting CV background worker...")
-    print(f"📹 Video path: {VIDEO_PATH}")
-    print(f"🔄 Update interval: 5 seconds")
-    print(f"🎯 Model: {MODEL_ID}\n")
-    
-    if not os.path.exists(VIDEO_PATH):
-        print(f"❌ Video file not found: {VIDEO_PATH}")
+def handle_cv_message(message):
+    """Apply one message from cv_service.py (runs on a cv_ipc connection thread)."""
+    if not CV_LEADER.is_leader:
+        return  # demoted: another instance's CV service owns occupancy now
+    if message["type"] == "profile":
+        CV_PROFILES.resolve(message)
         return
-    
-    cap = cv2.VideoCapture(VIDEO_PATH)
-    
-    if not cap.isOpened():
-        print(f"❌ Could not open video: {VIDEO_PATH}")
+    lot_name = message["lot"]
+    if message.get("sample_interval") is not None:
+        metrics.CV_SAMPLE_INTERVAL.set(message["sample_interval"], lot=lot_name)
+    if message.get("priority") is not None:
+        metrics.CV_PRIORITY.set(message["priority"], lot=lot_name)
+    if message["type"] == "frame":
+        STREAMS.publish(lot_name, message["jpeg"], message.get("captured_at"))
+        return
+    if message["type"] == "stats":
+        metrics.CV_FRAMES_DECODED.inc(message["decoded"], lot=lot_name)
+        metrics.CV_FRAMES_DROPPED.inc(message["dropped"], lot=lot_name)
+        metrics.CV_SOURCE_RECONNECTS.inc(message.get("reconnects", 0), lot=lot_name)
+        return
+    if message["type"] != "occupancy":
+        log.warning("⚠️  Unknown CV message type: %s", message["type"])
+        return
+
+    metrics.CV_FRAMES_ANALYZED.inc(lot=lot_name)
+    metrics.INFERENCE_LATENCY.observe(message["inference_seconds"], model=message["model"])
+    # The inference policy runs in the CV service's worker processes; mirror its state here
+    if message.get("circuit") is not None:
+        resilience.CIRCUIT_STATE.set(resilience.STATE_VALUES[message["circuit"]], dependency="roboflow")
+    if message.get("attempts", 0) > 1:
+        resilience.RETRIES.inc(message["attempts"] - 1, dependency="roboflow")
+    if message.get("hedge_winner"):
+        resilience.HEDGES.inc(dependency="roboflow", winner=message["hedge_winner"])
+    if message["error"]:
+        metrics.INFERENCE_ERRORS.inc(model=message["model"])
+        return
+
+    with tracing.span("cv.update", lot=lot_name, frame=message["frame_index"], occupied=message["occupied"]):
+        update_occupancy_in_db(lot_name=lot_name, occupied_spots=message["occupied"])
+    metrics.CV_FRAME_LAG.observe(time.time() - message["captured_at"], lot=lot_name)
+
+
+# CV_MODE=spawn hands its child a fresh key; CV_MODE=external needs CV_IPC_AUTHKEY shared with the service
+CV_IPC_AUTHKEY = os.getenv("CV_IPC_AUTHKEY") or (secrets.token_hex(32) if CV_MODE == "spawn" else None)
+CV_RESULTS = cv_ipc.ResultListener(handle_cv_message, authkey=CV_IPC_AUTHKEY)
+CV_SERVICE = None
+
+
+def start_cv_worker():
+    """Listen for CV results and, with CV_MODE=spawn, launch cv_service.py next to the API."""
+    global CV_SERVICE
+    if CV_MODE == "off":
+        log.info("🎥 CV disabled (CV_MODE=off)")
+        return
+    CV_RESULTS.start()
+    if roles.has(roles.API):
+        EXPIRY.schedule_in(CV_DEMAND_INTERVAL, 'cv_demand', key='cv_demand')
+    if CV_MODE == "spawn":
+        CV_SERVICE = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                    "cv_service.py")],
+                                      env={**os.environ, "CV_IPC_AUTHKEY": CV_IPC_AUTHKEY})
+        log.info("✅ CV service started (pid %s)", CV_SERVICE.pid)
+
+
+def stop_cv_worker():
+    """Stop the spawned CV service and the result listener (leadership lost or shutdown)."""
+    global CV_SERVICE
+    if CV_SERVICE is not None:
+        CV_SERVICE.terminate()
+        try:
+            CV_SERVICE.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            CV_SERVICE.kill()
+        log.info("🛑 CV service stopped (pid %s)", CV_SERVICE.pid)
+        CV_SERVICE = None
+    CV_RESULTS.stop()
+
+
+CV_LEADER = leases.LeaderElector('cv', LEASE_BACKEND, on_elected=start_cv_worker, on_demoted=stop_cv_worker)
+
+# Per-lot /api/lot/<name> traffic, sent to the CV service to prioritize its inference budget.
+# Only this process's requests are counted; behind a load balancer that's a fair sample.
+CV_DEMAND = budget.DemandCounter()
+CV_DEMAND_INTERVAL = float(os.getenv("CV_DEMAND_INTERVAL", "5"))
+
+
+def send_cv_demand(timers):
+    if not CV_LEADER.is_leader or CV_MODE == "off":
         return
-    
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    frame_interval = int(fps * 5)  # Process every 5 seconds
-    
-    print(f"📊 Video info - FPS: {fps}, Total frames: {total_frames}")
-    
-    frame_count = 0
-    cv_thread_running = True
-    
     try:
-        while cv_thread_running:
-            ret, frame = cap.read()
-            
-            if not ret:
-                # Loop back to start of video
-                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                frame_count = 0
-                # print("🔄 Looping video back to start...")
-                continue
-            
-            # Process frame every 5 seconds worth of frames
-            if frame_count % frame_interval == 0:
-                # print(f"\n🔍 Processing frame {frame_count}/{total_frames}...")
-                
-                # Analyze the frame
-                results = analyze_frame_from_video(frame)
-                
-                # Update database
-                update_occupancy_in_db(
-                    lot_name="Furnas",
-                    occupied_spots=results['occupied'],
-                )
-            
-            frame_count += 1
-            
-            # Small sleep to prevent CPU overuse
-            time.sleep(0.01)
-    
-    except Exception as e:
-        print(f"❌ Error in CV worker: {e}")
-    
+        counts, interval = CV_DEMAND.take()
+        CV_RESULTS.broadcast({"type": "demand", "lots": counts, "interval": interval})
+        # Also resyncs a CV service that (re)connected after the last viewer change
+        send_stream_viewers(STREAMS.viewers())
     finally:
-        cap.release()
-        print("\n🛑 CV background worker stopped.")
+        EXPIRY.schedule_in(CV_DEMAND_INTERVAL, 'cv_demand', key='cv_demand')
 
 
-def start_cv_worker():
-    """Start the CV background worker thread."""
-    worker_thread = threading.Thread(target=cv_background_worker, daemon=True)
-    worker_thread.start()
-    print("✅ CV worker thread started")
+EXPIRY.register('cv_demand', send_cv_demand)
+
+
+# Profiles run inside cv_service.py (/api/admin/profile?process=cv), relayed over cv_ipc
+CV_PROFILES = cv_ipc.Replies()
+CV_PROFILE_GRACE = 10.0  # seconds to wait for a profile beyond its duration
+
+
+def profile_cv_service(seconds, interval, include_idle=False):
+    """profiler.sample() run in the CV service; raises ProfilerBusy, or RuntimeError if it can't be reached."""
+    if CV_MODE == "off" or not CV_LEADER.is_leader or not CV_RESULTS.connections:
+        raise RuntimeError("No CV service is connected to this process")
+    request_id = CV_PROFILES.expect()
+    CV_RESULTS.broadcast({"type": "profile", "id": request_id, "seconds": seconds,
+                          "interval": interval, "include_idle": include_idle})
+    reply = CV_PROFILES.wait(request_id, min(seconds, profiler.MAX_DURATION) + CV_PROFILE_GRACE)
+    if reply is None:
+        raise RuntimeError("The CV service didn't return a profile")
+    if "error" in reply:
+        raise (profiler.ProfilerBusy if reply["busy"] else RuntimeError)(reply["error"])
+    return reply["result"]
+
+
+def send_stream_viewers(viewers):
+    """Tell the CV service which lots have stream viewers (it only encodes frames for those)."""
+    if CV_LEADER.is_leader and CV_MODE != "off":
+        CV_RESULTS.broadcast({"type": "stream", "lots": viewers})
+
+
+# Annotated frames from the CV service, encoded once and fanned out to /api/lot/<name>/stream viewers
+STREAMS = streams.FrameHub(on_viewers_changed=send_stream_viewers)
 
 
 # @app.route('/')
@@ -195,123 +233,364 @@ def start_cv_worker():
 #     return render_template('index.html', message="Hello, Flask!")
 
 
-# def check_in_range(request):
-#     data = request.get_json()
-#     user_latitude = data.get('user_latitude')
-#     user_longitude = data.get('user_longitude')
-#     lot_name = data.get('lot_name')
-#     lot_data = supabase.table('lots').select('*').eq('name', lot_name).execute()
-#     lot_latitude = lot_data.data[0]['latitude'] 
-#     lot_longitude = lot_data.data[0]['longitude']
-#     if abs(lot_latitude - user_latitude) > 0.005 or abs(lot_longitude - user_longitude) > 0.005:
-#         Response.status_code = 404
-#         return False
-#     return True 
+# Lot coordinates, indexed for /api/lots/nearby and the range check below
+LOT_LOCATIONS = geo.LotLocations(REPOSITORY.lot_locations,
+                                 max_age=float(os.getenv("LOT_LOCATIONS_MAX_AGE", "300")))
 
-def return_schedule_json(lot_name, top_n=5):
-     # 1. Get lot_id for the given lot name
-    lot_data = supabase.table('lots') \
-        .select('id') \
-        .eq('name', lot_name) \
-        .single() \
-        .execute()
+# Users must be within LOT_RANGE_METERS of a lot to report on it (0 = range check off)
+LOT_RANGE_METERS = float(os.getenv("LOT_RANGE_METERS", "0"))
 
-    if not lot_data.data:
-        print(f"❌ Lot '{lot_name}' not found")
-        return []
 
-    lot_id = lot_data.data['id']
+def check_in_range(data, lot_name):
+    """Whether the request's user_latitude/user_longitude is close enough to `lot_name`."""
+    if LOT_RANGE_METERS <= 0:
+        return True
+    try:
+        user_latitude = float(data.get('user_latitude'))
+        user_longitude = float(data.get('user_longitude'))
+    except (TypeError, ValueError):
+        return False
+    # Lots without coordinates can't be checked
+    return LOT_LOCATIONS.within(lot_name, user_latitude, user_longitude, LOT_RANGE_METERS) is not False
 
-    # 2. Fetch schedules for this specific lot
-    schedules = supabase.table('schedules') \
-        .select('time') \
-        .eq('lot_id', lot_id) \
-        .execute() \
-        .data
+def load_schedule_times(lot_id):
+    """Fetch every departure time for a lot. Loader for DEPARTURES."""
+    schedules = REPOSITORY.schedule_times(lot_id)
 
-    print(f"Fetched schedules for {lot_name}: {schedules}")
+    log.debug("Fetched %d schedules for lot %s", len(schedules), lot_id)
 
-    if not schedules:
-        return []
+    times = []
+    for t in schedules:
+        if to_minute(t) is None:
+            log.warning("⚠️ Unexpected time format (expected HH:MM:SS): %s", t)
+            continue
+        times.append(t)
+    return times
 
-    normalized_times = []
 
-    for s in schedules:
-        t = s.get('time')
+# Per-lot minute-bucketed departure counts, updated on submit and on expiry
+DEPARTURES = DepartureIndex(load_schedule_times,
+                            max_age=float(os.getenv("DEPARTURE_INDEX_MAX_AGE", "300")))
 
-        if not t:
-            continue  # Skip null values
 
-        # ✅ Your DB stores "HH:MM", so convert to datetime to ensure sortable
-        try:
-            dt = datetime.strptime(t, "%H:%M:%S")
-            normalized_times.append(dt.strftime("%H:%M"))
-        except ValueError:
-            print("⚠️ Unexpected time format (expected HH:MM):", t)
-            continue
+def return_schedule_json(lot_name, top_n=5, lot_id=None):
+    """Next `top_n` departure times (from now) with how many cars leave at each."""
+    # 1. Get lot_id for the given lot name (skipped when the caller already has it)
+    if lot_id is None:
+        lot = REPOSITORY.get_lot(lot_name)
 
-    if not normalized_times:
-        return []
+        if not lot:
+            log.warning("❌ Lot '%s' not found", lot_name)
+            return []
 
-    # 3. Count occurrences of each time
-    counter = Counter(normalized_times)
+        lot_id = lot['id']
 
-    # 4. Sort by time
-    sorted_times = sorted(counter.items(), key=lambda x: x[0])
+    # 2. Binary-search the lot's departure index from the current minute
+    result = DEPARTURES.next_departures(lot_id, top_n)
 
-    # 5. Create response array
-    result = [{"time": t, "count": cnt} for t, cnt in sorted_times[:top_n]]
-    
-    print("Returning formatted schedule:", result)
+    log.debug("Returning formatted schedule: %s", result)
     return result
 
+
+def load_lot_state(lot_name):
+    """Load a lot's row from the datastore. Loader for LOT_CACHE."""
+    row = REPOSITORY.get_lot(lot_name)
+
+    if row is None:
+        return None
+
+    state = lot_state(row)
+    observe_lot_state(lot_name, state)
+    return state
+
+
+# Per-lot state shared by every request; CV, leaving-soon and schedule writes keep it current
+LOT_CACHE = LotCache(load_lot_state, ttl=float(os.getenv("LOT_CACHE_TTL", "10")))
+
+# Per-lot version counters behind the ETags of /api/lot/<name>
+LOT_VERSIONS = conditional.VersionTracker()
+
+
+def observe_lot_state(lot_name, state):
+    """Bump the lot's version when a DB read shows a change made outside this process."""
+    LOT_VERSIONS.observe(lot_name, (state["occupancy"], state["max_occupancy"], state["leaving_soon"]))
+
+
+def lot_validators(lot_name):
+    """
+    (etag, last_modified) for a lot's payload. Upcoming departures roll
+    over every minute, so the current minute is part of the validator.
+    """
+    version, modified_at = LOT_VERSIONS.get(lot_name)
+    minute_start = time.time() // 60 * 60
+    etag = f"{LOT_VERSIONS.epoch}-{version}-{int(minute_start // 60)}"
+    return etag, max(modified_at, minute_start)
+
+
+def publish_lot_update(lot_name, **fields):
+    """
+    Record a change to one lot: bump its version and push the delta to SSE
+    subscribers (adds available_spots when known).
+    """
+    LOT_VERSIONS.bump(lot_name)
+    state = LOT_CACHE.peek(lot_name)
+    if state is not None and ("occupancy" in fields or "max_occupancy" in fields):
+        state.update(fields)
+        fields["available_spots"] = state["max_occupancy"] - state["occupancy"]
+    EVENTS.publish(lot_topic(lot_name), {"lot": lot_name, **fields})
+
+
+def event_stream(topics):
+    """SSE response for `topics`, resuming after the Last-Event-ID header when present."""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    return Response(EVENTS.subscribe(topics, last_event_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # don't let a reverse proxy buffer the stream
+    })
+
+
+@api.route('/lot/<lot_name>/events', methods=['GET'])
+def lot_events(lot_name):
+    """Stream occupancy / leaving-soon / departure changes for one lot."""
+    return event_stream({lot_topic(lot_name)})
+
+
+@api.route('/lots/events', methods=['GET'])
+def all_lot_events():
+    """Stream changes for every lot."""
+    return event_stream(ALL_TOPICS)
+
+
+def stream_unavailable(lot_name):
+    """Error response when this process can't stream `lot_name`, else None."""
+    if CV_MODE == "off" or not CV_LEADER.is_leader:
+        # Frames only reach the process that holds the CV lease
+        return {"error": "Live stream is not available from this server"}, 503
+    if LOT_CACHE.get(lot_name) is None:
+        return {"error": f"Lot '{lot_name}' not found"}, 404
+    return None
+
+
+@api.route('/lot/<lot_name>/stream', methods=['GET'])
+def lot_stream(lot_name):
+    """MJPEG stream of the lot's camera with the latest detections drawn on (use as an <img> src)."""
+    error = stream_unavailable(lot_name)
+    if error is not None:
+        body, status = error
+        return jsonify(body), status
+    return Response(STREAMS.subscribe(lot_name), mimetype=streams.CONTENT_TYPE, headers={
+        'Cache-Control': 'no-cache, no-store',
+        'X-Accel-Buffering': 'no',
+    })
+
+
 #for any route within lots(example: "/api/lot/furnas")
 @api.route('/lot/<lot_name>', methods = ['GET'])
 def fetch_occupancy(lot_name):
-    print("\n=== FETCH OCCUPANCY CALLED ===")
-    print(f"Request URL: {request.url}")
-    print(f"Request Method: {request.method}")
-    print(f"Lot ID from URL: {lot_name}")
+    log.debug("=== FETCH OCCUPANCY CALLED ===")
+    log.debug("Request URL: %s", request.url)
+    log.debug("Request Method: %s", request.method)
+    log.debug("Lot ID from URL: %s", lot_name)
     
     # Use lot_name from query params OR from URL path
     lot_name = request.args.get('lot_name') or lot_name
-    print(f"Lot Name Parameter: {lot_name}")
+    log.debug("Lot Name Parameter: %s", lot_name)
 
     if not lot_name:
-        print("❌ ERROR: Missing 'name' query parameter")
+        log.warning("❌ ERROR: Missing 'name' query parameter")
         return jsonify({"error": "Missing 'name' query parameter"}), 400
 
-    print(f"🔍 Querying Supabase for lot: {lot_name}")
-    response = supabase.table("lots") \
-        .select("occupancy, max_occupancy, leaving_soon") \
-        .eq("name", lot_name) \
-        .single() \
-        .execute()
+    log.debug("🔍 Looking up lot: %s", lot_name)
+    state = LOT_CACHE.get(lot_name)
 
-    if not response.data:
-        print(f"❌ ERROR: Lot '{lot_name}' not found in database")
+    if state is None:
+        log.warning("❌ ERROR: Lot '%s' not found in database", lot_name)
         return jsonify({"error": f"Lot '{lot_name}' not found"}), 404
+    CV_DEMAND.hit(lot_name)
+
+    etag, last_modified = lot_validators(lot_name)
+    if conditional.is_not_modified(request.headers, etag, last_modified):
+        log.debug("✅ Not modified: %s", lot_name)
+        return Response(status=304, headers=conditional.not_modified('fetch_occupancy', etag, last_modified))
 
-    occupancy = response.data["occupancy"]
-    max_occ = response.data["max_occupancy"]
+    occupancy = state["occupancy"]
+    max_occ = state["max_occupancy"]
     available = max_occ - occupancy
-    leaving_soon_count = response.data.get("leaving_soon", 0)
+    leaving_soon_total = leaving_soon_count(lot_name, state)
 
-    print(f"✅ SUCCESS: Occupancy={occupancy}, Max={max_occ}, Available={available}, Leaving Soon={leaving_soon_count}")
-    schedule = return_schedule_json(lot_name)
+    log.debug("✅ SUCCESS: Occupancy=%s, Max=%s, Available=%s, Leaving Soon=%s",
+              occupancy, max_occ, available, leaving_soon_total)
+    schedule = return_schedule_json(lot_name, lot_id=state["id"])
     result = {
         "lot": lot_name,
         "occupancy": occupancy,
         "max_occupancy": max_occ,
         "available_spots": available,
         "total_spots": max_occ,
-        "leaving_soon": leaving_soon_count,
+        "leaving_soon": leaving_soon_total,
         "departures": schedule if schedule else []
     }
-    print(f"Returning: {result}")
-    print("=== END FETCH OCCUPANCY ===\n")
+    log.debug("Returning: %s", result)
+    log.debug("=== END FETCH OCCUPANCY ===")
     
-    return jsonify(result), 200  
+    return conditional.tag(jsonify(result), etag, last_modified), 200  
+
+LOT_FIELDS = ("occupancy", "max_occupancy", "available_spots", "total_spots", "leaving_soon", "departures")
+
+
+@api.route('/lots', methods=['GET'])
+def fetch_all_lots():
+    """
+    Occupancy (and optionally departures) for every lot in a constant number
+    of queries: one for all lots, at most one for all their schedules.
+    ?fields=occupancy,available_spots limits the output; departures are
+    only fetched when requested.
+    """
+    requested = request.args.get('fields')
+    fields = [f.strip() for f in requested.split(',') if f.strip()] if requested else list(LOT_FIELDS)
+    unknown = [f for f in fields if f not in LOT_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}", "fields": LOT_FIELDS}), 400
+
+    stale = departures_stale = False
+    try:
+        rows = REPOSITORY.list_lots()
+    except Exception as e:
+        rows, stale = last_known_lots(e), True
+
+    if 'departures' in fields and not stale:
+        # One batched schedules query for the lots whose departure index isn't already warm
+        missing = DEPARTURES.needs_load([row['id'] for row in rows])
+        if missing:
+            try:
+                generations = DEPARTURES.generations()
+                DEPARTURES.prime(REPOSITORY.schedule_times_by_lot(missing), generations)
+            except Exception as e:
+                # Lot rows are fresh but schedules aren't reachable: serve whatever the index holds
+                log.warning("⚠️  Could not load departures, serving the cached index: %s", e)
+                departures_stale = True
+
+    if not stale:
+        prime_lots(rows)
+
+    lots = []
+    for row in rows:
+        state = lot_state(row)
+        full = {
+            "occupancy": state["occupancy"],
+            "max_occupancy": state["max_occupancy"],
+            "available_spots": state["max_occupancy"] - state["occupancy"],
+            "total_spots": state["max_occupancy"],
+            "leaving_soon": leaving_soon_count(row["name"], state),
+        }
+        if 'departures' in fields:
+            full["departures"] = (cached_departures(row["id"]) if stale or departures_stale
+                                  else DEPARTURES.next_departures(row["id"]))
+        lots.append({"lot": row["name"], **{f: full[f] for f in fields}})
+
+    log.debug("Returning %d lots with fields %s", len(lots), fields)
+    return jsonify({"lots": lots, "stale": True} if stale else {"lots": lots}), 200
+
+
+def prime_lots(rows):
+    """Cache every row of a fresh lots listing (and notice lots created since the locations were loaded)."""
+    for row in rows:
+        state = lot_state(row)
+        observe_lot_state(row["name"], state)
+        LOT_CACHE.prime(row["name"], state)
+    LOT_LOCATIONS.notice(row["name"] for row in rows)
+
+
+def last_known_lots(error):
+    """Rows for every cached lot, to answer /api/lots from while the datastore is failing."""
+    cached = LOT_CACHE.last_known_all()
+    if not cached:
+        raise error
+    log.warning("⚠️  Serving %d last-known lots: %s", len(cached), error)
+    return [{"name": name, **state} for name, state in cached.items()]
+
+
+def cached_departures(lot_id):
+    """Departures from the in-memory index only, however old (empty if it was never loaded)."""
+    return DEPARTURES.cached_departures(lot_id)
+
+
+MAX_NEARBY_RADIUS = 50000  # meters
+MAX_NEARBY_LIMIT = 100
+
+
+def parse_nearby_args(args):
+    """((lat, lng, radius, limit), None) from ?lat=&lng=&radius=&limit=, or (None, error message)."""
+    try:
+        lat = float(args['lat'])
+        lng = float(args['lng'])
+    except (KeyError, TypeError, ValueError):
+        return None, "Query parameters 'lat' and 'lng' must be numbers"
+    try:
+        radius = float(args.get('radius', 1000))
+        limit = int(args.get('limit', 10))
+    except ValueError:
+        return None, "Query parameters 'radius' and 'limit' must be numbers"
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None, "'lat' must be within [-90, 90] and 'lng' within [-180, 180]"
+    if not 0 < radius <= MAX_NEARBY_RADIUS:
+        return None, f"'radius' must be between 0 and {MAX_NEARBY_RADIUS} meters"
+    if not 0 < limit <= MAX_NEARBY_LIMIT:
+        return None, f"'limit' must be between 1 and {MAX_NEARBY_LIMIT}"
+    return (lat, lng, radius, limit), None
+
+
+def nearby_lots(lat, lng, radius, limit):
+    """Up to `limit` lots within `radius` meters: lots with free spots first, each group nearest first."""
+    candidates = LOT_LOCATIONS.nearby(lat, lng, radius)
+    states = {name: LOT_CACHE.peek(name) for _, name in candidates}
+    if any(state is None for state in states.values()):
+        # One lots query for everything the cache is missing, not a LOT_CACHE.get per lot
+        try:
+            rows = REPOSITORY.list_lots()
+        except Exception as e:
+            log.warning("⚠️  Could not load lots, serving last-known state: %s", e)
+            states = {name: state or LOT_CACHE.last_known(name) for name, state in states.items()}
+        else:
+            prime_lots(rows)
+            for row in rows:
+                if row["name"] in states:
+                    states[row["name"]] = lot_state(row)
+
+    open_lots, full_lots = [], []
+    # Nearest first, so the scan can stop once `limit` lots with space are found
+    for distance, name in candidates:
+        state = states.get(name)
+        if state is None:
+            continue
+        available = state["max_occupancy"] - state["occupancy"]
+        (open_lots if available > 0 else full_lots).append({
+            "lot": name,
+            "distance_m": round(distance, 1),
+            "available_spots": available,
+            "total_spots": state["max_occupancy"],
+            "leaving_soon": leaving_soon_count(name, state),
+        })
+        if len(open_lots) >= limit:
+            break
+    return (open_lots + full_lots)[:limit]
+
+
+@api.route('/lots/nearby', methods=['GET'])
+def lots_nearby():
+    """Nearest lots to ?lat=&lng= within ?radius= meters (default 1000), ranked by availability and distance."""
+    params, error = parse_nearby_args(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    lots = nearby_lots(*params)
+    log.debug("Returning %d lots near %s", len(lots), params[:2])
+    return jsonify({"lots": lots}), 200
+
 
 # @api.route('/lot/departures', methods=['GET'])
 # def get_departures():
@@ -341,44 +620,69 @@ def fetch_occupancy(lot_name):
     
 #     return jsonify({"departures": mock_departures}), 200
 
-def revert_increment(lot_name):
-    time.sleep(300)
-    lot_data = supabase.table('lots').select('*').eq('name', lot_name).execute()
-    leaving_soon = lot_data.data[0].get('leaving_soon') 
-    supabase.table('lots').update({'leaving_soon': leaving_soon - 1}).eq('name', lot_name).execute()
-    
+def flush_leaving_soon(lot_name, delta):
+    """Apply a lot's net leaving-soon delta to the database; returns the new value."""
+    with tracing.span("leaving_soon.flush", lot=lot_name, delta=delta):
+        new_value = REPOSITORY.add_leaving_soon(lot_name, delta)
+    LOT_CACHE.update(lot_name, leaving_soon=new_value)
+    return new_value
+
+
+# Taps and reverts land here; net deltas reach the DB once per lot per interval
+LEAVING_SOON = DeltaAggregator('leaving_soon', flush_leaving_soon,
+                               interval=float(os.getenv("LEAVING_SOON_FLUSH_INTERVAL", "1.0")))
+
+
+def leaving_soon_count(lot_name, state):
+    """Committed leaving-soon count plus taps/reverts not yet flushed."""
+    return max(state["leaving_soon"] + LEAVING_SOON.unflushed(lot_name), 0)
+
+
+def revert_leaving_soon(timers):
+    """Expiry handler: one decrement per lot for all of its taps that are now 5 minutes old."""
+    for lot_name, count in Counter(t.payload for t in timers).items():
+        LEAVING_SOON.add(lot_name, -count)
+        state = LOT_CACHE.peek(lot_name)
+        if state is not None:
+            publish_lot_update(lot_name, leaving_soon=leaving_soon_count(lot_name, state))
+
+
+EXPIRY.register('leaving_soon_revert', revert_leaving_soon, persist=True)
+
+
 @api.route('/leaving-soon', methods=['POST'])
 def leaving_soon():
-    print("\n=== LEAVING SOON CALLED ===")
-    print(f"Request URL: {request.url}")
-    print(f"Request Method: {request.method}")
+    log.debug("=== LEAVING SOON CALLED ===")
+    log.debug("Request URL: %s", request.url)
+    log.debug("Request Method: %s", request.method)
     
     data = request.get_json()
-    print(f"Request Body: {data}")
+    log.debug("Request Body: %s", data)
     
-    # Temporarily disabled for testing - uncomment to re-enable range check
-    # if check_in_range(request) == False:
-    #     return jsonify({"message": "User not in range."}), 404
-
     lot_name = data.get('lot_name')
+    if not check_in_range(data, lot_name):
+        return jsonify({"message": "User not in range."}), 404
     # supabase.table('lots').update({'name': lot_name}).eq('').execute()
     # supabase.table('lots').update({'name': lot_name}).eq('', lot_name).execute()
 
-    print(f"Lot Name: {lot_name}")
+    log.debug("Lot Name: %s", lot_name)
     
-    print(f"🔍 Updating Supabase for lot: {lot_name}")
-    lot_data = supabase.table('lots').select('*').eq('name', lot_name).execute()
-    leaving_soon_count = lot_data.data[0].get('leaving_soon', 0)
-    occupancy = lot_data.data[0].get('occupancy', 0)
-    max_occ = lot_data.data[0].get('max_occupancy', 0)
+    log.debug("🔍 Updating leaving-soon count for lot: %s", lot_name)
+    state = LOT_CACHE.get(lot_name) if lot_name else None
+    if state is None:
+        log.warning("❌ ERROR: Lot '%s' not found in database", lot_name)
+        return jsonify({"error": f"Lot '{lot_name}' not found"}), 404
+    occupancy = state['occupancy']
+    max_occ = state['max_occupancy']
     
-    # Increment leaving_soon count
-    new_leaving_soon = leaving_soon_count + 1
-    supabase.table('lots').update({'leaving_soon': new_leaving_soon}).eq('name', lot_name).execute()
+    # Increment leaving_soon count (written behind by the LEAVING_SOON flusher)
+    LEAVING_SOON.add(lot_name, 1)
+    new_leaving_soon = leaving_soon_count(lot_name, state)
+    publish_lot_update(lot_name, leaving_soon=new_leaving_soon)
     
-    threading.Thread(target=revert_increment, args=(lot_name,)).start()
-    print("✅ SUCCESS: Lot status updated")
-    print("=== END LEAVING SOON ===\n")
+    EXPIRY.schedule_in(LEAVING_SOON_TTL, 'leaving_soon_revert', payload=lot_name)
+    log.debug("✅ SUCCESS: Lot status updated")
+    log.debug("=== END LEAVING SOON ===")
     
     # Return updated lot data
     available = max_occ - occupancy
@@ -395,91 +699,349 @@ def leaving_soon():
 
 @api.route('/submit-schedule', methods=['POST'])
 def submit_schedule():
-    print("\n=== SUBMIT SCHEDULE CALLED ===")
-    print(f"Request URL: {request.url}")
-    print(f"Request Method: {request.method}")
+    log.debug("=== SUBMIT SCHEDULE CALLED ===")
+    log.debug("Request URL: %s", request.url)
+    log.debug("Request Method: %s", request.method)
     
     data = request.get_json()
-    print(f"Request Body: {data}")
+    log.debug("Request Body: %s", data)
     
     lot_name = data.get('lot_name')
-    print(f"Lot Name: {lot_name}")
-    
-    # if check_in_range(request) == False:
-    #     return jsonify({"message": "User not in range."}), 404
+    log.debug("Lot Name: %s", lot_name)
 
+    log.debug("🔍 Processing schedule for lot: %s", lot_name)
+    errors = record_departures([(lot_name, data.get('departure_time'))], data)
+    if errors:
+        log.warning("❌ ERROR: %s", errors[0]['error'])
+        return jsonify({"error": errors[0]['error']}), errors[0]['status']
 
-    # TODO: Add your schedule submission logic here
-    print(f"🔍 Processing schedule for lot: {lot_name}")
-    global global_id
-    id = global_id
-    global_id+=1
-    
-    lot_data = supabase.table('lots').select('*').eq('name', lot_name).execute()
-    lot_id = lot_data.data[0].get('id')
-    time = data.get('departure_time')
-    supabase.table('schedules').insert({
-        'id': id, 
-        'lot_id': lot_id,
-        'time': time
-        }).execute()
-
-
-    print("✅ SUCCESS: Schedule submitted")
-    print("=== END SUBMIT SCHEDULE ===\n")
+    log.debug("✅ SUCCESS: Schedule submitted")
+    log.debug("=== END SUBMIT SCHEDULE ===")
     
     return jsonify({"message": "Schedule submitted successfully."}), 200
 
+
+MAX_BATCH_SCHEDULES = 1000
+
+
+@api.route('/submit-schedules', methods=['POST'])
+def submit_schedules():
+    """
+    Submit many departures at once:
+    {"schedules": [{"lot_name": "Furnas", "departure_time": "14:30:00"}, ...]}
+    All entries are validated first; nothing is written if any is invalid.
+    """
+    data = request.get_json(silent=True) or {}
+    entries = data.get('schedules')
+    log.debug("=== SUBMIT SCHEDULES CALLED (%s entries) ===", len(entries) if isinstance(entries, list) else 0)
+
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"error": "Body must contain a non-empty 'schedules' list"}), 400
+    if len(entries) > MAX_BATCH_SCHEDULES:
+        return jsonify({"error": f"At most {MAX_BATCH_SCHEDULES} schedules per request"}), 400
+
+    departures = [(e.get('lot_name'), e.get('departure_time')) if isinstance(e, dict) else (None, None)
+                  for e in entries]
+    errors = record_departures(departures, data)
+    if errors:
+        return jsonify({"error": "Invalid schedules", "details": errors}), 400
+
+    return jsonify({"message": "Schedules submitted successfully.", "count": len(departures)}), 200
+
+
+# Collision-free ids (unique across restarts and workers) and group-committed inserts
+SCHEDULE_IDS = IdGenerator(claim=lambda: leases.claim_slot('worker-id', LEASE_BACKEND, MAX_WORKER_ID + 1))
+SCHEDULE_INSERT_DELAY = float(os.getenv("SCHEDULE_INSERT_DELAY", "0.02"))
+# A submission may queue behind an in-flight batch, then wait for its own batch and its retry alone
+SCHEDULE_INSERTS = BufferedInserter('schedules', REPOSITORY.insert_schedules, max_delay=SCHEDULE_INSERT_DELAY,
+                                    timeout=3 * REPOSITORY.deadline + SCHEDULE_INSERT_DELAY)
+
+
+def record_departures(departures, user):
+    """
+    Validate and store [(lot_name, departure_time), ...] submitted by `user`
+    (the request body, for the range check). Lot ids come from the lot cache
+    and rows go through the shared insert buffer, so concurrent submissions
+    share one round trip. Returns a list of per-entry errors (nothing is
+    written when it's non-empty).
+    """
+    errors = []
+    rows = []
+    lot_ids = {}
+    for index, (lot_name, departure_time) in enumerate(departures):
+        state = LOT_CACHE.get(lot_name) if lot_name else None
+        if state is None:
+            errors.append({"index": index, "status": 404, "error": f"Lot '{lot_name}' not found"})
+            continue
+        if not check_in_range(user, lot_name):
+            errors.append({"index": index, "status": 404, "error": "User not in range."})
+            continue
+        if to_minute(departure_time) is None:
+            errors.append({"index": index, "status": 400,
+                           "error": f"Invalid departure_time '{departure_time}' (expected HH:MM:SS)"})
+            continue
+        lot_ids[lot_name] = state['id']
+        rows.append({'id': SCHEDULE_IDS.next_id(), 'lot_id': state['id'], 'time': departure_time})
+
+    if errors:
+        return errors
+
+    SCHEDULE_INSERTS.insert(rows)
+
+    for row in rows:
+        DEPARTURES.add(row['lot_id'], row['time'])
+        arm_schedule_expiry(row['time'])
+    for lot_name, lot_id in lot_ids.items():
+        publish_lot_update(lot_name, departures=DEPARTURES.next_departures(lot_id))
+    return []
+
 @api.route('/lot/live-cv-data', methods=['GET'])
 def get_live_cv_data():
     """Get live parking data from computer vision analysis."""
-    print("\n=== GET LIVE CV DATA CALLED ===")
+    log.debug("=== GET LIVE CV DATA CALLED ===")
     
     try:
         # Read the live data JSON file created by video_parking_detector.py
         json_path = os.path.join('computer_vision', 'live_parking_data.json')
         
         if not os.path.exists(json_path):
-            print("⚠️  Live data file not found - CV script may not be running")
+            log.warning("⚠️  Live data file not found - CV script may not be running")
             return jsonify({
                 "error": "Live data not available",
                 "message": "Computer vision script is not running or hasn't analyzed any frames yet"
             }), 404
+
+        # The detector rewrites the file on every analysis, so its stat is the version
+        stat = os.stat(json_path)
+        etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        if conditional.is_not_modified(request.headers, etag, stat.st_mtime):
+            return Response(status=304, headers=conditional.not_modified('get_live_cv_data', etag, stat.st_mtime))
         
         with open(json_path, 'r') as f:
             data = json.load(f)
         
-        print(f"✅ SUCCESS: Returning live CV data")
-        print(f"   Free: {data.get('free', 0)}, Occupied: {data.get('occupied', 0)}, Total: {data.get('total', 0)}")
-        print("=== END GET LIVE CV DATA ===\n")
+        log.debug("✅ SUCCESS: Returning live CV data")
+        log.debug("   Free: %s, Occupied: %s, Total: %s",
+                  data.get('free', 0), data.get('occupied', 0), data.get('total', 0))
+        log.debug("=== END GET LIVE CV DATA ===")
         
-        return jsonify(data), 200
+        return conditional.tag(jsonify(data), etag, stat.st_mtime), 200
         
     except Exception as e:
-        print(f"❌ ERROR: {str(e)}")
-        print("=== END GET LIVE CV DATA ===\n")
+        log.error("❌ ERROR: %s", e)
+        log.debug("=== END GET LIVE CV DATA ===")
         return jsonify({"error": str(e)}), 500
 
 
-def cleanup_expired_schedules():
-    while True:
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose in-process metrics in Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+def require_admin(view):
+    """Reject requests that don't carry `Authorization: Bearer <ADMIN_API_TOKEN>`."""
+    @functools.wraps(view)
+    def wrapped(*args, **kwargs):
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not ADMIN_API_TOKEN or not hmac.compare_digest(supplied, ADMIN_API_TOKEN):
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapped
+
+
+@api.route('/admin/profile', methods=['GET', 'POST'])
+@require_admin
+def profile_threads():
+    """
+    Sample every thread's stack for ?seconds=N (default 10) and return
+    collapsed stacks (?format=collapsed) or JSON with a self-time summary.
+    ?process=cv profiles the CV service's threads instead of this process's.
+    """
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval_ms', 5)) / 1000.0
+    except ValueError:
+        return jsonify({"error": "seconds and interval_ms must be numbers"}), 400
+    process = request.args.get('process', 'api')
+    if process not in ('api', 'cv'):
+        return jsonify({"error": "process must be 'api' or 'cv'"}), 400
+
+    log.info("🔬 Profiling all %s threads for %ss", process, seconds)
+    include_idle = request.args.get('include_idle') == '1'
+    try:
+        if process == 'cv':
+            result = profile_cv_service(seconds, interval, include_idle)
+        else:
+            result = profiler.sample(seconds, interval=interval, include_idle=include_idle)
+    except profiler.ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+
+    if request.args.get('format') == 'collapsed':
+        return Response(result['collapsed'], mimetype='text/plain')
+    return jsonify(result), 200
+
+
+@api.before_request
+def start_request_timer():
+    request.environ['parkabull.start_time'] = time.perf_counter()
+    app_logging.begin_request((request.endpoint or 'unknown').rsplit('.', 1)[-1])
+    request.environ['parkabull.span'] = tracing.start_span(
+        f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+        kind=tracing.SPAN_KIND_SERVER,
+        **{"http.method": request.method, "http.target": request.full_path},
+    )
+
+
+@api.after_request
+def record_request_latency(response):
+    started = request.environ.get('parkabull.start_time')
+    if started is not None:
+        route = (request.endpoint or 'unknown').rsplit('.', 1)[-1]
+        metrics.HTTP_REQUEST_LATENCY.observe(
+            time.perf_counter() - started,
+            route=route, method=request.method, status=response.status_code,
+        )
+    span, _ = request.environ.get('parkabull.span', (tracing.NOOP_SPAN, None))
+    span.set_attribute("http.status_code", response.status_code)
+    return response
+
+
+@api.errorhandler(resilience.CircuitOpenError)
+def dependency_unavailable(e):
+    """A dependency's circuit is open and there was no last-known-good data to serve."""
+    log.warning("⚡ %s", e)
+    return jsonify({"error": "Service temporarily unavailable", "detail": str(e)}), 503, {"Retry-After": "30"}
+
+
+@api.teardown_request
+def finish_request_span(exc):
+    span, token = request.environ.pop('parkabull.span', (tracing.NOOP_SPAN, None))
+    if exc is not None:
+        span.record_error(exc)
+    tracing.finish_span(span, token)
+    app_logging.end_request()
+
+
+def expire_schedules(timers):
+    """Expiry handler: delete every schedule whose time has passed, in one query."""
+    if not SCHEDULE_LEADER.is_leader:
+        return  # timers armed before a failover; the new leader owns cleanup
+    now = datetime.now().strftime("%H:%M:%S")
+    with tracing.span("schedules.cleanup", due=len(timers)):
+        REPOSITORY.delete_schedules_before(now)
+    DEPARTURES.expire()
+
+
+EXPIRY.register('schedule_expiry', expire_schedules)
+
+
+def arm_schedule_expiry(departure_time):
+    """
+    Make sure a cleanup fires just after `departure_time` ("HH:MM[:SS]")
+    today. Only the elected schedule-expiry leader owns cleanup timers.
+    """
+    if not SCHEDULE_LEADER.is_leader:
+        return
+    for fmt in ("%H:%M:%S", "%H:%M"):
         try:
-            # delete any schedules where the time has passed
-            now = datetime.now().strftime("%H:%M:%S")
-            supabase.table('schedules').delete().lt('time', now).execute()
-        except Exception as e:
-            print("❌ Cleanup error:", e)
+            departs = datetime.strptime(str(departure_time), fmt).time()
+            break
+        except ValueError:
+            continue
+    else:
+        log.warning("⚠️ Unexpected time format (expected HH:MM:SS): %s", departure_time)
+        return
+    due = datetime.combine(datetime.now().date(), departs) + timedelta(seconds=1)
+    # One timer per distinct departure time, however many schedules share it
+    EXPIRY.schedule(due.timestamp(), 'schedule_expiry', key=departs.strftime("%H:%M:%S"))
+
+
+def rebuild_schedule_timers():
+    """Re-arm schedule expiry timers from the schedules table after a restart."""
+    times = REPOSITORY.distinct_schedule_times()
+    for t in times:
+        arm_schedule_expiry(t)
+    log.info("⏰ Armed expiry timers for %d departure times", len(times))
+
+
+# A scheduler without the api role doesn't see submissions at all, so it re-reads the table;
+# one with the api role arms timers from its own writes (record_departures) and doesn't poll
+# (scaled-out API workers should leave the scheduler role to a separate process, see roles.py)
+SCHEDULE_REBUILD_INTERVAL = float(os.getenv("SCHEDULE_REBUILD_INTERVAL", "60"))
+
+
+def refresh_schedule_timers(timers):
+    if not SCHEDULE_LEADER.is_leader:
+        return  # stops the rebuild cycle after losing leadership
+    try:
+        rebuild_schedule_timers()
+    finally:
+        EXPIRY.schedule_in(SCHEDULE_REBUILD_INTERVAL, 'schedule_rebuild', key='rebuild')
+
+
+EXPIRY.register('schedule_rebuild', refresh_schedule_timers)
 
-        time.sleep(60)   # check once per minute
+
+def start_schedule_expiry():
+    """Elected: take over schedule cleanup from the table (and keep re-reading it without the api role)."""
+    rebuild_schedule_timers()
+    if not roles.has(roles.API):
+        EXPIRY.schedule_in(SCHEDULE_REBUILD_INTERVAL, 'schedule_rebuild', key='rebuild')
+
+
+SCHEDULE_LEADER = leases.LeaderElector('schedule-expiry', LEASE_BACKEND, on_elected=start_schedule_expiry)
+
+
+@api.route('/admin/startup', methods=['GET'])
+@require_admin
+def startup_report():
+    """This process's roles, startup phases, RSS and which heavy modules it has loaded."""
+    return jsonify(roles.report()), 200
 
 # Register the blueprint
 app.register_blueprint(api)
+roles.mark("imported")
+
+
+def start_background_workers():
+    """Start the background jobs for this process's roles (PARKABULL_ROLES; shared by app.run and asgi.py)."""
+    if roles.has(roles.API) or roles.has(roles.SCHEDULER):
+        EXPIRY.start()  # leaving-soon reverts (api) and schedule expiry (scheduler)
+
+    # Several workers may carry the scheduler/cv-worker roles; each job runs only in its leader
+    if roles.has(roles.SCHEDULER):
+        SCHEDULE_LEADER.start()
+        atexit.register(SCHEDULE_LEADER.stop)
+
+    if roles.has(roles.API):
+        LEAVING_SOON.start()
+        atexit.register(LEAVING_SOON.stop)  # flush outstanding deltas on shutdown
+
+    if roles.has(roles.CV_WORKER):
+        CV_LEADER.start()
+        atexit.register(CV_LEADER.stop)
+
+    roles.mark("workers started")
+    log.info("🚀 %s", roles.format_report(roles.report()))
+
 
 if __name__ == '__main__':
-    threading.Thread(target=cleanup_expired_schedules, daemon=True).start()
+    if not roles.has(roles.API):
+        # Background-only process (e.g. PARKABULL_ROLES=scheduler,cv-worker)
+        start_background_workers()
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
 
-    # Start the CV background worker
-    start_cv_worker()
+    # With the reloader, this module runs in a watcher process and a serving child;
+    # only the child (WERKZEUG_RUN_MAIN=true) starts workers, so there's one of each
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
     
     # Use port 5001 instead of 5000 (macOS AirPlay uses 5000)
     app.run(debug=True, port=5001)
@@ -0,0 +1,149 @@
+"""
+app_logging.py
+Structured, leveled logging for the API and background workers.
+
+Records are handed to a QueueHandler so request threads never block on
+stdout; a QueueListener thread formats and writes them (JSON lines by
+default). Below-WARNING records are sampled per request: each request
+draws once against its route's rate, so a sampled request logs all of its
+lines and an unsampled one logs none.
+
+Environment:
+    LOG_LEVEL          DEBUG / INFO / WARNING / ERROR (default INFO)
+    LOG_FORMAT         json or text (default json)
+    LOG_SAMPLE_RATE    default per-request sample rate, 0.0-1.0 (default 1.0)
+    LOG_SAMPLE_RATES   per-route overrides, e.g. "fetch_occupancy=0.01,leaving_soon=0.5"
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+import tracing
+
+LOGGER_NAME = "parkabull"
+
+_route = contextvars.ContextVar("parkabull_log_route", default=None)
+_sampled = contextvars.ContextVar("parkabull_log_sampled", default=True)
+
+_listener = None
+
+
+def _parse_rates(spec):
+    rates = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        route, rate = item.split("=", 1)
+        try:
+            rates[route.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+DEFAULT_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+ROUTE_SAMPLE_RATES = _parse_rates(os.getenv("LOG_SAMPLE_RATES"))
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def get_logger(name=None):
+    """Return the app logger, or a child of it (e.g. get_logger("cv"))."""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+def begin_request(route):
+    """Tag subsequent records with `route` and draw this request's sampling decision."""
+    rate = ROUTE_SAMPLE_RATES.get(route, DEFAULT_SAMPLE_RATE)
+    _route.set(route)
+    _sampled.set(rate >= 1.0 or random.random() < rate)
+
+
+def end_request():
+    _route.set(None)
+    _sampled.set(True)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Runs in the calling thread: drops unsampled low-level records and
+    attaches route and trace ids before the record crosses the queue.
+    """
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING and not _sampled.get():
+            return False
+        record.route = _route.get()
+        span = tracing.current_span()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any `extra=` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+                  + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure(level=None, fmt=None):
+    """Install the queue handler on the app logger and start the writer thread."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    logger = get_logger()
+    logger.setLevel(level)
+    logger.handlers[:] = [queue_handler]
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+    return _listener
+
+
+def shutdown():
+    """Flush queued records; call before the process exits."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,482 @@
+"""
+asgi.py
+Async serving mode: the same /api routes as app.py, served by an ASGI
+server instead of Flask's threaded dev server.
+
+    uvicorn asgi:app --port 5001
+
+Reads run on the event loop against one async Supabase client created at
+startup, so every request shares its keep-alive connection pool, and
+independent queries (a lot's row and its schedules) are issued together
+with asyncio.gather. Lot state, departures, leaving-soon deltas, timers
+and SSE all use the same in-process objects as app.py, so both modes
+behave identically. Writes that go through app.py's blocking helpers
+(schedule submission) run in the thread pool. With DATASTORE=sqlite cache
+hits are answered on the loop and anything that reaches the embedded
+store runs in the thread pool too, so a slow disk never stalls the loop.
+"""
+
+import asyncio
+import contextlib
+import hmac
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+from supabase import acreate_client, AsyncClientOptions
+
+import app as wsgi
+import app_logging
+import conditional
+import metrics
+import profiler
+import resilience
+import roles
+import streams
+import tracing
+from departures import to_minute
+from events import ALL_TOPICS, lot_topic
+from repository import IDEMPOTENT_OPERATIONS, PAGE_SIZE, SQLiteRepository, group_times, lot_state
+
+log = app_logging.get_logger("asgi")
+
+# Created in lifespan(); one client means one shared httpx keep-alive pool
+supabase = None
+LOCAL_STORE = isinstance(wsgi.REPOSITORY, SQLiteRepository)
+# Same retries/deadline/breaker as the sync repository, so both paths see one circuit
+DB_POLICY = None if LOCAL_STORE else wsgi.REPOSITORY.policy
+
+
+async def arun_query(table, operation, query):
+    """Async run_query: await a Supabase query, recording its latency per table/operation."""
+    async def execute():
+        try:
+            with tracing.span(f"db.{table}.{operation}", kind=tracing.SPAN_KIND_CLIENT,
+                              **{"db.system": "supabase", "db.table": table, "db.operation": operation}), \
+                    metrics.DB_LATENCY.time(table=table, operation=operation):
+                return await query.execute()
+        except Exception:
+            metrics.DB_ERRORS.inc(table=table, operation=operation)
+            raise
+    return await DB_POLICY.acall(execute, retry=operation in IDEMPOTENT_OPERATIONS)
+
+
+async def aselect_all(table, query):
+    """Every row of query() (a fresh, ordered select per call), read PAGE_SIZE rows at a time."""
+    rows = []
+    while True:
+        page = (await arun_query(table, 'select', query().range(len(rows), len(rows) + PAGE_SIZE - 1))).data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+
+
+async def get_lot_state(lot_name, with_departures=False):
+    """
+    Lot state from LOT_CACHE, loading misses asynchronously. With
+    with_departures=True the lot's schedules are fetched in the same round
+    trip (joined on the lot name) when its departure index is cold.
+    """
+    if LOCAL_STORE:
+        state = wsgi.LOT_CACHE.peek(lot_name)
+        if state is None:
+            state = await run_in_threadpool(wsgi.LOT_CACHE.get, lot_name)
+        if state is not None and with_departures and wsgi.DEPARTURES.needs_load([state["id"]]):
+            await run_in_threadpool(wsgi.DEPARTURES.next_departures, state["id"])  # loads the index
+        return state
+
+    state = wsgi.LOT_CACHE.peek(lot_name)
+    if state is not None:
+        if with_departures and wsgi.DEPARTURES.needs_load([state["id"]]):
+            generations = wsgi.DEPARTURES.generations()
+            try:
+                schedules = await aselect_all('schedules', lambda: supabase.table('schedules') \
+                    .select('time') \
+                    .eq('lot_id', state["id"]) \
+                    .order('id'))
+            except Exception as e:
+                # The cached state is still good; departures stay cold (served empty) until the store is back
+                log.warning("⚠️  Could not load departures for %s: %s", lot_name, e)
+                return state
+            wsgi.DEPARTURES.prime({state["id"]: [s['time'] for s in schedules if s.get('time')]}, generations)
+        return state
+
+    generations = wsgi.DEPARTURES.generations()
+    lot_query = arun_query('lots', 'select', supabase.table('lots') \
+        .select('id, occupancy, max_occupancy, leaving_soon') \
+        .eq('name', lot_name) \
+        .limit(1))
+    try:
+        if not with_departures:
+            lot_response, schedules = await lot_query, None
+        else:
+            lot_response, schedules = await asyncio.gather(
+                lot_query,
+                aselect_all('schedules', lambda: supabase.table('schedules') \
+                    .select('time, lots!inner(name)') \
+                    .eq('lots.name', lot_name) \
+                    .order('id')),
+            )
+    except Exception:
+        # Datastore failing: serve the last-known-good state if this lot was ever cached
+        state = wsgi.LOT_CACHE.last_known(lot_name)
+        if state is None:
+            raise
+        return state
+
+    if not lot_response.data:
+        return None
+    state = lot_state(lot_response.data[0])
+    wsgi.observe_lot_state(lot_name, state)
+    wsgi.LOT_CACHE.prime(lot_name, state)
+    if schedules is not None:
+        wsgi.DEPARTURES.prime({state["id"]: [s['time'] for s in schedules if s.get('time')]}, generations)
+    return state
+
+
+# ============================================
+# ROUTES
+# ============================================
+
+async def fetch_occupancy(request):
+    lot_name = request.query_params.get('lot_name') or request.path_params['lot_name']
+    state = await get_lot_state(lot_name, with_departures=True)
+    if state is None:
+        return JSONResponse({"error": f"Lot '{lot_name}' not found"}, status_code=404)
+    wsgi.CV_DEMAND.hit(lot_name)
+
+    etag, last_modified = wsgi.lot_validators(lot_name)
+    if conditional.is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=conditional.not_modified('fetch_occupancy', etag, last_modified))
+
+    max_occ = state["max_occupancy"]
+    result = {
+        "lot": lot_name,
+        "occupancy": state["occupancy"],
+        "max_occupancy": max_occ,
+        "available_spots": max_occ - state["occupancy"],
+        "total_spots": max_occ,
+        "leaving_soon": wsgi.leaving_soon_count(lot_name, state),
+        # Loaded by get_lot_state; it's only cold after a datastore failure, and then must not
+        # fall back to the blocking loader on the event loop
+        "departures": wsgi.cached_departures(state["id"]),
+    }
+    return JSONResponse(result, headers=conditional.validator_headers(etag, last_modified))
+
+
+async def fetch_all_lots(request):
+    requested = request.query_params.get('fields')
+    fields = [f.strip() for f in requested.split(',') if f.strip()] if requested else list(wsgi.LOT_FIELDS)
+    unknown = [f for f in fields if f not in wsgi.LOT_FIELDS]
+    if unknown:
+        return JSONResponse({"error": f"Unknown fields: {', '.join(unknown)}", "fields": wsgi.LOT_FIELDS},
+                            status_code=400)
+
+    stale = False
+    try:
+        if LOCAL_STORE:
+            rows = await run_in_threadpool(wsgi.REPOSITORY.list_lots)
+        else:
+            rows = await aselect_all('lots', lambda: supabase.table('lots') \
+                .select('id, name, occupancy, max_occupancy, leaving_soon') \
+                .order('id'))
+    except Exception as e:
+        rows, stale = wsgi.last_known_lots(e), True
+
+    departures_stale = False
+    if 'departures' in fields and not stale:
+        missing = wsgi.DEPARTURES.needs_load([row['id'] for row in rows])
+        generations = wsgi.DEPARTURES.generations()
+        try:
+            if missing and LOCAL_STORE:
+                wsgi.DEPARTURES.prime(await run_in_threadpool(wsgi.REPOSITORY.schedule_times_by_lot, missing),
+                                      generations)
+            elif missing:
+                schedules = await aselect_all('schedules', lambda: supabase.table('schedules') \
+                    .select('lot_id, time') \
+                    .in_('lot_id', missing) \
+                    .order('id'))
+                wsgi.DEPARTURES.prime(group_times(missing, schedules), generations)
+        except Exception as e:
+            log.warning("⚠️  Could not load departures, serving the cached index: %s", e)
+            departures_stale = True
+
+    if not stale:
+        wsgi.prime_lots(rows)
+
+    lots = []
+    for row in rows:
+        state = lot_state(row)
+        full = {
+            "occupancy": state["occupancy"],
+            "max_occupancy": state["max_occupancy"],
+            "available_spots": state["max_occupancy"] - state["occupancy"],
+            "total_spots": state["max_occupancy"],
+            "leaving_soon": wsgi.leaving_soon_count(row["name"], state),
+        }
+        if 'departures' in fields:
+            full["departures"] = (wsgi.cached_departures(row["id"]) if stale or departures_stale
+                                  else wsgi.DEPARTURES.next_departures(row["id"]))
+        lots.append({"lot": row["name"], **{f: full[f] for f in fields}})
+
+    return JSONResponse({"lots": lots, "stale": True} if stale else {"lots": lots})
+
+
+async def json_body(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def lots_nearby(request):
+    params, error = wsgi.parse_nearby_args(request.query_params)
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+    # Cache misses and index rebuilds hit the datastore
+    return JSONResponse({"lots": await run_in_threadpool(wsgi.nearby_lots, *params)})
+
+
+async def leaving_soon(request):
+    data = await json_body(request) or {}
+    lot_name = data.get('lot_name')
+    if wsgi.LOT_RANGE_METERS > 0 and not await run_in_threadpool(wsgi.check_in_range, data, lot_name):
+        return JSONResponse({"message": "User not in range."}, status_code=404)
+    state = await get_lot_state(lot_name) if lot_name else None
+    if state is None:
+        return JSONResponse({"error": f"Lot '{lot_name}' not found"}, status_code=404)
+
+    wsgi.LEAVING_SOON.add(lot_name, 1)
+    new_leaving_soon = wsgi.leaving_soon_count(lot_name, state)
+    wsgi.publish_lot_update(lot_name, leaving_soon=new_leaving_soon)
+    wsgi.EXPIRY.schedule_in(wsgi.LEAVING_SOON_TTL, 'leaving_soon_revert', payload=lot_name)
+
+    return JSONResponse({
+        "message": "Lot status updated.",
+        "available_spots": state['max_occupancy'] - state['occupancy'],
+        "total_spots": state['max_occupancy'],
+        "leaving_soon": new_leaving_soon,
+    })
+
+
+async def submit_schedule(request):
+    data = await json_body(request)
+    if not data:
+        return JSONResponse({"error": "Missing request body"}, status_code=400)
+    lot_name = data.get('lot_name')
+    if not lot_name:
+        return JSONResponse({"error": "Missing 'lot_name' in request body"}, status_code=400)
+
+    # Warm the cache here so record_departures doesn't do a blocking load
+    await get_lot_state(lot_name)
+    errors = await run_in_threadpool(wsgi.record_departures, [(lot_name, data.get('departure_time'))], data)
+    if errors:
+        return JSONResponse({"error": errors[0]['error']}, status_code=errors[0]['status'])
+    return JSONResponse({"message": "Schedule submitted successfully."})
+
+
+async def submit_schedules(request):
+    data = await json_body(request) or {}
+    entries = data.get('schedules')
+    if not isinstance(entries, list) or not entries:
+        return JSONResponse({"error": "Body must contain a non-empty 'schedules' list"}, status_code=400)
+    if len(entries) > wsgi.MAX_BATCH_SCHEDULES:
+        return JSONResponse({"error": f"At most {wsgi.MAX_BATCH_SCHEDULES} schedules per request"},
+                            status_code=400)
+
+    departures = [(e.get('lot_name'), e.get('departure_time')) if isinstance(e, dict) else (None, None)
+                  for e in entries]
+    names = {name for name, t in departures if name and to_minute(t) is not None}
+    await asyncio.gather(*(get_lot_state(name) for name in names))
+    errors = await run_in_threadpool(wsgi.record_departures, departures, data)
+    if errors:
+        return JSONResponse({"error": "Invalid schedules", "details": errors}, status_code=400)
+    return JSONResponse({"message": "Schedules submitted successfully.", "count": len(departures)})
+
+
+async def get_live_cv_data(request):
+    json_path = os.path.join('computer_vision', 'live_parking_data.json')
+    try:
+        stat = os.stat(json_path)
+    except FileNotFoundError:
+        return JSONResponse({
+            "error": "Live data not available",
+            "message": "Computer vision script is not running or hasn't analyzed any frames yet"
+        }, status_code=404)
+
+    etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    if conditional.is_not_modified(request.headers, etag, stat.st_mtime):
+        return Response(status_code=304, headers=conditional.not_modified('get_live_cv_data', etag, stat.st_mtime))
+
+    with open(json_path, 'rb') as f:
+        body = f.read()
+    return Response(body, media_type='application/json',
+                    headers=conditional.validator_headers(etag, stat.st_mtime))
+
+
+def event_stream(request, topics):
+    last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    return StreamingResponse(wsgi.EVENTS.asubscribe(topics, last_event_id), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def lot_stream(request):
+    lot_name = request.path_params['lot_name']
+    error = await run_in_threadpool(wsgi.stream_unavailable, lot_name)
+    if error is not None:
+        body, status = error
+        return JSONResponse(body, status_code=status)
+    return StreamingResponse(wsgi.STREAMS.asubscribe(lot_name), media_type=streams.CONTENT_TYPE,
+                             headers={'Cache-Control': 'no-cache, no-store', 'X-Accel-Buffering': 'no'})
+
+
+async def lot_events(request):
+    return event_stream(request, {lot_topic(request.path_params['lot_name'])})
+
+
+async def all_lot_events(request):
+    return event_stream(request, ALL_TOPICS)
+
+
+async def get_metrics(request):
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def is_admin(request):
+    """Whether the request carries `Authorization: Bearer <ADMIN_API_TOKEN>` (app.require_admin)."""
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    return bool(wsgi.ADMIN_API_TOKEN) and hmac.compare_digest(supplied, wsgi.ADMIN_API_TOKEN)
+
+
+async def profile_threads(request):
+    if not is_admin(request):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    try:
+        seconds = float(request.query_params.get('seconds', 10))
+        interval = float(request.query_params.get('interval_ms', 5)) / 1000.0
+    except ValueError:
+        return JSONResponse({"error": "seconds and interval_ms must be numbers"}, status_code=400)
+    process = request.query_params.get('process', 'api')
+    if process not in ('api', 'cv'):
+        return JSONResponse({"error": "process must be 'api' or 'cv'"}, status_code=400)
+
+    sample = wsgi.profile_cv_service if process == 'cv' else profiler.sample
+    try:
+        result = await run_in_threadpool(sample, seconds, interval, request.query_params.get('include_idle') == '1')
+    except profiler.ProfilerBusy as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
+    except RuntimeError as e:
+        return JSONResponse({"error": str(e)}, status_code=503)
+
+    if request.query_params.get('format') == 'collapsed':
+        return Response(result['collapsed'], media_type='text/plain')
+    return JSONResponse(result)
+
+
+async def startup_report(request):
+    if not is_admin(request):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    return JSONResponse(roles.report())
+
+
+# ============================================
+# APP
+# ============================================
+
+class RequestMetricsMiddleware:
+    """Latency histogram, server span and log context per request (mirrors app.py's hooks)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        route = "unknown"
+        for candidate in routes:
+            if candidate.matches(scope)[0] == Match.FULL:
+                route = candidate.endpoint.__name__
+                break
+        app_logging.begin_request(route)
+        span, token = tracing.start_span(f"{scope['method']} {scope['path']}", kind=tracing.SPAN_KIND_SERVER,
+                                         **{"http.method": scope["method"], "http.target": scope["path"]})
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                metrics.HTTP_REQUEST_LATENCY.observe(time.perf_counter() - started, route=route,
+                                                     method=scope["method"], status=message["status"])
+                span.set_attribute("http.status_code", message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            span.record_error(e)
+            raise
+        finally:
+            tracing.finish_span(span, token)
+            app_logging.end_request()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global supabase
+    if not LOCAL_STORE:
+        supabase = await acreate_client(
+            os.getenv("NEXT_PUBLIC_SUPABASE_URL"),
+            os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY"),
+            options=AsyncClientOptions(postgrest_client_timeout=float(os.getenv("SUPABASE_TIMEOUT", "10"))),
+        )
+    await run_in_threadpool(wsgi.start_background_workers)
+    log.info("🚀 ASGI app ready")
+    yield
+    wsgi.EVENTS.close()
+    wsgi.STREAMS.close()
+    wsgi.LEAVING_SOON.stop()
+    wsgi.EXPIRY.stop()
+
+
+routes = [
+    Route('/api/lot/live-cv-data', get_live_cv_data, methods=['GET']),
+    Route('/api/lot/{lot_name}/events', lot_events, methods=['GET']),
+    Route('/api/lot/{lot_name}/stream', lot_stream, methods=['GET']),
+    Route('/api/lot/{lot_name}', fetch_occupancy, methods=['GET']),
+    Route('/api/lots/events', all_lot_events, methods=['GET']),
+    Route('/api/lots/nearby', lots_nearby, methods=['GET']),
+    Route('/api/lots', fetch_all_lots, methods=['GET']),
+    Route('/api/leaving-soon', leaving_soon, methods=['POST']),
+    Route('/api/submit-schedule', submit_schedule, methods=['POST']),
+    Route('/api/submit-schedules', submit_schedules, methods=['POST']),
+    Route('/api/metrics', get_metrics, methods=['GET']),
+    Route('/api/admin/profile', profile_threads, methods=['GET', 'POST']),
+    Route('/api/admin/startup', startup_report, methods=['GET']),
+]
+
+async def dependency_unavailable(request, exc):
+    return JSONResponse({"error": "Service temporarily unavailable", "detail": str(exc)},
+                        status_code=503, headers={"Retry-After": "30"})
+
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    exception_handlers={resilience.CircuitOpenError: dependency_unavailable},
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["http://localhost:3000"],
+                   allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+                   allow_headers=["Content-Type", "Authorization"], allow_credentials=True),
+        Middleware(RequestMetricsMiddleware),
+    ],
+)
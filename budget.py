@@ -0,0 +1,175 @@
+"""
+budget.py
+Global inference budget shared by every lot the CV service analyzes.
+
+A token bucket caps inference calls per second across all lots
+(CV_INFERENCE_RATE, CV_INFERENCE_BURST). When more lots are due than the
+budget allows, the token goes to the waiting lot with the highest
+priority:
+
+    priority = traffic_weight   * log1p(requests/min on /api/lot/<name>)
+             + staleness_weight * minutes since the lot was last analyzed
+             + fullness_weight  * occupied/total from its last analysis
+
+Staleness grows without bound, so a lot nobody is watching still gets
+analyzed eventually; it just yields to the ones people are polling.
+
+Request counts come from the API process (DemandCounter), which sends
+them to the CV service as "demand" messages over cv_ipc.
+"""
+
+import math
+import os
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        """rate: tokens per second; burst: bucket size (default max(1, rate))."""
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def tokens(self):
+        self._refill()
+        return self._tokens
+
+    def take(self):
+        """Spend one token if one is available."""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def refund(self):
+        self._tokens = min(self.burst, self._tokens + 1)
+
+
+class InferenceBudget:
+    # A lot counts as waiting only while its decoder keeps asking
+    WAIT_EXPIRY = 1.0
+
+    def __init__(self, calls_per_second=None, burst=None, traffic_weight=1.0, staleness_weight=1.0,
+                 fullness_weight=1.0, demand_halflife=60.0, clock=time.monotonic):
+        """
+        Args:
+            calls_per_second: global inference ceiling (None = unlimited, priorities unused)
+            burst: calls that may go out back to back after an idle spell
+            *_weight: how much each signal contributes to a lot's priority
+            demand_halflife: seconds for the request-rate average to halve without traffic
+        """
+        self._clock = clock
+        self._bucket = TokenBucket(calls_per_second, burst, clock) if calls_per_second else None
+        self.traffic_weight = traffic_weight
+        self.staleness_weight = staleness_weight
+        self.fullness_weight = fullness_weight
+        self.demand_halflife = demand_halflife
+        self._lock = threading.Lock()
+        self._lots = {}     # lot -> {"demand", "demand_at", "analyzed_at", "fill"}
+        self._waiting = {}  # lot -> last time its decoder asked for a token
+
+    @classmethod
+    def from_env(cls):
+        rate = float(os.getenv("CV_INFERENCE_RATE", "1.0"))
+        burst = os.getenv("CV_INFERENCE_BURST")
+        return cls(rate or None, float(burst) if burst else None)
+
+    @property
+    def rate(self):
+        return self._bucket.rate if self._bucket else None
+
+    def _lot(self, lot, now):
+        state = self._lots.get(lot)
+        if state is None:
+            state = self._lots[lot] = {"demand": 0.0, "demand_at": now, "analyzed_at": None, "fill": 0.0}
+        return state
+
+    def _decayed_demand(self, state, now):
+        return state["demand"] * 0.5 ** ((now - state["demand_at"]) / self.demand_halflife)
+
+    def record_demand(self, counts, interval):
+        """Fold in {lot: requests} observed over the last `interval` seconds (as requests/min)."""
+        now = self._clock()
+        with self._lock:
+            for lot, requests in counts.items():
+                state = self._lot(lot, now)
+                decayed = self._decayed_demand(state, now)
+                weight = 1 - 0.5 ** (interval / self.demand_halflife)
+                state["demand"] = decayed + weight * (requests * 60.0 / interval - decayed)
+                state["demand_at"] = now
+
+    def record_result(self, lot, occupied, total):
+        with self._lock:
+            self._lot(lot, self._clock())["fill"] = occupied / total if total else 0.0
+
+    def _priority(self, lot, now):
+        state = self._lot(lot, now)
+        # Never-analyzed lots go first
+        staleness = (now - state["analyzed_at"]) / 60.0 if state["analyzed_at"] is not None else 1e6
+        return (self.traffic_weight * math.log1p(self._decayed_demand(state, now))
+                + self.staleness_weight * staleness
+                + self.fullness_weight * state["fill"])
+
+    def priority(self, lot):
+        with self._lock:
+            return self._priority(lot, self._clock())
+
+    def acquire(self, lot):
+        """
+        Ask for an inference call for `lot` (non-blocking; decoders ask once
+        per frame while a sample is due). Granted when a token is free and
+        no waiting lot has a higher priority.
+        """
+        now = self._clock()
+        with self._lock:
+            self._waiting[lot] = now
+            if self._bucket is not None:
+                waiting = [other for other, asked in self._waiting.items() if now - asked < self.WAIT_EXPIRY]
+                if max(waiting, key=lambda other: self._priority(other, now)) != lot:
+                    return False
+                if not self._bucket.take():
+                    return False
+            del self._waiting[lot]
+            self._lot(lot, now)["analyzed_at"] = now
+            return True
+
+    def refund(self):
+        """Give back a granted call that couldn't be used (no free frame slot)."""
+        with self._lock:
+            if self._bucket is not None:
+                self._bucket.refund()
+
+    def cancel(self, lot):
+        with self._lock:
+            self._waiting.pop(lot, None)
+
+
+class DemandCounter:
+    """API-side per-lot request counts, taken as deltas for the CV service."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._since = time.monotonic()
+
+    def hit(self, lot):
+        with self._lock:
+            self._counts[lot] = self._counts.get(lot, 0) + 1
+
+    def take(self):
+        """({lot: requests}, seconds they were counted over) since the last take."""
+        with self._lock:
+            now = time.monotonic()
+            counts, self._counts = self._counts, {}
+            interval, self._since = now - self._since, now
+            return counts, interval
@@ -0,0 +1,127 @@
+"""
+inference_replay.py
+Record/replay layer for Roboflow inference responses.
+
+    INFERENCE_MODE=live    call the API as usual (default)
+    INFERENCE_MODE=record  call the API and store every response
+    INFERENCE_MODE=replay  serve stored responses, never touch the network
+
+Responses are keyed by (source, frame_index, model_id) and kept in a
+single SQLite file as zlib-compressed JSON (INFERENCE_STORE, default
+"inference_responses.db"). In replay mode the HTTP client is never
+created, so the whole pipeline can be re-run offline at full CPU speed
+for regression and performance testing.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+MODE_LIVE = "live"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+MODES = (MODE_LIVE, MODE_RECORD, MODE_REPLAY)
+
+DEFAULT_STORE_PATH = "inference_responses.db"
+ROBOFLOW_API_URL = "https://serverless.roboflow.com"
+
+
+class ReplayMiss(KeyError):
+    """No recorded response exists for the requested key."""
+
+
+class InferenceStore:
+    """Compact (source, frame_index, model_id) -> response store."""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                source      TEXT    NOT NULL,
+                frame_index INTEGER NOT NULL,
+                model_id    TEXT    NOT NULL,
+                response    BLOB    NOT NULL,
+                recorded_at REAL    NOT NULL,
+                PRIMARY KEY (source, frame_index, model_id)
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+
+    def get(self, source, frame_index, model_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE source = ? AND frame_index = ? AND model_id = ?",
+                (str(source), int(frame_index), model_id),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, source, frame_index, model_id, response):
+        blob = zlib.compress(json.dumps(response, separators=(",", ":")).encode("utf-8"), 6)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (str(source), int(frame_index), model_id, blob, time.time()),
+            )
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ReplayableInferenceClient:
+    """
+    Drop-in wrapper around InferenceHTTPClient.infer that can record or
+    replay responses. `source` and `frame_index` identify the frame; when
+    omitted the image path itself is used as the source with index 0
+    (the single-image model comparison scripts).
+    """
+
+    def __init__(self, api_key=None, mode=None, store_path=None, api_url=ROBOFLOW_API_URL):
+        self.mode = (mode or os.getenv("INFERENCE_MODE", MODE_LIVE)).lower()
+        if self.mode not in MODES:
+            raise ValueError(f"INFERENCE_MODE must be one of {MODES}, got {self.mode!r}")
+        self.api_key = api_key
+        self.api_url = api_url
+        self._client = None
+        self.store = None
+        if self.mode != MODE_LIVE:
+            self.store = InferenceStore(store_path or os.getenv("INFERENCE_STORE", DEFAULT_STORE_PATH))
+
+    @property
+    def replaying(self):
+        """True when no image needs to be encoded or sent."""
+        return self.mode == MODE_REPLAY
+
+    @property
+    def client(self):
+        if self._client is None:
+            from inference_sdk import InferenceHTTPClient
+            self._client = InferenceHTTPClient(api_url=self.api_url, api_key=self.api_key)
+        return self._client
+
+    def infer(self, image, model_id, source=None, frame_index=0):
+        source = image if source is None else source
+
+        if self.mode == MODE_REPLAY:
+            result = self.store.get(source, frame_index, model_id)
+            if result is None:
+                raise ReplayMiss(f"No recorded response for {source}#{frame_index} ({model_id})")
+            return result
+
+        result = self.client.infer(image, model_id=model_id)
+        if self.mode == MODE_RECORD:
+            self.store.put(source, frame_index, model_id, result)
+        return result
@@ -0,0 +1,145 @@
+"""
+live_capture.py
+Latest-frame grabber for live camera sources (RTSP/HTTP streams, webcams).
+
+A capture that's only read when inference is ready fills up with
+buffered frames, so each analysis sees a frame that's seconds old. The
+grabber thread instead reads the source continuously and keeps only the
+newest frame (with the wall time it was grabbed); consumers take
+whatever is current. When the source fails or ends, it is released and
+reopened with exponential backoff.
+
+A video file works as a stand-in camera: with pace=True it is read at
+its own FPS, and reaching the end counts as a disconnect.
+"""
+
+import logging
+import threading
+import time
+
+import cv2
+
+log = logging.getLogger("parkabull.live_capture")
+
+
+def is_live_source(source):
+    """Stream URLs and webcam indexes ("0") are live; anything else is a file path."""
+    return "://" in str(source) or str(source).isdigit()
+
+
+def capture_target(source):
+    """What cv2.VideoCapture should open: webcam indexes as ints, everything else as given."""
+    return int(source) if str(source).isdigit() else source
+
+
+class LatestFrameGrabber:
+    def __init__(self, source, name=None, pace=False, reconnect_delay=1.0, max_reconnect_delay=30.0,
+                 open_capture=cv2.VideoCapture):
+        """
+        Args:
+            source: stream URL, webcam index or video file
+            pace: sleep between reads to match the source FPS (for files standing in for cameras)
+            reconnect_delay / max_reconnect_delay: backoff bounds between reopen attempts
+        """
+        self.source = source
+        self.name = name or str(source)
+        self.pace = pace
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._open_capture = open_capture
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._captured_at = None
+        self._grabbed = 0
+        self._reconnects = 0
+        self.connected = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"cv_grab_{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def latest(self, after=0):
+        """(seq, frame, captured_at) of the newest frame if it's newer than `after`, else None."""
+        with self._cond:
+            if self._seq <= after:
+                return None
+            return self._seq, self._frame, self._captured_at
+
+    def wait_for_frame(self, timeout):
+        """Block until the first frame arrives; returns it, or None on timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > 0 or self._stop.is_set(), timeout)
+            return self._frame
+
+    def take_counts(self):
+        """(frames grabbed, reconnects) since the last call."""
+        with self._cond:
+            counts = (self._grabbed, self._reconnects)
+            self._grabbed = self._reconnects = 0
+            return counts
+
+    def _open(self):
+        cap = self._open_capture(capture_target(self.source))
+        if not cap.isOpened():
+            cap.release()
+            return None
+        # Ask the backend not to queue frames we'd only throw away (ignored where unsupported)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _run(self):
+        delay = self.reconnect_delay
+        first = True
+        while not self._stop.is_set():
+            cap = self._open()
+            if cap is None:
+                log.warning("⚠️  Could not open %s, retrying in %.1fs", self.name, delay)
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+            if not first:
+                with self._cond:
+                    self._reconnects += 1
+            first = False
+            self.connected = True
+            log.info("📹 Connected to %s", self.name)
+            try:
+                if self._read_loop(cap):
+                    delay = self.reconnect_delay  # it delivered frames, so start the backoff over
+            finally:
+                self.connected = False
+                cap.release()
+            if not self._stop.is_set():
+                log.warning("⚠️  Lost %s, reconnecting in %.1fs", self.name, delay)
+                self._stop.wait(delay)
+
+    def _read_loop(self, cap):
+        """Read until the source fails; returns whether any frame was read."""
+        frame_period = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30.0) if self.pace else 0.0
+        next_read = time.monotonic()
+        got_any = False
+        while not self._stop.is_set():
+            ok, frame = cap.read()
+            if not ok:
+                return got_any
+            got_any = True
+            with self._cond:
+                self._frame = frame
+                self._seq += 1
+                self._captured_at = time.time()
+                self._grabbed += 1
+                self._cond.notify_all()
+            if frame_period:
+                next_read += frame_period
+                self._stop.wait(max(0.0, next_read - time.monotonic()))
+        return got_any
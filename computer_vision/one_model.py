@@ -4,16 +4,14 @@
 import os
 import json
 from dotenv import load_dotenv
-from inference_sdk import InferenceHTTPClient
+from inference_replay import ReplayableInferenceClient
 
 load_dotenv()
 
 ROBOFLOW_API_KEY = os.getenv("ROBOFLOW_API_KEY")
 
-CLIENT = InferenceHTTPClient(
-    api_url="https://serverless.roboflow.com",
-    api_key=ROBOFLOW_API_KEY
-)
+# INFERENCE_MODE=record|replay stores/serves responses keyed by image and model
+CLIENT = ReplayableInferenceClient(api_key=ROBOFLOW_API_KEY)
 
 # ✅ Only one model
 MODEL_ID = "parking-lot-j4ojc/1"
@@ -9,7 +9,7 @@ import time
 import json
 from datetime import datetime
 from dotenv import load_dotenv
-from inference_sdk import InferenceHTTPClient
+from inference_replay import ReplayableInferenceClient
 
 load_dotenv()
 
@@ -34,11 +34,8 @@ CONFIDENCE_THRESHOLD = 0.28  # Minimum confidence (0.0 to 1.0) - filters predict
 # Create output directory if it doesn't exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Initialize Roboflow client
-CLIENT = InferenceHTTPClient(
-    api_url="https://serverless.roboflow.com",
-    api_key=ROBOFLOW_API_KEY
-)
+# Initialize Roboflow client (INFERENCE_MODE=live|record|replay)
+CLIENT = ReplayableInferenceClient(api_key=ROBOFLOW_API_KEY)
 
 
 # ============================================
@@ -57,10 +54,11 @@ def parse_prediction(pred):
     return "occupied"
 
 
-def analyze_frame(image_path):
+def analyze_frame(image_path, source=None, frame_index=0):
     """
     Run inference on a single frame and return counts.
     Uses CONFIDENCE_THRESHOLD and OVERLAP_THRESHOLD for filtering.
+    `source`/`frame_index` key the response for INFERENCE_MODE record/replay.
     
     Returns:
         dict: {"free": int, "occupied": int, "total": int, "predictions": list}
@@ -69,7 +67,8 @@ def analyze_frame(image_path):
     
     try:
         # Run inference - thresholds are applied post-processing
-        result = CLIENT.infer(image_path, model_id=MODEL_ID)
+        result = CLIENT.infer(image_path, model_id=MODEL_ID,
+                              source=source, frame_index=frame_index)
         
         free = 0
         occupied = 0
@@ -303,7 +302,7 @@ def process_video(video_source=VIDEO_PATH):
                 print(f"📸 Snapshot {snapshot_count} captured at {timestamp}")
                 
                 # Analyze frame
-                latest_results = analyze_frame(frame_path)
+                latest_results = analyze_frame(frame_path, source=video_source, frame_index=frame_count)
                 
                 # Display results
                 print(f"   ✅ Free spots: {latest_results['free']}")
@@ -10,7 +10,7 @@ import time
 import json
 from datetime import datetime
 from dotenv import load_dotenv
-from inference_sdk import InferenceHTTPClient
+from inference_replay import ReplayableInferenceClient
 
 load_dotenv()
 
@@ -40,11 +40,8 @@ CONFIDENCE_THRESHOLD = 0.5  # Minimum confidence (0.0 to 1.0) - filters predicti
 # Create output directory if it doesn't exist
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Initialize Roboflow client
-CLIENT = InferenceHTTPClient(
-    api_url="https://serverless.roboflow.com",
-    api_key=ROBOFLOW_API_KEY
-)
+# Initialize Roboflow client (INFERENCE_MODE=live|record|replay)
+CLIENT = ReplayableInferenceClient(api_key=ROBOFLOW_API_KEY)
 
 
 # ============================================
@@ -63,10 +60,11 @@ def parse_prediction(pred):
     return "occupied"
 
 
-def analyze_frame(image_path):
+def analyze_frame(image_path, source=None, frame_index=0):
     """
     Run inference on a single frame and return counts.
     Uses CONFIDENCE_THRESHOLD and OVERLAP_THRESHOLD for filtering.
+    `source`/`frame_index` key the response for INFERENCE_MODE record/replay.
     
     Returns:
         dict: {"free": int, "occupied": int, "total": int, "predictions": list}
@@ -75,7 +73,8 @@ def analyze_frame(image_path):
     
     try:
         # Run inference - thresholds are applied post-processing
-        result = CLIENT.infer(image_path, model_id=MODEL_ID)
+        result = CLIENT.infer(image_path, model_id=MODEL_ID,
+                              source=source, frame_index=frame_index)
         
         free = 0
         occupied = 0
@@ -295,7 +294,7 @@ def process_video_auto_export(video_source=VIDEO_PATH):
                 
                 print(f"📸 Snapshot {snapshot_count} captured at {timestamp}")
                 
-                latest_results = analyze_frame(frame_path)
+                latest_results = analyze_frame(frame_path, source=video_source, frame_index=frame_count)
                 
                 print(f"   ✅ Free spots: {latest_results['free']}")
                 print(f"   🚗 Occupied spots: {latest_results['occupied']}")
@@ -0,0 +1,109 @@
+"""
+conditional.py
+ETag / Last-Modified validators for polled GET endpoints.
+
+Each lot carries a version number that is bumped whenever its state
+changes (in-process writes, or a reload that observed a different row).
+Validators are built from that version alone, so a poll whose
+If-None-Match still matches is answered with 304 before the JSON payload
+is assembled.
+"""
+
+import threading
+import time
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+
+import metrics
+
+NOT_MODIFIED = metrics.REGISTRY.counter(
+    "parkabull_http_not_modified_total",
+    "Conditional GETs answered with 304 by route",
+    ("route",),
+)
+
+
+class VersionTracker:
+    """Monotonic per-key version counters with the time of the last bump."""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._versions = {}      # key -> (version, modified_at)
+        self._fingerprints = {}  # key -> last observed state fingerprint
+        # Versions restart at 1 with the process; the epoch keeps old ETags from matching
+        self.epoch = uuid.uuid4().hex[:8]
+        self._started = clock()
+
+    def bump(self, key):
+        with self._lock:
+            version = self._versions.get(key, (0, 0))[0] + 1
+            self._versions[key] = (version, self._clock())
+            return version
+
+    def observe(self, key, fingerprint):
+        """Bump `key` if `fingerprint` differs from the last one observed (e.g. a DB reload)."""
+        with self._lock:
+            previous = self._fingerprints.get(key)
+            self._fingerprints[key] = fingerprint
+            if previous is None or previous == fingerprint:
+                return False
+            version = self._versions.get(key, (0, 0))[0] + 1
+            self._versions[key] = (version, self._clock())
+            return True
+
+    def get(self, key):
+        """(version, modified_at) for `key`; unseen keys are version 0 as of process start."""
+        with self._lock:
+            return self._versions.get(key, (0, self._started))
+
+
+def _etag_matches(header, etag):
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def is_not_modified(headers, etag, last_modified=None):
+    """
+    True when the client's cached copy is still current. `headers` is any
+    case-insensitive mapping (Flask or Starlette request headers).
+    If-None-Match wins over If-Modified-Since when both are sent
+    (RFC 9110 13.2.2).
+    """
+    if_none_match = headers.get("If-None-Match")
+    if if_none_match:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = headers.get("If-Modified-Since")
+    if last_modified is not None and if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since.timestamp()
+    return False
+
+
+def validator_headers(etag, last_modified=None):
+    """ETag/Last-Modified headers; no-cache makes browsers revalidate on every poll."""
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(int(last_modified), usegmt=True)
+    return headers
+
+
+def tag(response, etag, last_modified=None):
+    response.headers.update(validator_headers(etag, last_modified))
+    return response
+
+
+def not_modified(route, etag, last_modified=None):
+    """Count a 304 for `route` and return the headers it should carry."""
+    NOT_MODIFIED.inc(route=route)
+    return validator_headers(etag, last_modified)
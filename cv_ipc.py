@@ -0,0 +1,308 @@
+"""
+cv_ipc.py
+Local IPC channel that carries CV results from cv_service.py to the API
+process (multiprocessing.connection over a Unix socket or loopback TCP).
+
+    CV_IPC_ADDRESS   "/tmp/parkabull-cv.sock" (default) or "host:port"
+    CV_IPC_AUTHKEY   shared secret for the connection handshake (required;
+                     CV_MODE=spawn generates one and hands it to its child)
+
+Messages are pickled, so whoever completes the handshake can run code in
+the receiving process: there is no default key, and an address that isn't
+loopback (or a Unix socket) is refused unless CV_IPC_AUTHKEY is set
+explicitly.
+
+Messages are small dicts:
+    {"type": "occupancy", "lot", "free", "occupied", "total", "frame_index",
+     "captured_at", "inference_seconds", "sample_interval", "error",
+     "attempts", "hedge_winner", "circuit"}   (see resilience.py)
+    {"type": "stats", "lot", "decoded", "dropped", "reconnects", "sample_interval", "priority"}
+    (decoded/dropped/reconnects are deltas since the last stats message)
+    {"type": "frame", "lot", "jpeg", "captured_at"}   (annotated stream frame, see streams.py)
+    {"type": "profile", "id", "result"} or {"type": "profile", "id", "error", "busy"}   (see profiler.py)
+
+and, API -> CV service on the same connection:
+    {"type": "demand", "lots": {lot: requests}, "interval"}   (see budget.py)
+    {"type": "stream", "lots": {lot: viewers}}   (lots to encode stream frames for)
+    {"type": "profile", "id", "seconds", "interval", "include_idle"}   (sample the service's threads)
+
+The API side never waits on the CV service; a slow or crashed CV service
+can't block request handling. broadcast() only queues, so it's safe from
+any thread and from the ASGI event loop (streams.FrameHub calls it there):
+one sender thread writes to the connections, and while it's stuck on a CV service that
+isn't reading, further messages are dropped (each one is a full snapshot,
+so the next one sent supersedes them).
+"""
+
+import ipaddress
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import metrics
+
+DEFAULT_ADDRESS = "/tmp/parkabull-cv.sock"
+OUTBOX_SIZE = 16  # API -> CV messages queued before broadcast() starts dropping
+
+log = logging.getLogger("parkabull.cv_ipc")
+
+DROPPED = metrics.REGISTRY.counter(
+    "parkabull_cv_ipc_dropped_total",
+    "Messages to the CV service dropped because it wasn't reading them, by type",
+    ("type",),
+)
+
+
+def ipc_address(address=None):
+    address = address or os.getenv("CV_IPC_ADDRESS", DEFAULT_ADDRESS)
+    if isinstance(address, str) and "/" not in address and ":" in address:
+        host, port = address.rsplit(":", 1)
+        return host.strip("[]"), int(port)
+    return address
+
+
+def is_loopback(address):
+    """Unix sockets and 127.0.0.0/8, ::1 or localhost TCP addresses."""
+    if not isinstance(address, tuple):
+        return True
+    host = address[0]
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def ipc_authkey(authkey=None, address=None):
+    """`authkey`, else CV_IPC_AUTHKEY; raises ValueError if there's none, or `address` needs an explicit one."""
+    explicit = os.getenv("CV_IPC_AUTHKEY")
+    if address is not None and not is_loopback(address) and not explicit:
+        raise ValueError(f"CV IPC address {address} is not loopback; set CV_IPC_AUTHKEY to use it")
+    authkey = authkey or explicit
+    if not authkey:
+        raise ValueError("No CV IPC authkey: set CV_IPC_AUTHKEY (CV_MODE=spawn generates one for its child)")
+    return authkey.encode("utf-8") if isinstance(authkey, str) else authkey
+
+
+def _shutdown(conn):
+    """Wake a thread blocked in conn.recv() (closing the fd under it doesn't)."""
+    try:
+        with socket.fromfd(conn.fileno(), socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # already closed
+
+
+def _put_latest(q, item):
+    """put_nowait(), discarding the oldest entries to make room."""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+
+class ResultListener:
+    """Accepts CV service connections and hands every message to `handler` (API side)."""
+
+    def __init__(self, handler, address=None, authkey=None):
+        self._handler = handler
+        self.address = ipc_address(address)
+        self._authkey = authkey  # resolved in start(), so a process that never listens needs no key
+        self._listener = None
+        self._thread = None
+        self._outbox = None
+        self._conns = set()
+        self._conns_lock = threading.Lock()
+        self._send_lock = threading.Lock()  # held while writing, so a connection isn't closed mid-send
+
+    def start(self):
+        if self._thread is not None:
+            return
+        authkey = ipc_authkey(self._authkey, self.address)
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)  # left behind by a previous run
+        self._listener = Listener(self.address, authkey=authkey)
+        self._outbox = queue.Queue(maxsize=OUTBOX_SIZE)
+        threading.Thread(target=self._send_loop, args=(self._outbox,), name="cv_ipc_sender", daemon=True).start()
+        self._thread = threading.Thread(target=self._accept_loop, name="cv_ipc_listener", daemon=True)
+        self._thread.start()
+        log.info("📡 Listening for CV results on %s", self.address)
+
+    def stop(self):
+        """Stop accepting and drop every connected CV service (their read loops exit)."""
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        self._thread = None
+        outbox, self._outbox = self._outbox, None
+        with self._conns_lock:
+            conns = list(self._conns)
+            self._conns.clear()
+        for conn in conns:
+            _shutdown(conn)
+        if outbox is not None:
+            _put_latest(outbox, None)  # stops the sender
+
+    @property
+    def connections(self):
+        with self._conns_lock:
+            return len(self._conns)
+
+    def broadcast(self, message):
+        """Queue `message` for every connected CV service (never blocks); False if it was dropped."""
+        outbox = self._outbox
+        if outbox is None:
+            return False
+        try:
+            outbox.put_nowait(message)
+            return True
+        except queue.Full:
+            DROPPED.inc(type=message.get("type"))
+            return False
+
+    def _send_loop(self, outbox):
+        while True:
+            message = outbox.get()
+            if message is None:
+                return
+            with self._conns_lock:
+                conns = list(self._conns)
+            with self._send_lock:
+                for conn in conns:
+                    try:
+                        conn.send(message)
+                    except (OSError, EOFError):
+                        pass  # its read loop notices the disconnect
+
+    def _accept_loop(self):
+        while self._listener is not None:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                return  # listener closed
+            except Exception as e:  # failed handshake (wrong authkey, ...)
+                log.warning("⚠️  Rejected CV connection: %s", e)
+                continue
+            threading.Thread(target=self._read_loop, args=(conn,), name="cv_ipc_conn", daemon=True).start()
+
+    def _read_loop(self, conn):
+        with self._conns_lock:
+            if self._listener is None:  # stopped while the handshake was in flight
+                conn.close()
+                return
+            self._conns.add(conn)
+        log.info("✅ CV service connected")
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                log.warning("⚠️  CV service disconnected")
+                with self._conns_lock:
+                    self._conns.discard(conn)
+                with self._send_lock:
+                    conn.close()
+                return
+            try:
+                self._handler(message)
+            except Exception as e:
+                log.error("❌ Error handling CV message %s: %s", message.get("type"), e)
+
+
+class Replies:
+    """Matches replies from the CV service to the requests that asked for them, by message id (API side)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiting = {}  # id -> [threading.Event, reply]
+
+    def expect(self):
+        """A fresh id to send with a request; wait() for its reply."""
+        request_id = uuid.uuid4().hex
+        with self._lock:
+            self._waiting[request_id] = [threading.Event(), None]
+        return request_id
+
+    def wait(self, request_id, timeout):
+        """The reply, or None if none arrived within `timeout` seconds."""
+        with self._lock:
+            entry = self._waiting[request_id]
+        entry[0].wait(timeout)
+        with self._lock:
+            self._waiting.pop(request_id, None)
+        return entry[1]
+
+    def resolve(self, message):
+        with self._lock:
+            entry = self._waiting.get(message.get("id"))
+        if entry is not None:
+            entry[1] = message
+            entry[0].set()
+
+
+class ResultPublisher:
+    """Sends messages to the API, reconnecting as needed (CV service side)."""
+
+    def __init__(self, address=None, authkey=None, retry_interval=1.0):
+        self.address = ipc_address(address)
+        self._authkey = ipc_authkey(authkey, self.address)
+        self.retry_interval = retry_interval
+        self._conn = None
+        self._next_attempt = 0.0
+        self._lock = threading.Lock()
+
+    def send(self, message):
+        """Deliver `message`; returns False (message dropped) while the API is unreachable."""
+        with self._lock:
+            if self._conn is None:
+                if time.monotonic() < self._next_attempt:
+                    return False
+                try:
+                    self._conn = Client(self.address, authkey=self._authkey)
+                    log.info("✅ Connected to API at %s", self.address)
+                except AuthenticationError as e:
+                    self._next_attempt = time.monotonic() + self.retry_interval
+                    log.error("❌ API at %s rejected the CV IPC authkey: %s", self.address, e)
+                    return False
+                except (OSError, EOFError) as e:
+                    self._next_attempt = time.monotonic() + self.retry_interval
+                    log.debug("API not reachable at %s: %s", self.address, e)
+                    return False
+            try:
+                self._conn.send(message)
+                return True
+            except (OSError, EOFError, BrokenPipeError) as e:
+                log.warning("⚠️  Lost connection to API: %s", e)
+                self._conn.close()
+                self._conn = None
+                return False
+
+    def receive(self):
+        """Messages the API has sent since the last call (never blocks)."""
+        messages = []
+        with self._lock:
+            try:
+                while self._conn is not None and self._conn.poll():
+                    messages.append(self._conn.recv())
+            except (OSError, EOFError) as e:
+                log.warning("⚠️  Lost connection to API: %s", e)
+                self._conn.close()
+                self._conn = None
+        return messages
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,585 @@
+"""
+cv_service.py
+Standalone computer-vision service: decodes each lot's video, runs
+inference and publishes occupancy to the API over cv_ipc.
+
+    python cv_service.py [--workers 2] [--slots 4] [--source Lot=video.mp4 ...] [--live]
+    CV_SOURCES="Furnas=public/parking_lot_video_slow.mp4,Ketter=rtsp://cam/stream"
+
+Process layout:
+- the main process runs one decoder thread per lot, each decoding frames
+  straight into that lot's shared-memory ring of frame slots (cv2
+  retrieves into the slot's buffer, so no frame is ever pickled or copied
+  between processes), and forwards results to the API;
+- --workers inference processes, shared by all lots, take ready slots,
+  JPEG-encode the pixels, hand the slot back and then wait on the
+  inference call.
+
+Live sources (stream URLs, webcam indexes, or any source with --live /
+CV_LIVE=1) are read by a grabber thread that keeps only the newest frame
+and reconnects on failure (computer_vision/live_capture.py), so a slow
+inference backend never makes the service analyze buffered, stale
+frames. Their captured_at is the grab time, so the API's
+parkabull_cv_frame_lag_seconds is the capture-to-publish latency.
+
+How often a frame is sampled adapts to the lot (sampling.py): it speeds
+up while counts change or the lot is nearly full and backs off while it
+is stable, between CV_SAMPLE_MIN_SECONDS and CV_SAMPLE_MAX_SECONDS of
+video. Recording and replaying (INFERENCE_MODE=record/replay) both keep
+the fixed SAMPLE_SECONDS, an unlimited budget and wait for a free slot,
+so a replay samples exactly the frames the recording stored. Across
+lots, a global budget (budget.py) caps inference calls per second and
+hands them to the due lots people are requesting most, or that are
+stalest or fullest.
+
+While the API has viewers on a lot's /api/lot/<name>/stream, its decoder
+also draws the latest predictions on a frame at most CV_STREAM_FPS times
+a second and JPEG-encodes it once; the API fans that one JPEG out to
+every viewer (streams.py). With no viewers nothing is encoded.
+
+When every slot is busy the sampled frame is dropped rather than queued,
+so a slow inference backend never builds up a backlog of stale frames
+(recordings and replays wait for a slot instead, so every recorded frame
+is analyzed).
+Decoding and inference run outside the API process, so they can't compete
+with request handling for the GIL.
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+import app_logging
+import cv_ipc
+import profiler
+import resilience
+import roles
+import tracing
+from budget import InferenceBudget
+from sampling import AdaptiveInterval
+from computer_vision.live_capture import LatestFrameGrabber, is_live_source
+from computer_vision.inference_replay import MODE_LIVE, MODE_REPLAY, ReplayableInferenceClient
+
+LOT_NAME = "Furnas"      # lot for --video when no --source/CV_SOURCES is given
+MODEL_ID = "parking-d1qyt/1"
+VIDEO_PATH = "public/parking_lot_video_slow.mp4"
+CONFIDENCE_THRESHOLD = 0.28
+PREDICTION_FIELDS = ("x", "y", "width", "height", "class", "confidence")  # what the stream overlay needs
+SAMPLE_SECONDS = 5       # starting (and record/replay) sampling interval, in seconds of video
+STATS_INTERVAL = 5.0     # seconds between decoded/dropped counter messages
+POLL_INTERVAL = 0.5      # seconds the publisher waits for a result before checking messages from the API
+STREAM_FPS = float(os.getenv("CV_STREAM_FPS", "5"))             # annotated frames/s per watched lot
+STREAM_QUALITY = int(os.getenv("CV_STREAM_JPEG_QUALITY", "70"))
+CONNECT_TIMEOUT = float(os.getenv("CV_CONNECT_TIMEOUT", "30"))  # wait for a live source's first frame
+DEFAULT_LIVE_SHAPE = (720, 1280, 3)  # frame slots for a live source that's down at startup
+
+log = app_logging.get_logger("cv_service")
+
+
+class FrameRing:
+    """Fixed-size uint8 frame slots in one shared-memory block."""
+
+    def __init__(self, slots, shape, name=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.slot_bytes = int(np.prod(self.shape))
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * self.slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+    @property
+    def spec(self):
+        """What another process needs to attach: (slots, shape, name)."""
+        return self.slots, self.shape, self.shm.name
+
+    def view(self, slot):
+        return np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# ============================================
+# INFERENCE WORKERS
+# ============================================
+
+def parse_prediction(pred):
+    """Interpret classes for the parking model."""
+    cls = pred["class"].lower().strip()
+    if cls == "free":
+        return "free"
+    if cls == "car":
+        return "occupied"
+    return "occupied"
+
+
+def confident_predictions(result):
+    return [pred for pred in result.get("predictions", []) if pred.get("confidence", 0) >= CONFIDENCE_THRESHOLD]
+
+
+def count_spots(result):
+    free = 0
+    occupied = 0
+    for pred in confident_predictions(result):
+        if parse_prediction(pred) == "free":
+            free += 1
+        else:
+            occupied += 1
+    return {"free": free, "occupied": occupied, "total": free + occupied}
+
+
+def inference_worker(rings, ready, free_slots, results):
+    """
+    Worker process: ready slot -> JPEG on disk -> slot released -> inference -> result.
+
+    rings: {lot: (ring spec, source)}; free_slots: {lot: queue of that ring's free slots}
+    """
+    app_logging.configure()
+    client = ReplayableInferenceClient(api_key=os.getenv("ROBOFLOW_API_KEY"))
+    # Per-attempt timeout, jittered retries, circuit breaker and optional hedging
+    # (INFERENCE_TIMEOUT, INFERENCE_RETRIES, INFERENCE_DEADLINE, INFERENCE_HEDGE_AFTER, INFERENCE_BREAKER_*)
+    policy = resilience.Policy.from_env("roboflow", "INFERENCE", attempts=2, deadline=30.0, attempt_timeout=15.0)
+    attached = {lot: FrameRing(*spec) for lot, (spec, _) in rings.items()}
+
+    try:
+        while True:
+            item = ready.get()
+            if item is None:
+                return
+            lot, slot, frame_index, captured_at = item
+            # One file per frame: an abandoned (timed-out) attempt may still be reading the last one
+            temp_frame_path = f"temp_frame_{os.getpid()}_{frame_index}.jpg"
+
+            try:
+                # Recorded responses are looked up by frame_index, so replays skip the encode
+                if not client.replaying:
+                    with tracing.span("cv.encode", lot=lot, slot=slot):
+                        cv2.imwrite(temp_frame_path, attached[lot].view(slot))
+            finally:
+                free_slots[lot].put(slot)
+
+            message = {"type": "occupancy", "lot": lot, "frame_index": frame_index,
+                       "captured_at": captured_at, "model": MODEL_ID, "error": False}
+            started = time.perf_counter()
+            call = {}
+            try:
+                with tracing.span("cv.infer", kind=tracing.SPAN_KIND_CLIENT, model=MODEL_ID, lot=lot):
+                    result = policy.call(lambda: client.infer(temp_frame_path, model_id=MODEL_ID,
+                                                              source=rings[lot][1], frame_index=frame_index),
+                                         info=call)
+                message.update(count_spots(result))
+                # Boxes for the live stream overlay (dropped by the publisher before it reaches the API)
+                message["predictions"] = [{key: pred.get(key) for key in PREDICTION_FIELDS}
+                                          for pred in confident_predictions(result)]
+            except Exception as e:
+                # The API keeps the last published occupancy rather than writing zeros
+                log.error("❌ Error analyzing %s frame %s: %s", lot, frame_index, e)
+                message["error"] = True
+            finally:
+                if os.path.exists(temp_frame_path):
+                    os.remove(temp_frame_path)
+            message["inference_seconds"] = time.perf_counter() - started
+            message.update(attempts=call.get("attempts", 0), hedge_winner=call.get("hedge_winner"),
+                           circuit=policy.breaker.state)
+            results.put(message)
+    finally:
+        for ring in attached.values():
+            ring.close()
+
+
+# ============================================
+# LIVE STREAM
+# ============================================
+
+def draw_predictions(frame, predictions):
+    """Boxes and FREE/OCCUPIED labels on a copy of the frame (as in video_parking_detector.py)."""
+    annotated = frame.copy()
+    for pred in predictions:
+        x, y = int(pred.get("x", 0)), int(pred.get("y", 0))
+        width, height = int(pred.get("width", 0)), int(pred.get("height", 0))
+        x1, y1 = int(x - width / 2), int(y - height / 2)
+        x2, y2 = int(x + width / 2), int(y + height / 2)
+        if parse_prediction(pred) == "free":
+            color, label = (0, 255, 0), f"FREE {pred.get('confidence', 0):.2f}"
+        else:
+            color, label = (0, 0, 255), f"OCCUPIED {pred.get('confidence', 0):.2f}"
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
+        label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0]
+        cv2.rectangle(annotated, (x1, y1 - label_size[1] - 10), (x1 + label_size[0] + 10, y1), color, -1)
+        cv2.putText(annotated, label, (x1 + 5, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+    return annotated
+
+
+class StreamEncoder:
+    """Annotated JPEGs for the lots the API has stream viewers on, at most `fps` per lot."""
+
+    def __init__(self, publisher, fps=STREAM_FPS, quality=STREAM_QUALITY):
+        self._publisher = publisher
+        self.period = 1.0 / fps if fps > 0 else None  # CV_STREAM_FPS=0 turns streaming off
+        self.quality = quality
+        self._lock = threading.Lock()
+        self._watched = set()   # lower-cased lot names (the API's stream keys)
+        self._predictions = {}  # lot -> boxes from its latest analysis
+        self._next_at = {}      # lot -> monotonic time its next stream frame is due
+
+    def watch(self, viewers):
+        """Apply the API's {lot: viewers} (sent on a lot's first/last viewer and with every demand message)."""
+        with self._lock:
+            watched = {lot for lot, count in viewers.items() if count}
+            if watched != self._watched:
+                log.info("📺 Streaming lots: %s", ", ".join(sorted(watched)) or "none")
+            self._watched = watched
+
+    def set_predictions(self, lot, predictions):
+        with self._lock:
+            self._predictions[lot] = predictions
+
+    def due(self, lot):
+        """Whether to encode a stream frame for `lot` now (claims the slot if so)."""
+        now = time.monotonic()
+        with self._lock:
+            if self.period is None or lot.lower() not in self._watched or now < self._next_at.get(lot, 0.0):
+                return False
+            self._next_at[lot] = now + self.period
+            return True
+
+    def publish(self, lot, frame, captured_at):
+        with self._lock:
+            predictions = self._predictions.get(lot, [])
+        with tracing.span("cv.stream_encode", lot=lot):
+            ok, jpeg = cv2.imencode(".jpg", draw_predictions(frame, predictions),
+                                    [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if ok:
+            self._publisher.send({"type": "frame", "lot": lot, "jpeg": jpeg.tobytes(), "captured_at": captured_at})
+
+
+# ============================================
+# PUBLISHER
+# ============================================
+
+def publish_results(results, publisher, stats, stop, sampler, budget, fps, streams):
+    """
+    Forward worker results to the API in capture order (per lot), dropping
+    any that arrive late; feed the counts back into the sampling interval
+    and the budget (and the boxes into the stream overlay), and the API's
+    demand and stream messages into the budget and stream encoder.
+    """
+    latest = {}
+    while not stop.is_set():
+        try:
+            message = results.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            message = None
+        if message is not None:
+            lot = message["lot"]
+            predictions = message.pop("predictions", None)
+            if message["captured_at"] < latest.get(lot, 0.0):
+                continue  # a newer frame already finished on another worker
+            if not message["error"]:
+                latest[lot] = message["captured_at"]
+                streams.set_predictions(lot, predictions or [])
+                # Files are timed in video seconds, live sources by the wall clock
+                at = message["frame_index"] / fps[lot] if fps[lot] else message["captured_at"]
+                sampler.observe(lot, message["occupied"], message["total"], at)
+                budget.record_result(lot, message["occupied"], message["total"])
+            message["sample_interval"] = sampler.interval(lot)
+            publisher.send(message)
+
+        for incoming in publisher.receive():
+            if incoming.get("type") == "demand":
+                budget.record_demand(incoming["lots"], incoming["interval"])
+            elif incoming.get("type") == "stream":
+                streams.watch(incoming["lots"])
+            elif incoming.get("type") == "profile":
+                threading.Thread(target=profile_threads, args=(incoming, publisher),
+                                 name="cv_profiler", daemon=True).start()
+
+        deltas = stats.take()
+        if deltas is not None:
+            for lot, delta in deltas.items():
+                publisher.send({"type": "stats", "lot": lot, "sample_interval": sampler.interval(lot),
+                                "priority": budget.priority(lot), **delta})
+
+
+def profile_threads(request, publisher):
+    """Run a profile the API asked for (/api/admin/profile?process=cv) and send the result back."""
+    log.info("🔬 Profiling CV service threads for %ss", request["seconds"])
+    try:
+        result = profiler.sample(request["seconds"], request["interval"], request["include_idle"])
+        reply = {"type": "profile", "id": request["id"], "result": result}
+    except Exception as e:
+        reply = {"type": "profile", "id": request["id"], "error": str(e),
+                 "busy": isinstance(e, profiler.ProfilerBusy)}
+    publisher.send(reply)
+
+
+class DecodeStats:
+    def __init__(self, lots):
+        self._lock = threading.Lock()
+        self._counts = {lot: {"decoded": 0, "dropped": 0, "reconnects": 0} for lot in lots}
+        self._last_sent = time.monotonic()
+
+    def add(self, lot, decoded=0, dropped=0, reconnects=0):
+        with self._lock:
+            counts = self._counts[lot]
+            counts["decoded"] += decoded
+            counts["dropped"] += dropped
+            counts["reconnects"] += reconnects
+
+    def take(self):
+        """Per-lot counter deltas since the last take, at most once per STATS_INTERVAL."""
+        with self._lock:
+            if time.monotonic() - self._last_sent < STATS_INTERVAL:
+                return None
+            deltas = self._counts
+            self._counts = {lot: {"decoded": 0, "dropped": 0, "reconnects": 0} for lot in deltas}
+            self._last_sent = time.monotonic()
+            return deltas
+
+
+# ============================================
+# DECODER
+# ============================================
+
+def decode_source(lot, cap, ring, fps, ready, free_slots, sampler, budget, stats, stop, mode, streams):
+    """
+    Decoder thread for one lot: sample frames when due and the budget
+    allows, into the lot's ring; stream frames for the API's viewers.
+    """
+    frame_count = 0
+    next_sample = 0
+    while not stop.is_set():
+        # grab() only demuxes/decodes; colour conversion into the ring happens for sampled frames
+        if not cap.grab():
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # loop back to start of video
+            frame_count = next_sample = 0
+            continue
+        stats.add(lot, decoded=1)
+
+        # While the budget says no, keep decoding: the frame analyzed is the newest one when it says yes
+        if frame_count >= next_sample and budget.acquire(lot):
+            next_sample = frame_count + max(int(fps * sampler.interval(lot)), 1)
+            try:
+                # Recordings and replays must see every sampled frame, so they wait for a slot instead
+                slot = free_slots.get(block=mode != MODE_LIVE)
+            except queue.Empty:
+                stats.add(lot, dropped=1)
+                budget.refund()
+            else:
+                view = ring.view(slot)
+                ok, frame = cap.retrieve(view)
+                if ok and frame.shape == ring.shape:
+                    if not np.shares_memory(frame, view):  # backend couldn't write in place
+                        np.copyto(view, frame)
+                    ready.put((lot, slot, frame_count, time.time()))
+                else:
+                    free_slots.put(slot)
+
+        if streams.due(lot):
+            ok, frame = cap.retrieve()
+            if ok:
+                streams.publish(lot, frame, time.time())
+
+        frame_count += 1
+        # Small sleep to pace decoding like a live feed (replays run as fast as possible)
+        if mode != MODE_REPLAY:
+            time.sleep(0.01)
+    budget.cancel(lot)
+
+
+def sample_live(lot, grabber, ring, ready, free_slots, sampler, budget, stats, stop, streams):
+    """
+    Sampler thread for a live lot: when due and the budget allows, copy the
+    grabber's newest frame into the ring; stream frames for the API's viewers.
+    """
+    seen = 0
+    streamed = 0
+    next_sample_at = 0.0
+    while not stop.is_set():
+        grabbed, reconnects = grabber.take_counts()
+        if grabbed or reconnects:
+            stats.add(lot, decoded=grabbed, reconnects=reconnects)
+
+        newest = grabber.latest(after=streamed)
+        if newest is not None and streams.due(lot):
+            streamed, frame, captured_at = newest
+            streams.publish(lot, frame, captured_at)
+
+        latest = grabber.latest(after=seen)
+        if latest is None or time.monotonic() < next_sample_at or not budget.acquire(lot):
+            stop.wait(0.01)
+            continue
+        seen, frame, captured_at = latest
+        next_sample_at = time.monotonic() + sampler.interval(lot)
+        try:
+            slot = free_slots.get(block=False)
+        except queue.Empty:
+            stats.add(lot, dropped=1)
+            budget.refund()
+            continue
+        view = ring.view(slot)
+        if frame.shape == ring.shape:
+            np.copyto(view, frame)
+        else:  # the camera came back at another resolution
+            cv2.resize(frame, (ring.shape[1], ring.shape[0]), dst=view)
+        ready.put((lot, slot, seen, captured_at))
+    budget.cancel(lot)
+
+
+def open_source(lot, video_path):
+    if not os.path.exists(video_path):
+        log.error("❌ Video file not found for %s: %s", lot, video_path)
+        return None
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        log.error("❌ Could not open video for %s: %s", lot, video_path)
+        return None
+    return cap
+
+
+def run(sources=None, workers=2, slots=4, live=False):
+    """
+    sources: {lot name: video path or stream URL} (default: LOT_NAME -> VIDEO_PATH)
+    live: treat files as live sources too (read at their FPS, latest frame only)
+    """
+    sources = sources or {LOT_NAME: VIDEO_PATH}
+    log.info("🎥 Starting CV service...")
+    log.info("🎯 Model: %s", MODEL_ID)
+    log.info("👷 Inference workers: %s, frame slots per lot: %s", workers, slots)
+
+    caps, fps, rings, grabbers = {}, {}, {}, {}
+    for lot, source in sources.items():
+        if live or is_live_source(source):
+            grabber = grabbers[lot] = LatestFrameGrabber(source, name=lot, pace=not is_live_source(source))
+            grabber.start()
+            frame = grabber.wait_for_frame(CONNECT_TIMEOUT)
+            if frame is None:
+                log.warning("⚠️  No frame from %s within %ss; sampling will start once it connects", lot, CONNECT_TIMEOUT)
+            fps[lot] = None
+            rings[lot] = FrameRing(slots, frame.shape if frame is not None else DEFAULT_LIVE_SHAPE)
+            log.info("📡 %s: %s (live) - frame shape: %s", lot, source, rings[lot].shape)
+            continue
+
+        video_path = source
+        cap = open_source(lot, video_path)
+        if cap is None:
+            continue
+        caps[lot] = cap
+        fps[lot] = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+        rings[lot] = FrameRing(slots, shape)
+        log.info("📹 %s: %s - FPS: %s, frame shape: %s", lot, video_path, fps[lot], shape)
+    if not rings:
+        return
+
+    ctx = mp.get_context("spawn")
+    ready, results = ctx.Queue(), ctx.Queue()
+    free_slots = {lot: ctx.Queue() for lot in rings}
+    for lot in rings:
+        for slot in range(slots):
+            free_slots[lot].put(slot)
+    ring_specs = {lot: (rings[lot].spec, sources[lot]) for lot in rings}
+    pool = [ctx.Process(target=inference_worker, args=(ring_specs, ready, free_slots, results),
+                        name=f"cv_inference_{i}", daemon=True)
+            for i in range(workers)]
+    for p in pool:
+        p.start()
+
+    mode = os.getenv("INFERENCE_MODE", MODE_LIVE).lower()
+    if mode != MODE_LIVE:
+        # Recordings are keyed by frame index: record and replay must sample the same frames
+        sampler = AdaptiveInterval(SAMPLE_SECONDS, SAMPLE_SECONDS)
+        budget = InferenceBudget()
+    else:
+        sampler = AdaptiveInterval.from_env(SAMPLE_SECONDS)
+        budget = InferenceBudget.from_env()
+    log.info("⏱️  Sampling every %s-%ss of video, at most %s inference calls/s",
+             sampler.min_interval, sampler.max_interval, budget.rate or "unlimited")
+    publisher = cv_ipc.ResultPublisher()
+    stats = DecodeStats(rings)
+    streams = StreamEncoder(publisher)
+    stop = threading.Event()
+    forwarder = threading.Thread(target=publish_results,
+                                 args=(results, publisher, stats, stop, sampler, budget, fps, streams),
+                                 name="cv_publisher", daemon=True)
+    forwarder.start()
+    decoders = [threading.Thread(target=decode_source, name=f"cv_decode_{lot}", daemon=True,
+                                 args=(lot, cap, rings[lot], fps[lot], ready, free_slots[lot],
+                                       sampler, budget, stats, stop, mode, streams))
+                for lot, cap in caps.items()]
+    decoders += [threading.Thread(target=sample_live, name=f"cv_sample_{lot}", daemon=True,
+                                  args=(lot, grabber, rings[lot], ready, free_slots[lot],
+                                        sampler, budget, stats, stop, streams))
+                 for lot, grabber in grabbers.items()]
+    for t in decoders:
+        t.start()
+
+    try:
+        while any(t.is_alive() for t in decoders):
+            for t in decoders:
+                t.join(timeout=1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        for t in decoders:
+            t.join(timeout=5)
+        for _ in pool:
+            ready.put(None)
+        for p in pool:
+            p.join(timeout=5)
+        for cap in caps.values():
+            cap.release()
+        for grabber in grabbers.values():
+            grabber.stop()
+        publisher.close()
+        for ring in rings.values():
+            ring.close()
+        log.info("🛑 CV service stopped.")
+
+
+def parse_sources(specs):
+    """["Lot=path", "Lot2=path2,Lot3=path3"] -> {lot: path}"""
+    sources = {}
+    for spec in specs:
+        for part in spec.split(","):
+            if not part.strip():
+                continue
+            lot, sep, path = part.partition("=")
+            if not sep or not lot.strip() or not path.strip():
+                raise ValueError(f"Expected LOT=PATH, got {part!r}")
+            sources[lot.strip()] = path.strip()
+    return sources
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ParkABull CV service")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("CV_WORKERS", "2")))
+    parser.add_argument("--slots", type=int, default=int(os.getenv("CV_RING_SLOTS", "4")))
+    parser.add_argument("--source", action="append", default=[], metavar="LOT=PATH",
+                        help="lot name and its video (repeatable; default CV_SOURCES)")
+    parser.add_argument("--video", default=VIDEO_PATH, help=f"video for {LOT_NAME} when no sources are given")
+    parser.add_argument("--live", action="store_true", default=os.getenv("CV_LIVE") == "1",
+                        help="treat video files as live cameras (stream URLs and webcam indexes always are)")
+    args = parser.parse_args(argv)
+    sources = parse_sources(args.source or [os.getenv("CV_SOURCES", "")]) or {LOT_NAME: args.video}
+
+    app_logging.configure()
+    roles.mark("imported")
+    log.info("🚀 CV service %s", roles.format_report(roles.report()))
+    run(sources, workers=args.workers, slots=args.slots, live=args.live)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+departures.py
+Incrementally maintained per-lot departure histograms.
+
+Each lot keeps one counter per minute of the day plus a sorted list of the
+minutes that currently have departures. Submitting a schedule is an O(1)
+counter bump (plus an insort into at most 1440 minutes), expiry drops
+whole minutes from the front, and "next N departures after now" is a
+binary search followed by N reads - none of it depends on how many
+schedule rows the lot has.
+"""
+
+import bisect
+import logging
+import threading
+import time
+
+log = logging.getLogger("parkabull.departures")
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def to_minute(value):
+    """Parse "HH:MM" or "HH:MM:SS" into minutes since midnight, or None."""
+    if not value:
+        return None
+    parts = str(value).split(":")
+    if len(parts) not in (2, 3):
+        return None
+    try:
+        hours, minutes = int(parts[0]), int(parts[1])
+    except ValueError:
+        return None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        return None
+    return hours * 60 + minutes
+
+
+def format_minute(minute):
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def current_minute(now=None):
+    now = now or time.localtime()
+    return now.tm_hour * 60 + now.tm_min
+
+
+class DepartureHistogram:
+    """Minute-bucketed departure counts for one lot."""
+
+    def __init__(self):
+        self._counts = [0] * MINUTES_PER_DAY
+        self._minutes = []  # sorted minutes whose count > 0
+        self.total = 0
+
+    def add(self, minute, count=1):
+        if self._counts[minute] == 0:
+            bisect.insort(self._minutes, minute)
+        self._counts[minute] += count
+        self.total += count
+
+    def expire_before(self, minute):
+        """Drop every bucket earlier than `minute`; return how many departures were removed."""
+        cut = bisect.bisect_left(self._minutes, minute)
+        removed = 0
+        for m in self._minutes[:cut]:
+            removed += self._counts[m]
+            self._counts[m] = 0
+        del self._minutes[:cut]
+        self.total -= removed
+        return removed
+
+    def next_after(self, minute, top_n=5):
+        """The first `top_n` non-empty buckets at or after `minute`."""
+        start = bisect.bisect_left(self._minutes, minute)
+        return [
+            {"time": format_minute(m), "count": self._counts[m]}
+            for m in self._minutes[start:start + top_n]
+        ]
+
+
+class DepartureIndex:
+    """
+    Departure histograms for every lot, keyed by lot id.
+
+    A lot's histogram is built from `loader(lot_id)` (an iterable of
+    "HH:MM[:SS]" strings) the first time it's needed and rebuilt after
+    `max_age` seconds, so rows written by other processes are picked up.
+    If a rebuild fails (datastore down), the expired histogram keeps being
+    served until a load succeeds, like LotCache's stale-if-error.
+    """
+
+    def __init__(self, loader, max_age=300.0, clock=time.monotonic):
+        self._loader = loader
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._lots = {}         # lot_id -> (loaded_at, DepartureHistogram)
+        self._load_locks = {}
+        self._generations = {}  # lot_id -> int, bumped by every add()
+
+    @staticmethod
+    def _build(times):
+        histogram = DepartureHistogram()
+        for value in times:
+            minute = to_minute(value)
+            if minute is not None:
+                histogram.add(minute)
+        histogram.expire_before(current_minute())
+        return histogram
+
+    def _fresh(self, lot_id):
+        entry = self._lots.get(lot_id)
+        if entry is not None and self._clock() - entry[0] < self.max_age:
+            return entry[1]
+        return None
+
+    def _histogram(self, lot_id):
+        with self._lock:
+            histogram = self._fresh(lot_id)
+            if histogram is not None:
+                return histogram
+            load_lock = self._load_locks.setdefault(lot_id, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                histogram = self._fresh(lot_id)
+                if histogram is not None:
+                    return histogram
+                generation = self._generations.get(lot_id, 0)
+            try:
+                histogram = self._build(self._loader(lot_id))
+            except Exception as e:
+                with self._lock:
+                    entry = self._lots.get(lot_id)
+                if entry is None:
+                    raise
+                log.warning("⚠️  Could not reload departures for lot %s, serving the old index: %s", lot_id, e)
+                return entry[1]
+            with self._lock:
+                self._store(lot_id, histogram, generation)
+            return histogram
+
+    def _store(self, lot_id, histogram, generation):
+        """Install a loaded histogram; caller holds the lock."""
+        # A row added while the load ran may or may not be in it (add() skips lots that aren't
+        # loaded), so keep it only until the next read, which loads again and surely sees the row
+        fresh = self._generations.get(lot_id, 0) == generation
+        self._lots[lot_id] = (self._clock() if fresh else float("-inf"), histogram)
+
+    def generations(self):
+        """Snapshot to pass to prime() along with rows read after taking it."""
+        with self._lock:
+            return dict(self._generations)
+
+    def needs_load(self, lot_ids):
+        """The subset of `lot_ids` whose histogram is missing or older than max_age."""
+        with self._lock:
+            return [lot_id for lot_id in lot_ids if self._fresh(lot_id) is None]
+
+    def prime(self, times_by_lot, generations=None):
+        """
+        Install histograms from one batched query: {lot_id: ["HH:MM:SS", ...]}.
+        `generations` is generations() from before the query; lots added to
+        since are reloaded on their next read.
+        """
+        built = {lot_id: self._build(times) for lot_id, times in times_by_lot.items()}
+        with self._lock:
+            for lot_id, histogram in built.items():
+                generation = self._generations.get(lot_id, 0) if generations is None else generations.get(lot_id, 0)
+                self._store(lot_id, histogram, generation)
+
+    def add(self, lot_id, departure_time):
+        """
+        Record a departure that has already been written to the schedules
+        table; returns False if the time can't be parsed. A lot whose
+        histogram isn't loaded (or is due for a reload) is left alone: its
+        next load reads the new row along with the rest, and a load already
+        running is reloaded on the next read.
+        """
+        minute = to_minute(departure_time)
+        if minute is None:
+            return False
+        with self._lock:
+            self._generations[lot_id] = self._generations.get(lot_id, 0) + 1
+            histogram = self._fresh(lot_id)
+            if histogram is not None:
+                histogram.add(minute)
+        return True
+
+    def expire(self, before_minute=None):
+        """Drop departures earlier than `before_minute` (default: now) in every loaded lot."""
+        before_minute = current_minute() if before_minute is None else before_minute
+        removed = 0
+        with self._lock:
+            for _, histogram in self._lots.values():
+                removed += histogram.expire_before(before_minute)
+        return removed
+
+    def next_departures(self, lot_id, top_n=5, after_minute=None):
+        """Upcoming departures as [{"time": "HH:MM", "count": n}, ...] sorted by time."""
+        after_minute = current_minute() if after_minute is None else after_minute
+        histogram = self._histogram(lot_id)
+        with self._lock:
+            return histogram.next_after(after_minute, top_n)
+
+    def cached_departures(self, lot_id, top_n=5, after_minute=None):
+        """next_departures() from whatever histogram is held, however old, without loading ([] if none)."""
+        after_minute = current_minute() if after_minute is None else after_minute
+        with self._lock:
+            entry = self._lots.get(lot_id)
+            return entry[1].next_after(after_minute, top_n) if entry is not None else []
+
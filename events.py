@@ -0,0 +1,202 @@
+"""
+events.py
+In-process broadcaster behind the Server-Sent Events streams.
+
+Publishers (CV worker, leaving-soon, submit-schedule) call `publish()`.
+Each event is serialized to SSE wire format once and appended to a
+bounded history. Subscribers all wait on one Condition, so a publish is
+a single notify_all no matter how many clients are connected; each
+subscriber then copies only the events newer than the last one it sent.
+The history also lets a reconnecting client resume from its
+Last-Event-ID.
+
+`asubscribe()` is the asyncio flavour used by the ASGI app: instead of
+parking a thread per client, each event loop gets one asyncio.Event that
+a publish sets (once per loop, not per subscriber).
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+HEARTBEAT_INTERVAL = 15.0  # seconds between keep-alive comments
+HISTORY_SIZE = 1024        # events kept for Last-Event-ID resume
+
+ALL_TOPICS = None
+
+
+class _Event:
+    __slots__ = ("id", "topic", "payload")
+
+    def __init__(self, event_id, topic, event_type, data):
+        self.id = event_id
+        self.topic = topic
+        self.payload = (
+            f"id: {event_id}\n"
+            f"event: {event_type}\n"
+            f"data: {json.dumps(data, separators=(',', ':'))}\n\n"
+        ).encode("utf-8")
+
+
+class Broadcaster:
+    def __init__(self, history_size=HISTORY_SIZE, heartbeat_interval=HEARTBEAT_INTERVAL):
+        self.heartbeat_interval = heartbeat_interval
+        self._condition = threading.Condition()
+        self._history = deque(maxlen=history_size)
+        self._last_id = 0
+        self._subscribers = 0
+        self._closed = False
+        self._loops = {}  # event loop -> asyncio.Event its async subscribers wait on
+
+    @property
+    def subscriber_count(self):
+        return self._subscribers
+
+    @property
+    def last_event_id(self):
+        return self._last_id
+
+    def publish(self, topic, data, event_type="update"):
+        """Append an event for `topic` and wake every subscriber."""
+        with self._condition:
+            self._last_id += 1
+            self._history.append(_Event(self._last_id, topic, event_type, data))
+            self._condition.notify_all()
+            self._wake_loops()
+            return self._last_id
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            self._wake_loops()
+
+    def _wake_loops(self):
+        for loop in list(self._loops):
+            try:
+                loop.call_soon_threadsafe(self._wake_loop, loop)
+            except RuntimeError:  # loop already closed
+                del self._loops[loop]
+
+    def _wake_loop(self, loop):
+        # Runs on `loop`: swap in a fresh Event, then release everyone waiting on the old one
+        with self._condition:
+            event = self._loops.get(loop)
+            self._loops[loop] = asyncio.Event()
+        if event is not None:
+            event.set()
+
+    def _loop_event(self, loop):
+        with self._condition:
+            event = self._loops.get(loop)
+            if event is None:
+                event = self._loops[loop] = asyncio.Event()
+            return event
+
+    def _events_after(self, last_id):
+        """Events newer than last_id (oldest first), or None if last_id fell out of history."""
+        if last_id >= self._last_id:
+            return []
+        if self._history and last_id < self._history[0].id - 1:
+            return None
+        newer = []
+        for event in reversed(self._history):
+            if event.id <= last_id:
+                break
+            newer.append(event)
+        newer.reverse()
+        return newer
+
+    def _take(self, last_id, topics):
+        """(chunk, new last_id) for everything after last_id; caller holds the lock."""
+        events = self._events_after(last_id)
+        if events is None:
+            # Client was away longer than the history covers - tell it to refetch
+            return f"id: {self._last_id}\nevent: reset\ndata: {{}}\n\n".encode("utf-8"), self._last_id
+        if not events:
+            return b"", last_id
+        chunk = b"".join(e.payload for e in events if topics is ALL_TOPICS or e.topic in topics)
+        return chunk, events[-1].id
+
+    def _open(self, last_event_id):
+        """Register a subscriber; returns (starting id, preamble bytes)."""
+        with self._condition:
+            self._subscribers += 1
+            # An id from the future means the process restarted since the client's last event
+            stale = last_event_id is not None and last_event_id > self._last_id
+            last_id = self._last_id if last_event_id is None or stale else last_event_id
+        preamble = f"retry: 3000\n: connected {time.time():.0f}\n\n"
+        if stale:
+            preamble += f"id: {last_id}\nevent: reset\ndata: {{}}\n\n"
+        return last_id, preamble.encode("utf-8")
+
+    def _leave(self):
+        with self._condition:
+            self._subscribers -= 1
+
+    def subscribe(self, topics=ALL_TOPICS, last_event_id=None):
+        """
+        Generator of SSE-encoded bytes for `topics` (a set of topic names,
+        or ALL_TOPICS). Starts after `last_event_id` when given, otherwise
+        with only new events. Yields a comment line every heartbeat interval
+        so proxies keep the connection open.
+        """
+        last_id, preamble = self._open(last_event_id)
+        try:
+            yield preamble
+            last_sent = time.monotonic()
+            while True:
+                with self._condition:
+                    if last_id >= self._last_id and not self._closed:
+                        timeout = self.heartbeat_interval - (time.monotonic() - last_sent)
+                        self._condition.wait(max(timeout, 0.0))
+                    chunk, last_id = self._take(last_id, topics)
+                    closed = self._closed
+
+                if not chunk and time.monotonic() - last_sent >= self.heartbeat_interval:
+                    chunk = b": heartbeat\n\n"
+                if chunk:
+                    last_sent = time.monotonic()
+                    yield chunk
+
+                if closed:
+                    return
+        finally:
+            self._leave()
+
+    async def asubscribe(self, topics=ALL_TOPICS, last_event_id=None):
+        """Async generator equivalent of `subscribe()` for use on an event loop."""
+        loop = asyncio.get_running_loop()
+        last_id, preamble = self._open(last_event_id)
+        try:
+            yield preamble
+            last_sent = time.monotonic()
+            while True:
+                wake = self._loop_event(loop)
+                with self._condition:
+                    idle = last_id >= self._last_id and not self._closed
+                if idle:
+                    timeout = self.heartbeat_interval - (time.monotonic() - last_sent)
+                    try:
+                        await asyncio.wait_for(wake.wait(), max(timeout, 0.0))
+                    except asyncio.TimeoutError:
+                        pass
+                with self._condition:
+                    chunk, last_id = self._take(last_id, topics)
+                    closed = self._closed
+
+                if not chunk and time.monotonic() - last_sent >= self.heartbeat_interval:
+                    chunk = b": heartbeat\n\n"
+                if chunk:
+                    last_sent = time.monotonic()
+                    yield chunk
+
+                if closed:
+                    return
+        finally:
+            self._leave()
+
+def lot_topic(lot_name):
+    return f"lot:{lot_name.lower()}"
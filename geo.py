@@ -0,0 +1,151 @@
+"""
+geo.py
+In-memory spatial index over lot coordinates.
+
+Lots are bucketed into a fixed lat/lng grid (cells of `cell_degrees`,
+~1 km by default), so a radius query only measures the lots in the few
+cells its bounding box touches instead of every lot. LotLocations keeps
+one index built from the lots table and rebuilds it on the first query
+after it's older than `max_age`.
+"""
+
+import heapq
+import logging
+import math
+import threading
+import time
+
+log = logging.getLogger("parkabull.geo")
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180.0
+
+
+def distance_m(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    def __init__(self, points, cell_degrees=0.01):
+        """points: iterable of (key, latitude, longitude)."""
+        self.cell_degrees = cell_degrees
+        self._columns = max(1, round(360.0 / cell_degrees))
+        self._cells = {}   # (row, col) -> [(key, lat, lng)]
+        self._points = {}  # key -> (lat, lng)
+        for key, lat, lng in points:
+            self._points[key] = (lat, lng)
+            self._cells.setdefault(self._cell(lat, lng), []).append((key, lat, lng))
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees) % self._columns
+
+    def location(self, key):
+        return self._points.get(key)
+
+    def _candidates(self, lat, lng, radius_m):
+        dlat = radius_m / METERS_PER_DEGREE
+        # Longitude degrees shrink towards the poles; size the box for its widest latitude
+        cos_lat = math.cos(math.radians(min(90.0, abs(lat) + dlat)))
+        dlng = dlat / cos_lat if cos_lat > 1e-9 else 360.0
+        rows = range(math.floor((lat - dlat) / self.cell_degrees), math.floor((lat + dlat) / self.cell_degrees) + 1)
+        cols = range(math.floor((lng - dlng) / self.cell_degrees), math.floor((lng + dlng) / self.cell_degrees) + 1)
+        if dlng >= 180.0 or len(rows) * len(cols) > len(self._cells):
+            for points in self._cells.values():  # box covers most of the grid anyway
+                yield from points
+            return
+        for row in rows:
+            for col in cols:
+                yield from self._cells.get((row, col % self._columns), ())
+
+    def nearby(self, lat, lng, radius_m, limit=None):
+        """[(distance_m, key), ...] within radius_m, nearest first (at most `limit`)."""
+        hits = []
+        for key, plat, plng in self._candidates(lat, lng, radius_m):
+            d = distance_m(lat, lng, plat, plng)
+            if d <= radius_m:
+                hits.append((d, key))
+        if limit is not None and limit < len(hits):
+            return heapq.nsmallest(limit, hits)
+        hits.sort()
+        return hits
+
+    def within(self, key, lat, lng, radius_m):
+        """True/False whether `key` is within radius_m of (lat, lng); None if it has no location."""
+        point = self._points.get(key)
+        if point is None:
+            return None
+        # Cheap bounding-box rejection before the trigonometry
+        if abs(point[0] - lat) * METERS_PER_DEGREE > radius_m:
+            return False
+        return distance_m(lat, lng, point[0], point[1]) <= radius_m
+
+
+class LotLocations:
+    def __init__(self, loader, max_age=300.0, cell_degrees=0.01, clock=time.monotonic):
+        """
+        Args:
+            loader: fn() -> [{"name", "latitude", "longitude"}, ...] (rows without coordinates are skipped)
+            max_age: seconds before the index is rebuilt from the loader
+        """
+        self._loader = loader
+        self.max_age = max_age
+        self.cell_degrees = cell_degrees
+        self._clock = clock
+        self._index = None
+        self._built_at = float("-inf")
+        self._names = frozenset()  # every lot in the last load, with coordinates or not
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        rows = list(self._loader())
+        index = GridIndex(((row["name"], float(row["latitude"]), float(row["longitude"]))
+                           for row in rows
+                           if row.get("latitude") is not None and row.get("longitude") is not None),
+                          self.cell_degrees)
+        self._index, self._built_at = index, self._clock()
+        self._names = frozenset(row["name"] for row in rows)
+        log.debug("Indexed %d lot locations", len(index))
+        return index
+
+    def invalidate(self):
+        self._built_at = float("-inf")
+
+    def notice(self, lot_names):
+        """Rebuild on next use if any of `lot_names` (e.g. from a lots listing) wasn't in the last load."""
+        if self._index is not None and not self._names.issuperset(lot_names):
+            self.invalidate()
+
+    def index(self):
+        """Current index; rebuilt by one caller once stale while others keep using the old one."""
+        index = self._index
+        if index is not None and self._clock() - self._built_at < self.max_age:
+            return index
+        if not self._lock.acquire(blocking=index is None):
+            return index
+        try:
+            if self._index is not None and self._clock() - self._built_at < self.max_age:
+                return self._index
+            try:
+                return self.refresh()
+            except Exception as e:
+                if index is None:
+                    raise
+                log.warning("⚠️  Could not refresh lot locations, keeping the old index: %s", e)
+                self._built_at = self._clock()
+                return index
+        finally:
+            self._lock.release()
+
+    def nearby(self, lat, lng, radius_m, limit=None):
+        return self.index().nearby(lat, lng, radius_m, limit)
+
+    def within(self, lot_name, lat, lng, radius_m):
+        return self.index().within(lot_name, lat, lng, radius_m)
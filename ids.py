@@ -0,0 +1,71 @@
+"""
+ids.py
+Collision-free 63-bit ids for rows the app creates (schedules).
+
+Layout (Snowflake-style): 41 bits of milliseconds since ID_EPOCH_MS,
+10 bits of worker id and 12 bits of per-millisecond sequence. Ids are
+unique across restarts (time moves forward) and across processes as long
+as each process has a distinct worker id: WORKER_ID when set, otherwise
+one leased on first use (app.py claims the lowest free "worker-id-<n>"
+lease through leases.py, and stops issuing ids if it loses the lease).
+"""
+
+import os
+import threading
+import time
+
+ID_EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+
+def check_worker_id(worker_id):
+    if not 0 <= worker_id <= MAX_WORKER_ID:
+        raise ValueError(f"worker_id must be between 0 and {MAX_WORKER_ID}")
+    return worker_id
+
+
+class IdGenerator:
+    def __init__(self, worker_id=None, claim=None):
+        """
+        Args:
+            worker_id: this process's worker id (default: WORKER_ID, else `claim`)
+            claim: fn() -> (worker_id, lease) run on first use; ids stop while
+                lease.is_leader is False, since another process may hold the id
+        """
+        if worker_id is None and os.getenv("WORKER_ID"):
+            worker_id = int(os.getenv("WORKER_ID"))
+        if worker_id is None and claim is None:
+            raise ValueError("Set WORKER_ID (distinct per process) or pass a worker id claim")
+        self.worker_id = check_worker_id(worker_id) if worker_id is not None else None
+        self._claim = claim
+        self._lease = None
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_id(self):
+        with self._lock:
+            if self.worker_id is None:
+                self.worker_id, self._lease = self._claim()
+                check_worker_id(self.worker_id)
+            if self._lease is not None and not self._lease.is_leader:
+                raise RuntimeError(f"Lost the lease on worker id {self.worker_id}; not issuing ids")
+            now_ms = int(time.time() * 1000)
+            if now_ms < self._last_ms:
+                # Clock stepped backwards - keep issuing from the last timestamp
+                now_ms = self._last_ms
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond - wait for the next one
+                    while now_ms <= self._last_ms:
+                        time.sleep(0.0001)
+                        now_ms = int(time.time() * 1000)
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return ((now_ms - ID_EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS)) \
+                | (self.worker_id << SEQUENCE_BITS) | self._sequence
@@ -0,0 +1,230 @@
+"""
+leases.py
+Leader election for background jobs that must run exactly once across
+worker processes (schedule expiry, the CV service).
+
+    LEADER_ELECTION=file  flock on LEASE_DIR/<job>.lock - one host (default)
+    LEADER_ELECTION=db    lease row in the datastore with a TTL - any number of hosts
+    LEADER_ELECTION=none  every process leads (single-process deployments)
+
+Each job gets a LeaderElector thread that acquires or renews its lease
+every `heartbeat` seconds. Winning calls on_elected(); losing the lease,
+or failing to renew it for long enough that it may expire, calls
+on_demoted() so the old leader stops before another can take over. A
+crashed leader's file lock is released by the OS at once; its DB lease
+expires after `ttl`.
+"""
+
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+
+import metrics
+
+log = logging.getLogger("parkabull.leases")
+
+LEADER = metrics.REGISTRY.gauge(
+    "parkabull_leader",
+    "1 while this process leads the background job",
+    ("job",),
+)
+LEADER_CHANGES = metrics.REGISTRY.counter(
+    "parkabull_leader_changes_total",
+    "Leadership gained/lost by job",
+    ("job", "event"),
+)
+
+_electors = []
+LEADER.set_function(lambda: {(e.job,): int(e.is_leader) for e in list(_electors)})
+
+
+class FileLockBackend:
+    """flock()-based leases: held for as long as this process keeps the file open."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._files = {}
+
+    def acquire(self, job, holder, ttl):
+        import fcntl
+
+        f = self._files.get(job)
+        if f is None:
+            f = open(os.path.join(self.directory, f"{job}.lock"), "a+")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return False
+            self._files[job] = f
+        # Heartbeat: who holds it and when it was last renewed, for operators
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps({"holder": holder, "renewed_at": time.time()}))
+        f.flush()
+        return True
+
+    def release(self, job, holder):
+        import fcntl
+
+        f = self._files.pop(job, None)
+        if f is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+
+class RepositoryLeaseBackend:
+    """Lease rows in the datastore (see repository.acquire_lease)."""
+
+    def __init__(self, repository):
+        self.repository = repository
+        # Longest one acquire can take before it fails (its own short policy, see repository.py)
+        self.timeout = getattr(repository, "lease_timeout", 0.0)
+
+    def acquire(self, job, holder, ttl):
+        return self.repository.acquire_lease(job, holder, ttl)
+
+    def release(self, job, holder):
+        self.repository.release_lease(job, holder)
+
+
+class LocalBackend:
+    """No coordination: every process is the leader."""
+
+    def acquire(self, job, holder, ttl):
+        return True
+
+    def release(self, job, holder):
+        pass
+
+
+def create_backend(repository, kind=None):
+    kind = (kind or os.getenv("LEADER_ELECTION", "file")).lower()
+    if kind == "file":
+        return FileLockBackend(os.getenv("LEASE_DIR", os.path.join(tempfile.gettempdir(), "parkabull-leases")))
+    if kind == "db":
+        return RepositoryLeaseBackend(repository)
+    if kind == "none":
+        return LocalBackend()
+    raise ValueError(f"Unknown LEADER_ELECTION {kind!r}; expected 'file', 'db' or 'none'")
+
+
+def claim_slot(prefix, backend, slots, **elector_args):
+    """
+    Lease the lowest free of `slots` numbered jobs ("<prefix>-<n>") and keep
+    renewing it. Returns (n, elector); watch elector.is_leader to know the
+    slot is still ours. Raises RuntimeError if every slot is taken.
+    """
+    for slot in range(slots):
+        elector = LeaderElector(f"{prefix}-{slot}", backend, on_elected=lambda: None, **elector_args)
+        # Unlike step(), let a datastore error propagate instead of trying every slot
+        if backend.acquire(elector.job, elector.holder, elector.ttl):
+            elector.step()
+            elector.start()
+            return slot, elector
+        _electors.remove(elector)
+    raise RuntimeError(f"All {slots} {prefix} leases are taken")
+
+
+class LeaderElector:
+    def __init__(self, job, backend, on_elected, on_demoted=None, ttl=15.0, heartbeat=5.0):
+        """
+        Args:
+            job: lease name, the same in every process competing for it
+            on_elected / on_demoted: called on the elector thread when leadership changes
+            ttl: seconds a DB lease stays valid without a renewal
+            heartbeat: seconds between acquire/renew attempts (well under ttl)
+        """
+        self.job = job
+        self.backend = backend
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        self._leader = False
+        self._renewed_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        _electors.append(self)
+
+    @property
+    def is_leader(self):
+        return self._leader
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"leader_{self.job}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Step down (running on_demoted) and release the lease so another process can take over."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.heartbeat + 5)
+            self._thread = None
+        if self._leader:
+            self._demote("stopping")
+        try:
+            self.backend.release(self.job, self.holder)
+        except Exception as e:
+            log.warning("⚠️  Could not release %s lease: %s", self.job, e)
+
+    def _run(self):
+        while True:
+            self.step()
+            if self._stop.wait(self.heartbeat):
+                return
+
+    def step(self):
+        """One acquire/renew attempt."""
+        started = time.monotonic()
+        try:
+            won = self.backend.acquire(self.job, self.holder, self.ttl)
+        except Exception as e:
+            log.warning("⚠️  %s lease renewal failed: %s", self.job, e)
+            # Keep leading only while the lease we last wrote is certainly still ours when the
+            # next attempt has failed too (a heartbeat plus one backend timeout from now); it
+            # runs from when the last successful renewal started, not from this failure
+            grace = self.ttl - self.heartbeat - getattr(self.backend, "timeout", 0.0)
+            if self._leader and time.monotonic() - self._renewed_at >= grace:
+                self._demote("lease renewal failing")
+            return
+
+        if won:
+            self._renewed_at = started
+            if not self._leader:
+                self._elect()
+        elif self._leader:
+            self._demote("lease lost")
+
+    def _elect(self):
+        self._leader = True
+        LEADER_CHANGES.inc(job=self.job, event="elected")
+        log.info("👑 Elected leader for %s (%s)", self.job, self.holder)
+        try:
+            self._on_elected()
+        except Exception as e:
+            log.exception("❌ Starting %s failed, giving up leadership: %s", self.job, e)
+            self._demote("start failed")
+            try:
+                self.backend.release(self.job, self.holder)
+            except Exception:
+                pass  # the lease expires on its own
+
+    def _demote(self, reason):
+        self._leader = False
+        LEADER_CHANGES.inc(job=self.job, event="demoted")
+        log.warning("⚠️  No longer leader for %s (%s)", self.job, reason)
+        if self._on_demoted is not None:
+            try:
+                self._on_demoted()
+            except Exception as e:
+                log.exception("❌ Stopping %s failed: %s", self.job, e)
@@ -0,0 +1,336 @@
+"""
+loadtest.py
+Load generator for the /api routes.
+
+By default it seeds a throwaway SQLite datastore (DATASTORE=sqlite) with
+--lots lots and --schedules departures, imports the real Flask app
+against it and drives it in-process through one test client per worker
+thread, so the numbers cover routing, handlers, caches and the datastore
+without any network. Pass --url to aim the same mix at a running server
+(app.py or `uvicorn asgi:app`) over keep-alive HTTP instead.
+
+    python loadtest.py --lots 20 --schedules 100000 --concurrency 16 --duration 30 \
+        --mix fetch_occupancy=70,fetch_all_lots=5,leaving_soon=15,submit_schedule=10
+
+Reports throughput, p50/p95/p99/max latency and error rate per route
+(--json for machine-readable output).
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Seeded lots are scattered around this point (UB North Campus)
+CENTER = (43.0008, -78.7890)
+SPREAD_DEGREES = 0.03
+
+DEFAULT_MIX = "fetch_occupancy=70,fetch_all_lots=5,leaving_soon=15,submit_schedule=10"
+
+
+# ============================================
+# REQUESTS
+# ============================================
+
+def random_time(rng):
+    return f"{rng.randrange(24):02d}:{rng.randrange(60):02d}:00"
+
+
+def fetch_occupancy(rng, lots):
+    return "GET", f"/api/lot/{rng.choice(lots)}", None
+
+
+def fetch_all_lots(rng, lots):
+    return "GET", "/api/lots", None
+
+
+def leaving_soon(rng, lots):
+    return "POST", "/api/leaving-soon", {"lot_name": rng.choice(lots)}
+
+
+def submit_schedule(rng, lots):
+    return "POST", "/api/submit-schedule", {"lot_name": rng.choice(lots), "departure_time": random_time(rng)}
+
+
+def submit_schedules(rng, lots):
+    return "POST", "/api/submit-schedules", {"schedules": [
+        {"lot_name": rng.choice(lots), "departure_time": random_time(rng)} for _ in range(10)
+    ]}
+
+
+def live_cv_data(rng, lots):
+    return "GET", "/api/lot/live-cv-data", None
+
+
+def random_location(rng):
+    return (CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+            CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES))
+
+
+def lots_nearby(rng, lots):
+    lat, lng = random_location(rng)
+    return "GET", f"/api/lots/nearby?lat={lat:.6f}&lng={lng:.6f}&radius=1000", None
+
+
+ROUTES = {f.__name__: f for f in (fetch_occupancy, fetch_all_lots, leaving_soon,
+                                  submit_schedule, submit_schedules, live_cv_data, lots_nearby)}
+
+
+def parse_mix(spec):
+    """"route=weight,..." -> [(route, weight), ...]"""
+    mix = []
+    for part in spec.split(","):
+        route, _, weight = part.strip().partition("=")
+        if route not in ROUTES:
+            raise ValueError(f"Unknown route {route!r}; expected one of {', '.join(ROUTES)}")
+        mix.append((route, float(weight or 1)))
+    return mix
+
+
+# ============================================
+# TRANSPORTS
+# ============================================
+
+class InProcessTransport:
+    """Flask test client: full request handling, no sockets."""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, body, headers):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        response.close()
+        return response.status_code, response.headers.get("ETag")
+
+
+class HttpTransport:
+    """One keep-alive connection per worker to a running server."""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+    def request(self, method, path, body, headers):
+        headers = dict(headers)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        try:
+            self.conn.request(method, path, body=payload, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()  # reconnect on the next request
+            raise
+        return response.status, response.getheader("ETag")
+
+
+# ============================================
+# DATASET
+# ============================================
+
+def seed_datastore(repository, lot_count, schedule_count, rng):
+    """Create lot_count lots and schedule_count departures spread across them."""
+    from ids import IdGenerator
+
+    ids = IdGenerator(worker_id=0)  # seeding runs alone; the app's later ids are newer anyway
+    lots = []
+    for i in range(lot_count):
+        lat, lng = random_location(rng)
+        lots.append(repository.create_lot(f"Lot {i}", max_occupancy=rng.randint(50, 500), latitude=lat, longitude=lng))
+    for lot in lots:
+        repository.set_occupancy(lot["name"], rng.randint(0, lot["max_occupancy"]))
+
+    batch = []
+    for _ in range(schedule_count):
+        batch.append({"id": ids.next_id(), "lot_id": rng.choice(lots)["id"], "time": random_time(rng)})
+        if len(batch) >= 5000:
+            repository.insert_schedules(batch)
+            batch = []
+    if batch:
+        repository.insert_schedules(batch)
+    return [lot["name"] for lot in lots]
+
+
+def load_local_app(args, rng):
+    """Point app.py at a fresh SQLite file, seed it, and return (flask app, lot names)."""
+    workdir = tempfile.mkdtemp(prefix="parkabull-loadtest-")
+    os.environ["DATASTORE"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(workdir, "loadtest.db")
+    os.environ["SCHEDULER_JOURNAL"] = os.path.join(workdir, "scheduler_journal.json")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    import app as wsgi
+
+    started = time.perf_counter()
+    lots = seed_datastore(wsgi.REPOSITORY, args.lots, args.schedules, rng)
+    print(f"Seeded {args.lots} lots / {args.schedules} schedules in "
+          f"{time.perf_counter() - started:.1f}s ({os.environ['SQLITE_PATH']})", file=sys.stderr)
+
+    # Timers and write-behind as in production; the CV worker stays off
+    wsgi.EXPIRY.start()
+    wsgi.LEAVING_SOON.start()
+    return wsgi, lots
+
+
+# ============================================
+# RUN
+# ============================================
+
+class RouteStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.not_modified = 0
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def worker(transport, mix, lots, args, seed, stats, stop):
+    rng = random.Random(seed)
+    routes = [route for route, _ in mix]
+    weights = [weight for _, weight in mix]
+    etags = {}  # path -> last ETag, replayed as If-None-Match with --conditional
+    sent = 0
+    while not stop.is_set() and (args.requests is None or sent < args.requests):
+        route = rng.choices(routes, weights)[0]
+        method, path, body = ROUTES[route](rng, lots)
+        headers = {}
+        if args.conditional and method == "GET" and path in etags:
+            headers["If-None-Match"] = etags[path]
+
+        started = time.perf_counter()
+        try:
+            status, etag = transport.request(method, path, body, headers)
+            failed = status >= 400
+        except Exception:
+            status, etag, failed = None, None, True
+        elapsed = time.perf_counter() - started
+
+        route_stats = stats.setdefault(route, RouteStats())
+        route_stats.latencies.append(elapsed)
+        if failed:
+            route_stats.errors += 1
+        elif status == 304:
+            route_stats.not_modified += 1
+        if etag:
+            etags[path] = etag
+        sent += 1
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+
+    if args.url:
+        lots = args.lot_names.split(",") if args.lot_names else ["Furnas"]
+        make_transport = lambda: HttpTransport(args.url)
+        wsgi = None
+    else:
+        wsgi, lots = load_local_app(args, rng)
+        make_transport = lambda: InProcessTransport(wsgi.app)
+
+    per_worker = [{} for _ in range(args.concurrency)]
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=worker, name=f"loadtest-{i}", daemon=True,
+                         args=(make_transport(), mix, lots, args, args.seed + i + 1, per_worker[i], stop))
+        for i in range(args.concurrency)
+    ]
+
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    deadline = started + args.duration if args.requests is None else None
+    for t in threads:
+        t.join(None if deadline is None else max(0.0, deadline - time.perf_counter()))
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    if wsgi is not None:
+        wsgi.LEAVING_SOON.stop()
+        wsgi.EXPIRY.stop()
+
+    return summarize(per_worker, elapsed)
+
+
+def summarize(per_worker, elapsed):
+    merged = {}
+    for stats in per_worker:
+        for route, s in stats.items():
+            m = merged.setdefault(route, RouteStats())
+            m.latencies.extend(s.latencies)
+            m.errors += s.errors
+            m.not_modified += s.not_modified
+
+    report = {"duration": round(elapsed, 3), "routes": {}}
+    total = 0
+    for route, s in sorted(merged.items()):
+        latencies = sorted(s.latencies)
+        count = len(latencies)
+        total += count
+        report["routes"][route] = {
+            "requests": count,
+            "rps": round(count / elapsed, 1) if elapsed else 0.0,
+            "errors": s.errors,
+            "error_rate": round(s.errors / count, 4) if count else 0.0,
+            "not_modified": s.not_modified,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        }
+    report["requests"] = total
+    report["rps"] = round(total / elapsed, 1) if elapsed else 0.0
+    return report
+
+
+def print_report(report):
+    header = f"{'route':<18}{'reqs':>9}{'rps':>10}{'err%':>8}{'304':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for route, r in report["routes"].items():
+        print(f"{route:<18}{r['requests']:>9}{r['rps']:>10}{r['error_rate'] * 100:>8.2f}{r['not_modified']:>8}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+    print("-" * len(header))
+    print(f"{'total':<18}{report['requests']:>9}{report['rps']:>10}   in {report['duration']}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the ParkABull /api routes")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"route=weight list (routes: {', '.join(ROUTES)})")
+    parser.add_argument("--concurrency", type=int, default=8, help="worker threads")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=None, help="requests per worker (overrides --duration)")
+    parser.add_argument("--lots", type=int, default=10, help="lots to seed")
+    parser.add_argument("--schedules", type=int, default=10000, help="schedule rows to seed")
+    parser.add_argument("--conditional", action="store_true", help="replay ETags as If-None-Match like pollers do")
+    parser.add_argument("--url", help="target a running server instead of the in-process app")
+    parser.add_argument("--lot-names", help="comma-separated lot names to use with --url")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
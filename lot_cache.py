@@ -0,0 +1,139 @@
+"""
+lot_cache.py
+Read-through, in-process cache of per-lot state (id, occupancy, capacity
+and leaving-soon count).
+
+- Entries expire after a TTL so writes made by other processes are
+  eventually picked up.
+- Concurrent misses for the same lot share a single load (single-flight).
+- Writers in this process update entries in place (`update`) or drop them
+  (`invalidate`), so steady-state reads never leave the process.
+- When a load fails (datastore down, circuit open) and the lot was cached
+  before, the expired entry is served instead (stale-if-error).
+"""
+
+import threading
+import time
+
+import metrics
+
+LOT_CACHE_REQUESTS = metrics.REGISTRY.counter(
+    "parkabull_lot_cache_requests_total",
+    "Lot cache lookups by result (hit, miss, shared, stale)",
+    ("result",),
+)
+
+
+class _Flight:
+    """A load in progress that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class LotCache:
+    def __init__(self, loader, ttl=10.0, clock=time.monotonic):
+        """
+        Args:
+            loader: fn(lot_name) -> dict of lot state, or None if the lot doesn't exist
+            ttl: seconds an entry stays valid without being refreshed
+        """
+        self._loader = loader
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}      # lot_name -> (expires_at, state)
+        self._flights = {}      # lot_name -> _Flight
+        self._generations = {}  # lot_name -> int, bumped on every write
+
+    def get(self, lot_name):
+        """Return a copy of the lot's state, loading it at most once concurrently."""
+        with self._lock:
+            entry = self._entries.get(lot_name)
+            if entry is not None and entry[0] > self._clock():
+                LOT_CACHE_REQUESTS.inc(result="hit")
+                return dict(entry[1])
+
+            flight = self._flights.get(lot_name)
+            leader = flight is None
+            if leader:
+                flight = self._flights[lot_name] = _Flight()
+                generation = self._generations.get(lot_name, 0)
+
+        if not leader:
+            LOT_CACHE_REQUESTS.inc(result="shared")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return dict(flight.value) if flight.value is not None else None
+
+        LOT_CACHE_REQUESTS.inc(result="miss")
+        stale = False
+        try:
+            flight.value = self._loader(lot_name)
+        except Exception as e:
+            flight.value = self.last_known(lot_name)
+            if flight.value is None:
+                flight.error = e
+                raise
+            stale = True
+            LOT_CACHE_REQUESTS.inc(result="stale")
+        finally:
+            with self._lock:
+                # Don't store a result that a concurrent write has already made stale
+                # (or a stale fallback, so the next read tries the loader again)
+                if (flight.error is None and flight.value is not None and not stale
+                        and self._generations.get(lot_name, 0) == generation):
+                    self._entries[lot_name] = (self._clock() + self.ttl, flight.value)
+                del self._flights[lot_name]
+            flight.done.set()
+
+        return dict(flight.value) if flight.value is not None else None
+
+    def peek(self, lot_name):
+        """Return the cached state without loading, or None."""
+        with self._lock:
+            entry = self._entries.get(lot_name)
+            if entry is not None and entry[0] > self._clock():
+                return dict(entry[1])
+        return None
+
+    def last_known(self, lot_name):
+        """The lot's cached state even if expired (last-known-good), or None."""
+        with self._lock:
+            entry = self._entries.get(lot_name)
+            return dict(entry[1]) if entry is not None else None
+
+    def last_known_all(self):
+        """{lot_name: state} for every cached lot, expired or not."""
+        with self._lock:
+            return {name: dict(entry[1]) for name, entry in self._entries.items()}
+
+    def prime(self, lot_name, state):
+        """Store state fetched elsewhere (e.g. a bulk query) as a fresh entry."""
+        with self._lock:
+            if lot_name not in self._flights:
+                self._entries[lot_name] = (self._clock() + self.ttl, dict(state))
+
+    def update(self, lot_name, **fields):
+        """Apply a write to the cached entry in place (no-op if not cached)."""
+        with self._lock:
+            self._generations[lot_name] = self._generations.get(lot_name, 0) + 1
+            entry = self._entries.get(lot_name)
+            if entry is not None:
+                state = dict(entry[1])
+                state.update(fields)
+                self._entries[lot_name] = (entry[0], state)
+
+    def invalidate(self, lot_name=None):
+        """Drop one lot's entry, or every entry when lot_name is None."""
+        with self._lock:
+            if lot_name is None:
+                for name in list(self._entries) + list(self._flights):
+                    self._generations[name] = self._generations.get(name, 0) + 1
+                self._entries.clear()
+            else:
+                self._generations[lot_name] = self._generations.get(lot_name, 0) + 1
+                self._entries.pop(lot_name, None)
@@ -0,0 +1,307 @@
+"""
+metrics.py
+In-process metrics registry (counters, gauges, histograms) rendered in the
+Prometheus text exposition format for the /api/metrics endpoint.
+"""
+
+import bisect
+import math
+import threading
+import time
+
+# Latency buckets in seconds - covers fast in-process work up to slow remote inference
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        """Yield (suffix, labelvalues, extra_label, value) tuples."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for suffix, labelvalues, extra, value in self._samples():
+            labels = _format_labels(self.labelnames, labelvalues, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing value."""
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield "", key, None, value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed at scrape time."""
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def set_function(self, function):
+        """
+        Compute the gauge at scrape time.
+        `function` returns a dict mapping label-value tuples to values.
+        """
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            items = sorted(self._function().items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        for key, value in items:
+            yield "", key, None, value
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._start
+        self._histogram.observe(self.duration, **self._labels)
+        return False
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets."""
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Context manager that observes the elapsed wall time of its block."""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield "_bucket", key, ("le", _format_value(float(bound))), cumulative
+            yield "_sum", key, None, total
+            yield "_count", key, None, count
+
+
+class Registry:
+    """Holds every metric and renders them for scraping."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None:
+                if not isinstance(existing, cls) or existing.labelnames != tuple(labelnames):
+                    raise ValueError(f"Metric {name} already registered with a different shape")
+                return existing
+            metric = cls(name, documentation, labelnames, **kwargs)
+            self._metrics[name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ============================================
+# APPLICATION METRICS
+# ============================================
+HTTP_REQUEST_LATENCY = REGISTRY.histogram(
+    "parkabull_http_request_duration_seconds",
+    "Latency of /api requests by route",
+    ("route", "method", "status"),
+)
+INFERENCE_LATENCY = REGISTRY.histogram(
+    "parkabull_inference_duration_seconds",
+    "Latency of remote inference calls by model",
+    ("model",),
+)
+INFERENCE_ERRORS = REGISTRY.counter(
+    "parkabull_inference_errors_total",
+    "Failed inference calls by model",
+    ("model",),
+)
+DB_LATENCY = REGISTRY.histogram(
+    "parkabull_db_duration_seconds",
+    "Latency of Supabase calls by table and operation",
+    ("table", "operation"),
+)
+DB_ERRORS = REGISTRY.counter(
+    "parkabull_db_errors_total",
+    "Failed Supabase calls by table and operation",
+    ("table", "operation"),
+)
+CV_FRAMES_DECODED = REGISTRY.counter(
+    "parkabull_cv_frames_decoded_total",
+    "Video frames decoded by the CV service",
+    ("lot",),
+)
+CV_FRAMES_ANALYZED = REGISTRY.counter(
+    "parkabull_cv_frames_analyzed_total",
+    "Video frames analyzed by the CV service",
+    ("lot",),
+)
+CV_FRAMES_DROPPED = REGISTRY.counter(
+    "parkabull_cv_frames_dropped_total",
+    "Sampled frames skipped because every frame ring slot was busy",
+    ("lot",),
+)
+CV_SAMPLE_INTERVAL = REGISTRY.gauge(
+    "parkabull_cv_sample_interval_seconds",
+    "Current adaptive sampling interval per lot, in seconds of video",
+    ("lot",),
+)
+CV_PRIORITY = REGISTRY.gauge(
+    "parkabull_cv_priority",
+    "Inference budget priority per lot (traffic + staleness + fullness)",
+    ("lot",),
+)
+CV_SOURCE_RECONNECTS = REGISTRY.counter(
+    "parkabull_cv_source_reconnects_total",
+    "Times a live CV source was reopened after failing or ending",
+    ("lot",),
+)
+CV_FRAME_LAG = REGISTRY.histogram(
+    "parkabull_cv_frame_lag_seconds",
+    "Time from capturing a frame (decode, or grab for live sources) to publishing its occupancy",
+    ("lot",),
+)
+LOT_LAST_UPDATE = REGISTRY.gauge(
+    "parkabull_lot_occupancy_last_update_timestamp_seconds",
+    "Unix time of the last successful occupancy write per lot",
+    ("lot",),
+)
+LOT_STALENESS = REGISTRY.gauge(
+    "parkabull_lot_occupancy_staleness_seconds",
+    "Seconds since the last successful occupancy write per lot",
+    ("lot",),
+)
+
+
+def _lot_staleness():
+    now = time.time()
+    with LOT_LAST_UPDATE._lock:
+        updates = dict(LOT_LAST_UPDATE._values)
+    return {key: now - updated_at for key, updated_at in updates.items()}
+
+
+LOT_STALENESS.set_function(_lot_staleness)
+
+
+def mark_lot_updated(lot_name):
+    """Record that a lot's occupancy was just written."""
+    LOT_LAST_UPDATE.set(time.time(), lot=lot_name)
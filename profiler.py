@@ -0,0 +1,153 @@
+"""
+profiler.py
+On-demand stack-sampling profiler covering every thread in the process
+(Flask handlers, cv_ipc_conn, expiry_scheduler, ...). Decoding and
+inference run in cv_service.py, so /api/admin/profile?process=cv asks
+that process to sample its own threads (decoders, cv_publisher) and
+relays the result over cv_ipc; its inference worker processes aren't
+covered.
+
+A sampler thread snapshots `sys._current_frames()` at a fixed interval and
+aggregates the stacks, so nothing has to be installed or restarted. Output
+is collapsed-stack text (one "thread;outer;...;inner count" line per
+unique stack, ready for flamegraph.pl / speedscope) plus a per-function
+self-time summary.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_DURATION = 120.0  # seconds
+MIN_INTERVAL = 0.001  # seconds
+MAX_STACK_DEPTH = 128
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _collect_stack(frame):
+    stack = []
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def sample(duration, interval=0.005, include_idle=False):
+    """
+    Sample all threads for `duration` seconds, every `interval` seconds.
+
+    Returns a dict with the collapsed stacks and a per-function summary.
+    Threads parked in a blocking call still show up (their Python frame is
+    the caller); pass include_idle=False to drop samples whose leaf is a
+    known wait primitive so the summary focuses on CPU-bound work.
+    """
+    duration = min(max(float(duration), 0.0), MAX_DURATION)
+    interval = max(float(interval), MIN_INTERVAL)
+
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+
+    try:
+        own_ident = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        started = time.perf_counter()
+        deadline = started + duration
+        next_tick = started
+
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = _collect_stack(frame)
+                if not include_idle and stack and _is_idle(stack[-1]):
+                    continue
+                thread_name = names.get(ident, f"thread-{ident}")
+                stacks[(thread_name, *stack)] += 1
+            samples += 1
+            next_tick += interval
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+
+        elapsed = time.perf_counter() - started
+    finally:
+        _profile_lock.release()
+
+    return {
+        "duration": round(elapsed, 3),
+        "interval": interval,
+        "samples": samples,
+        "collapsed": render_collapsed(stacks),
+        "functions": summarize(stacks, interval),
+        "threads": summarize_threads(stacks, interval),
+    }
+
+
+_IDLE_FUNCTIONS = ("wait (threading.py", "select (selectors.py", "accept (socket.py",
+                   "_worker (thread.py", "get (queue.py", "serve_forever (socketserver.py")
+
+
+def _is_idle(label):
+    return label.startswith(_IDLE_FUNCTIONS)
+
+
+def render_collapsed(stacks):
+    """Brendan Gregg collapsed format: 'frame;frame;frame count' per line."""
+    lines = []
+    for stack, count in stacks.most_common():
+        lines.append(";".join(part.replace(";", ":") for part in stack) + f" {count}")
+    return "\n".join(lines) + ("\n" if lines else "")
+
+
+def summarize(stacks, interval, limit=50):
+    """Per-function self (leaf) and total (anywhere on stack) time."""
+    self_counts = Counter()
+    total_counts = Counter()
+    total_samples = sum(stacks.values()) or 1
+
+    for stack, count in stacks.items():
+        frames = stack[1:]  # drop the thread name
+        if not frames:
+            continue
+        self_counts[frames[-1]] += count
+        for label in set(frames):
+            total_counts[label] += count
+
+    return [
+        {
+            "function": label,
+            "self_samples": count,
+            "self_seconds": round(count * interval, 4),
+            "self_percent": round(100.0 * count / total_samples, 2),
+            "total_samples": total_counts[label],
+            "total_seconds": round(total_counts[label] * interval, 4),
+        }
+        for label, count in self_counts.most_common(limit)
+    ]
+
+
+def summarize_threads(stacks, interval):
+    per_thread = Counter()
+    for stack, count in stacks.items():
+        per_thread[stack[0]] += count
+    return [
+        {"thread": name, "samples": count, "seconds": round(count * interval, 4)}
+        for name, count in per_thread.most_common()
+    ]
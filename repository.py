@@ -0,0 +1,413 @@
+"""
+repository.py
+Data access for the `lots` and `schedules` tables.
+
+    DATASTORE=supabase  the hosted Supabase project (default)
+    DATASTORE=sqlite    an embedded SQLite file (SQLITE_PATH, default "parkabull.db")
+
+Both implementations expose the same operations, so app.py never builds
+queries itself. The SQLite store runs in WAL mode with one connection per
+thread (readers never block the writer) and indexes on lots.name and
+schedules(lot_id, time), which makes single-site deployments read in
+microseconds and lets tests and benchmarks run without a network.
+
+Every call is recorded in DB_LATENCY / DB_ERRORS and traced as a client
+span, whichever backend serves it. Supabase calls also go through a
+resilience.Policy: a per-attempt timeout (SUPABASE_TIMEOUT, cut short by
+the overall SUPABASE_DEADLINE), jittered retries for reads and idempotent
+writes, and a circuit breaker that fails fast (CircuitOpenError) while
+the project is unreachable.
+"""
+
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+import resilience
+import tracing
+
+log = logging.getLogger("parkabull.repository")
+
+DEFAULT_SQLITE_PATH = "parkabull.db"
+SQLITE_BUSY_TIMEOUT = 5.0  # seconds a write waits for the database lock
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))  # seconds per Supabase attempt
+# Lease calls fail fast instead: a renewal must finish well inside the elector's ttl - heartbeat
+LEASE_TIMEOUT = float(os.getenv("LEASE_TIMEOUT", "2"))
+
+# PostgREST caps each response at its max-rows (1000 by default, SUPABASE_PAGE_SIZE if the
+# project sets it lower), so multi-row selects are read in pages of this many
+PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+
+# Repeating these can't apply a change twice, so they're retried
+IDEMPOTENT_OPERATIONS = ("select", "update", "delete")
+
+LOT_COLUMNS = "id, name, occupancy, max_occupancy, leaving_soon"
+LOCATION_COLUMNS = "name, latitude, longitude"
+
+
+@contextlib.contextmanager
+def instrumented(system, table, operation):
+    """Span + latency histogram + error counter around one datastore call."""
+    try:
+        with tracing.span(f"db.{table}.{operation}", kind=tracing.SPAN_KIND_CLIENT,
+                          **{"db.system": system, "db.table": table, "db.operation": operation}), \
+                metrics.DB_LATENCY.time(table=table, operation=operation):
+            yield
+    except Exception:
+        metrics.DB_ERRORS.inc(table=table, operation=operation)
+        raise
+
+
+def lot_state(row):
+    """The per-lot state cached by LOT_CACHE, from a lots row."""
+    return {
+        "id": row["id"],
+        "occupancy": row["occupancy"],
+        "max_occupancy": row["max_occupancy"],
+        "leaving_soon": row.get("leaving_soon") or 0,
+    }
+
+
+def group_times(lot_ids, rows):
+    """{lot_id: [time, ...]} for `lot_ids` from (lot_id, time) rows, skipping nulls."""
+    times_by_lot = {lot_id: [] for lot_id in lot_ids}
+    for row in rows:
+        if row.get("time"):
+            times_by_lot[row["lot_id"]].append(row["time"])
+    return times_by_lot
+
+
+# ============================================
+# SUPABASE
+# ============================================
+
+# Leaving-soon deltas need a Postgres function that applies them atomically, since
+# every API worker flushes its own (LEAVING_SOON_RPC names it):
+#   create function increment_leaving_soon(lot_name text, delta int) returns int
+#   language sql as $$
+#     update lots set leaving_soon = greatest(coalesce(leaving_soon, 0) + delta, 0)
+#     where name = lot_name returning leaving_soon
+#   $$;
+# LEAVING_SOON_RPC=none falls back to a read-modify-write per lot, which loses
+# updates once more than one process writes; only use it with a single API worker.
+DEFAULT_LEAVING_SOON_RPC = "increment_leaving_soon"
+#
+# Leader election with LEADER_ELECTION=db needs a leases table and function:
+#   create table leases (job text primary key, holder text not null, expires_at timestamptz not null);
+#   create function acquire_lease(job_name text, holder_id text, ttl_seconds float) returns boolean
+#   language sql as $$
+#     insert into leases (job, holder, expires_at)
+#     values (job_name, holder_id, now() + make_interval(secs => ttl_seconds))
+#     on conflict (job) do update set holder = excluded.holder, expires_at = excluded.expires_at
+#     where leases.holder = excluded.holder or leases.expires_at < now()
+#     returning true
+#   $$;
+class SupabaseRepository:
+    system = "supabase"
+
+    def __init__(self, client, leaving_soon_rpc=DEFAULT_LEAVING_SOON_RPC, policy=None, lease_policy=None):
+        """
+        Args:
+            client: supabase.Client
+            leaving_soon_rpc: name of a Postgres function(lot_name, delta) -> new count;
+                None applies leaving-soon deltas read-modify-write (single writer only)
+            policy: resilience.Policy for every call (retries, deadline, circuit breaker)
+            lease_policy: resilience.Policy for leader-election leases (defaults to `policy`)
+        """
+        self.client = client
+        self.leaving_soon_rpc = leaving_soon_rpc
+        self.policy = policy or resilience.Policy("supabase")
+        self.lease_policy = lease_policy or self.policy
+        self.deadline = self.policy.deadline or SUPABASE_TIMEOUT  # longest one call can take
+        self.lease_timeout = self.lease_policy.deadline or self.lease_policy.attempt_timeout or 0.0
+
+    def _run(self, table, operation, query, policy=None):
+        def execute():
+            with instrumented(self.system, table, operation):
+                return query.execute()
+        return (policy or self.policy).call(execute, retry=operation in IDEMPOTENT_OPERATIONS)
+
+    def _select_all(self, table, query):
+        """Every row of query() (a fresh, ordered select per call), read PAGE_SIZE rows at a time."""
+        rows = []
+        while True:
+            page = self._run(table, 'select', query().range(len(rows), len(rows) + PAGE_SIZE - 1)).data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+
+    def get_lot(self, name):
+        rows = self._run('lots', 'select', self.client.table('lots') \
+            .select(LOT_COLUMNS) \
+            .eq('name', name) \
+            .limit(1)).data
+        return rows[0] if rows else None
+
+    def list_lots(self):
+        return self._select_all('lots', lambda: self.client.table('lots').select(LOT_COLUMNS).order('id'))
+
+    def lot_locations(self):
+        return self._select_all('lots', lambda: self.client.table('lots').select(LOCATION_COLUMNS).order('id'))
+
+    def create_lot(self, name, max_occupancy, occupancy=0, latitude=None, longitude=None):
+        row = {'name': name, 'max_occupancy': max_occupancy, 'occupancy': occupancy, 'leaving_soon': 0}
+        if latitude is not None and longitude is not None:
+            row.update(latitude=latitude, longitude=longitude)
+        return self._run('lots', 'insert', self.client.table('lots').insert(row)).data[0]
+
+    def set_occupancy(self, name, occupancy):
+        self._run('lots', 'update', self.client.table('lots').update({'occupancy': occupancy}).eq('name', name))
+
+    def add_leaving_soon(self, name, delta):
+        """Apply a leaving-soon delta (floored at 0); returns the new value."""
+        if self.leaving_soon_rpc:
+            return self._run('lots', 'rpc', self.client.rpc(self.leaving_soon_rpc, {
+                'lot_name': name, 'delta': delta,
+            })).data
+        rows = self._run('lots', 'select', self.client.table('lots').select('leaving_soon').eq('name', name)).data
+        new_value = max((rows[0].get('leaving_soon') or 0) + delta, 0)
+        self._run('lots', 'update', self.client.table('lots').update({'leaving_soon': new_value}).eq('name', name))
+        return new_value
+
+    def schedule_times(self, lot_id):
+        rows = self._select_all('schedules', lambda: self.client.table('schedules') \
+            .select('time') \
+            .eq('lot_id', lot_id) \
+            .order('id'))
+        return [row['time'] for row in rows if row.get('time')]
+
+    def schedule_times_by_lot(self, lot_ids):
+        lot_ids = list(lot_ids)
+        rows = self._select_all('schedules', lambda: self.client.table('schedules') \
+            .select('lot_id, time') \
+            .in_('lot_id', lot_ids) \
+            .order('id'))
+        return group_times(lot_ids, rows)
+
+    def distinct_schedule_times(self):
+        rows = self._select_all('schedules', lambda: self.client.table('schedules').select('time').order('id'))
+        return {row['time'] for row in rows if row.get('time')}
+
+    def insert_schedules(self, rows):
+        """rows: [{'id', 'lot_id', 'time'}, ...] written with one multi-row insert."""
+        self._run('schedules', 'insert', self.client.table('schedules').insert(rows))
+
+    def delete_schedules_before(self, time_of_day):
+        self._run('schedules', 'delete', self.client.table('schedules').delete().lt('time', time_of_day))
+
+    def acquire_lease(self, job, holder, ttl):
+        """Take or renew `job`'s lease for `ttl` seconds; False while someone else holds it."""
+        return bool(self._run('leases', 'rpc', self.client.rpc('acquire_lease', {
+            'job_name': job, 'holder_id': holder, 'ttl_seconds': ttl,
+        }), self.lease_policy).data)
+
+    def release_lease(self, job, holder):
+        self._run('leases', 'delete', self.client.table('leases').delete().eq('job', job).eq('holder', holder),
+                  self.lease_policy)
+
+
+# ============================================
+# SQLITE
+# ============================================
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lots (
+    id            INTEGER PRIMARY KEY,
+    name          TEXT    NOT NULL,
+    occupancy     INTEGER NOT NULL DEFAULT 0,
+    max_occupancy INTEGER NOT NULL DEFAULT 0,
+    leaving_soon  INTEGER NOT NULL DEFAULT 0,
+    latitude      REAL,
+    longitude     REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS lots_name ON lots (name);
+
+CREATE TABLE IF NOT EXISTS schedules (
+    id     INTEGER PRIMARY KEY,
+    lot_id INTEGER NOT NULL REFERENCES lots (id),
+    time   TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS schedules_lot_time ON schedules (lot_id, time);
+CREATE INDEX IF NOT EXISTS schedules_time ON schedules (time);
+
+CREATE TABLE IF NOT EXISTS leases (
+    job        TEXT PRIMARY KEY,
+    holder     TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def normalize_time(value):
+    """"HH:MM" -> "HH:MM:SS" so text comparison orders times like Postgres' time type."""
+    value = str(value)
+    return f"{value}:00" if value.count(":") == 1 else value
+
+
+class SQLiteRepository:
+    system = "sqlite"
+    deadline = SQLITE_BUSY_TIMEOUT  # longest one call can take (waiting for the write lock)
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        # ":memory:" is per-connection, so it gets one shared connection behind a lock
+        self._shared = None
+        self._shared_lock = threading.Lock()
+        if path == ":memory:":
+            self._shared = self._open()
+        with self._connection() as conn:
+            conn.executescript(SQLITE_SCHEMA)
+            # Databases created before lots had coordinates
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(lots)")}
+            for column in ("latitude", "longitude"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE lots ADD COLUMN {column} REAL")
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=self.path != ":memory:", isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextlib.contextmanager
+    def _connection(self):
+        if self._shared is not None:
+            with self._shared_lock:
+                yield self._shared
+            return
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        yield conn
+
+    def _query(self, table, operation, sql, params=()):
+        with instrumented(self.system, table, operation), self._connection() as conn:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+    def _write(self, table, operation, sql, params=(), many=False):
+        """Run one statement in its own transaction; returns (RETURNING rows, lastrowid)."""
+        with instrumented(self.system, table, operation), self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.executemany(sql, params) if many else conn.execute(sql, params)
+                rows = cursor.fetchall()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return rows, cursor.lastrowid
+
+    def get_lot(self, name):
+        rows = self._query('lots', 'select', f"SELECT {LOT_COLUMNS} FROM lots WHERE name = ? LIMIT 1", (name,))
+        return rows[0] if rows else None
+
+    def list_lots(self):
+        return self._query('lots', 'select', f"SELECT {LOT_COLUMNS} FROM lots ORDER BY id")
+
+    def lot_locations(self):
+        return self._query('lots', 'select', f"SELECT {LOCATION_COLUMNS} FROM lots")
+
+    def create_lot(self, name, max_occupancy, occupancy=0, latitude=None, longitude=None):
+        _, lot_id = self._write('lots', 'insert',
+                                "INSERT INTO lots (name, occupancy, max_occupancy, latitude, longitude) "
+                                "VALUES (?, ?, ?, ?, ?)",
+                                (name, occupancy, max_occupancy, latitude, longitude))
+        return {"id": lot_id, "name": name, "occupancy": occupancy,
+                "max_occupancy": max_occupancy, "leaving_soon": 0}
+
+    def set_occupancy(self, name, occupancy):
+        self._write('lots', 'update', "UPDATE lots SET occupancy = ? WHERE name = ?", (occupancy, name))
+
+    def add_leaving_soon(self, name, delta):
+        rows, _ = self._write('lots', 'update',
+                              "UPDATE lots SET leaving_soon = max(leaving_soon + ?, 0) WHERE name = ? "
+                              "RETURNING leaving_soon", (delta, name))
+        return rows[0][0] if rows else 0
+
+    def schedule_times(self, lot_id):
+        rows = self._query('schedules', 'select',
+                           "SELECT time FROM schedules WHERE lot_id = ? ORDER BY time", (lot_id,))
+        return [row['time'] for row in rows]
+
+    def schedule_times_by_lot(self, lot_ids):
+        lot_ids = list(lot_ids)
+        if not lot_ids:
+            return {}
+        placeholders = ", ".join("?" * len(lot_ids))
+        rows = self._query('schedules', 'select',
+                           f"SELECT lot_id, time FROM schedules WHERE lot_id IN ({placeholders})", lot_ids)
+        return group_times(lot_ids, rows)
+
+    def distinct_schedule_times(self):
+        return {row['time'] for row in self._query('schedules', 'select', "SELECT DISTINCT time FROM schedules")}
+
+    def insert_schedules(self, rows):
+        self._write('schedules', 'insert', "INSERT INTO schedules (id, lot_id, time) VALUES (?, ?, ?)",
+                    [(row['id'], row['lot_id'], normalize_time(row['time'])) for row in rows], many=True)
+
+    def delete_schedules_before(self, time_of_day):
+        self._write('schedules', 'delete', "DELETE FROM schedules WHERE time < ?", (normalize_time(time_of_day),))
+
+    def acquire_lease(self, job, holder, ttl):
+        now = time.time()
+        rows, _ = self._write('leases', 'upsert',
+                              "INSERT INTO leases (job, holder, expires_at) VALUES (?, ?, ?) "
+                              "ON CONFLICT (job) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+                              "WHERE leases.holder = excluded.holder OR leases.expires_at < ? "
+                              "RETURNING holder", (job, holder, now + ttl, now))
+        return bool(rows)
+
+    def release_lease(self, job, holder):
+        self._write('leases', 'delete', "DELETE FROM leases WHERE job = ? AND holder = ?", (job, holder))
+
+
+def create_repository(datastore=None):
+    """The repository selected by DATASTORE (supabase|sqlite)."""
+    datastore = (datastore or os.getenv("DATASTORE", "supabase")).lower()
+    if datastore == "sqlite":
+        return SQLiteRepository(os.getenv("SQLITE_PATH", DEFAULT_SQLITE_PATH))
+    if datastore != "supabase":
+        raise ValueError(f"Unknown DATASTORE {datastore!r}; expected 'supabase' or 'sqlite'")
+
+    from supabase import create_client, ClientOptions
+    client = create_client(
+        os.getenv("NEXT_PUBLIC_SUPABASE_URL"),
+        os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY"),
+        options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT),
+    )
+    leaving_soon_rpc = os.getenv("LEAVING_SOON_RPC", DEFAULT_LEAVING_SOON_RPC)
+    if leaving_soon_rpc.lower() == "none":
+        log.warning("⚠️  LEAVING_SOON_RPC=none: leaving-soon counts are read-modify-write; run one API worker")
+        leaving_soon_rpc = None
+    return SupabaseRepository(client, leaving_soon_rpc=leaving_soon_rpc,
+                              policy=supabase_policy(), lease_policy=lease_policy())
+
+
+def supabase_policy():
+    """
+    Retries/deadline/breaker for Supabase calls (SUPABASE_RETRIES,
+    SUPABASE_DEADLINE, SUPABASE_BREAKER_*). Each attempt gets at most
+    SUPABASE_TIMEOUT and never more than what's left of the deadline, so a
+    call returns within SUPABASE_DEADLINE even when every attempt hangs.
+    """
+    # Every Supabase call runs on the policy's pool, so size it for the request threads
+    return resilience.Policy.from_env("supabase", "SUPABASE", attempts=3, deadline=15.0,
+                                      attempt_timeout=SUPABASE_TIMEOUT, max_workers=32)
+
+
+def lease_policy():
+    """
+    One LEASE_TIMEOUT attempt per lease call, no retries: the elector's
+    next heartbeat is the retry, and a renewal that hangs for the normal
+    Supabase deadline would outlast the lease it's renewing.
+    """
+    return resilience.Policy.from_env("supabase_lease", "LEASE", attempts=1, deadline=LEASE_TIMEOUT,
+                                      attempt_timeout=LEASE_TIMEOUT, max_workers=4)
@@ -0,0 +1,279 @@
+"""
+resilience.py
+Deadlines, jittered retries, circuit breakers and hedged calls for the
+remote dependencies (Supabase, Roboflow inference).
+
+A Policy wraps one dependency:
+
+- deadline: total seconds a call may take, retries included
+- attempt_timeout: seconds one attempt may take, cut to what's left of the
+  deadline; enforced by running the attempt on a worker thread, so the
+  deadline holds even while a client sits in its own (longer) timeout.
+  Without it, attempts run inline and the deadline is only checked
+  between them
+- attempts: tries per call, with full-jitter exponential backoff between them
+- breaker: after `failure_threshold` consecutive failures, calls fail fast
+  with CircuitOpenError for `reset_timeout` seconds, then one probe call
+  decides whether to close it again
+- hedge_after: if an attempt hasn't finished after this many seconds, send
+  a duplicate and take whichever answers first (idempotent calls only)
+
+Callers catch the errors and keep serving last-known-good data (LotCache
+stale entries, the last published occupancy) instead of zeros.
+
+Configured per dependency from the environment, e.g. SUPABASE_RETRIES,
+SUPABASE_DEADLINE, SUPABASE_BREAKER_FAILURES, SUPABASE_BREAKER_RESET,
+INFERENCE_TIMEOUT, INFERENCE_HEDGE_AFTER.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+import tracing
+
+log = logging.getLogger("parkabull.resilience")
+
+CALLS = metrics.REGISTRY.counter(
+    "parkabull_dependency_calls_total",
+    "Calls to remote dependencies by outcome (ok, error, timeout, rejected)",
+    ("dependency", "outcome"),
+)
+RETRIES = metrics.REGISTRY.counter(
+    "parkabull_dependency_retries_total",
+    "Retried attempts by dependency",
+    ("dependency",),
+)
+HEDGES = metrics.REGISTRY.counter(
+    "parkabull_dependency_hedges_total",
+    "Hedged attempts by dependency and which attempt answered first",
+    ("dependency", "winner"),
+)
+CIRCUIT_STATE = metrics.REGISTRY.gauge(
+    "parkabull_circuit_state",
+    "Circuit breaker state by dependency (0 closed, 1 half-open, 2 open)",
+    ("dependency",),
+)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """The dependency's breaker is open; the call was not attempted."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """An attempt or the whole call ran past its time budget."""
+
+
+def is_timeout(exc):
+    # httpx/requests/asyncio timeouts don't share a base class
+    return isinstance(exc, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in type(exc).__name__
+
+
+def outcome(exc):
+    return "timeout" if is_timeout(exc) else "error"
+
+
+class CircuitBreaker:
+    def __init__(self, dependency, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.dependency = dependency
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        CIRCUIT_STATE.set(0, dependency=dependency)
+
+    def _set(self, state):
+        if state != self._state:
+            log.warning("⚡ %s circuit %s -> %s", self.dependency, self._state, state)
+            self._state = state
+            CIRCUIT_STATE.set(STATE_VALUES[state], dependency=self.dependency)
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self._set(HALF_OPEN)
+            return self._state
+
+    def allow(self):
+        """Whether a call may go out now (half-open lets one probe through at a time)."""
+        state = self.state
+        with self._lock:
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._set(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+                self._set(OPEN)
+
+
+class Policy:
+    def __init__(self, dependency, deadline=None, attempt_timeout=None, attempts=1, base_delay=0.2,
+                 max_delay=2.0, breaker=None, hedge_after=None, max_workers=8, rng=random):
+        self.dependency = dependency
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self.hedge_after = hedge_after
+        self._rng = rng
+        self._executor = None
+        if attempt_timeout or hedge_after:
+            # Timed-out attempts keep their thread until the client gives up, so leave headroom
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{dependency}_call")
+
+    @classmethod
+    def from_env(cls, dependency, prefix, attempts=1, deadline=None, attempt_timeout=None, max_workers=8):
+        def number(name, default):
+            value = os.getenv(f"{prefix}_{name}")
+            return float(value) if value else default
+
+        hedge_after = number("HEDGE_AFTER", None)
+        return cls(
+            dependency,
+            deadline=number("DEADLINE", deadline),
+            attempt_timeout=number("TIMEOUT", attempt_timeout) if attempt_timeout else None,
+            attempts=int(number("RETRIES", attempts - 1)) + 1,
+            breaker=CircuitBreaker(dependency,
+                                   failure_threshold=int(number("BREAKER_FAILURES", 5)),
+                                   reset_timeout=number("BREAKER_RESET", 30.0)),
+            hedge_after=hedge_after or None,
+            max_workers=max_workers,
+        )
+
+    def _backoff(self, attempt):
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _admit(self):
+        if self.breaker is not None and not self.breaker.allow():
+            CALLS.inc(dependency=self.dependency, outcome="rejected")
+            raise CircuitOpenError(f"{self.dependency} circuit is open")
+
+    def _finish(self, error):
+        if error is None:
+            CALLS.inc(dependency=self.dependency, outcome="ok")
+            if self.breaker is not None:
+                self.breaker.record_success()
+        else:
+            CALLS.inc(dependency=self.dependency, outcome=outcome(error))
+            if self.breaker is not None:
+                self.breaker.record_failure()
+
+    def _retry_delay(self, attempt, attempts, error, deadline):
+        """Seconds to wait before the next attempt, or None to give up."""
+        if attempt + 1 >= attempts or isinstance(error, CircuitOpenError):
+            return None
+        delay = self._backoff(attempt)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        RETRIES.inc(dependency=self.dependency)
+        return delay
+
+    def call(self, fn, retry=True, info=None):
+        """
+        Run fn() under the policy. retry=False for calls that aren't safe to
+        repeat (inserts, increments), which also disables hedging. `info`, if
+        given, receives {"attempts", "hedge_winner"}.
+        """
+        deadline = time.monotonic() + self.deadline if self.deadline else None
+        attempts = self.attempts if retry else 1
+        info = info if info is not None else {}
+        info.update(attempts=0, hedge_winner=None)
+        for attempt in range(attempts):
+            self._admit()
+            info["attempts"] += 1
+            try:
+                result = self._attempt(fn, deadline, hedge=retry, info=info)
+            except Exception as e:
+                self._finish(e)
+                delay = self._retry_delay(attempt, attempts, e, deadline)
+                if delay is None:
+                    raise
+                log.debug("%s attempt %d failed (%s), retrying in %.2fs", self.dependency, attempt + 1, e, delay)
+                time.sleep(delay)
+                continue
+            self._finish(None)
+            return result
+
+    def _attempt(self, fn, deadline, hedge, info):
+        if self._executor is None:
+            return fn()
+        timeout = self.attempt_timeout
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        started = time.monotonic()
+        # Each attempt runs in its own copy of the caller's context, so db.* spans stay in the request's trace
+        pending = {self._executor.submit(tracing.propagate(fn)): "primary"}
+        if hedge and self.hedge_after and (timeout is None or self.hedge_after < timeout):
+            done, _ = wait(pending, timeout=self.hedge_after)
+            if not done:
+                pending[self._executor.submit(tracing.propagate(fn))] = "hedge"
+        error = None
+        while pending:
+            left = None if timeout is None else timeout - (time.monotonic() - started)
+            if left is not None and left <= 0:
+                break
+            done, _ = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                winner = pending.pop(future)
+                if future.exception() is None:
+                    if len(pending) or winner == "hedge":
+                        HEDGES.inc(dependency=self.dependency, winner=winner)
+                        info["hedge_winner"] = winner
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        raise DeadlineExceeded(f"{self.dependency} call exceeded {timeout:.1f}s")
+
+    async def acall(self, fn, retry=True):
+        """Async call(): fn() returns an awaitable. Relies on the client's own timeout per attempt."""
+        deadline = time.monotonic() + self.deadline if self.deadline else None
+        attempts = self.attempts if retry else 1
+        for attempt in range(attempts):
+            self._admit()
+            try:
+                if deadline is not None:
+                    result = await asyncio.wait_for(fn(), max(0.0, deadline - time.monotonic()))
+                else:
+                    result = await fn()
+            except Exception as e:
+                self._finish(e)
+                delay = self._retry_delay(attempt, attempts, e, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._finish(None)
+            return result
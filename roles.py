@@ -0,0 +1,142 @@
+"""
+roles.py
+Process roles and a startup-time/RSS report for each.
+
+    PARKABULL_ROLES=api,scheduler,cv-worker   (default: all three)
+
+    api        serves /api; flushes leaving-soon deltas and reverts its taps
+    scheduler  schedule expiry: deletes past departures and re-arms timers
+    cv-worker  launches/listens to cv_service.py (the only role that loads
+               OpenCV, numpy and the inference SDK - in the service process)
+
+Scaled-out web workers run PARKABULL_ROLES=api and stay small; one other
+process runs scheduler,cv-worker. Any number of processes may carry the
+scheduler and cv-worker roles: each job runs only in the process that
+holds its lease (see leases.py), and another takes over if it dies.
+
+    python roles.py            # boot each role in a fresh interpreter and compare
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+API = "api"
+SCHEDULER = "scheduler"
+CV_WORKER = "cv-worker"
+ALL_ROLES = (API, SCHEDULER, CV_WORKER)
+
+# Modules whose presence in sys.modules the report calls out
+HEAVY_MODULES = ("cv2", "numpy", "inference_sdk", "supabase", "httpx", "flask", "starlette")
+
+_phases = []
+
+
+def enabled():
+    spec = os.getenv("PARKABULL_ROLES")
+    if not spec:
+        return set(ALL_ROLES)
+    roles = {role.strip().lower() for role in spec.split(",") if role.strip()}
+    unknown = roles - set(ALL_ROLES)
+    if unknown:
+        raise ValueError(f"Unknown PARKABULL_ROLES {sorted(unknown)}; expected any of {ALL_ROLES}")
+    return roles
+
+
+def has(role):
+    return role in enabled()
+
+
+def process_started_at():
+    """Unix time the process started (from /proc on Linux, else when this module was imported)."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return _imported_at
+
+
+_imported_at = time.time()
+
+
+def rss_bytes():
+    """Current resident set size (peak RSS where /proc isn't available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def mark(phase):
+    """Record how long after process start `phase` was reached, and the RSS at that point."""
+    _phases.append({
+        "phase": phase,
+        "seconds": round(time.time() - process_started_at(), 3),
+        "rss_bytes": rss_bytes(),
+    })
+
+
+def report():
+    return {
+        "roles": sorted(enabled()),
+        "pid": os.getpid(),
+        "uptime_seconds": round(time.time() - process_started_at(), 3),
+        "rss_bytes": rss_bytes(),
+        "phases": list(_phases),
+        "modules_loaded": len(sys.modules),
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+
+
+def format_report(rep):
+    startup = rep["phases"][-1]["seconds"] if rep["phases"] else rep["uptime_seconds"]
+    return (f"roles={','.join(rep['roles'])} startup={startup:.2f}s "
+            f"rss={rep['rss_bytes'] / 1e6:.1f}MB heavy={','.join(rep['heavy_modules']) or '-'}")
+
+
+# ============================================
+# PER-ROLE COMPARISON
+# ============================================
+
+ROLE_ENTRYPOINTS = {API: "app", SCHEDULER: "app", CV_WORKER: "cv_service"}
+
+
+def _measure_child(role):
+    __import__(ROLE_ENTRYPOINTS[role])
+    mark("imported")
+    print(json.dumps(report()))
+
+
+def measure(role):
+    """Import `role`'s entry module in a fresh interpreter and return its report."""
+    env = dict(os.environ, PARKABULL_ROLES=role, CV_MODE="off")
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run(
+        [sys.executable, "-c", f"import roles; roles._measure_child({role!r})"],
+        cwd=here, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    print(f"{'role':<12}{'startup s':>11}{'RSS MB':>9}{'modules':>9}  heavy modules")
+    for role in ALL_ROLES:
+        try:
+            rep = measure(role)
+        except subprocess.CalledProcessError as e:
+            print(f"{role:<12}  failed: {e.stderr.strip().splitlines()[-1] if e.stderr else e}")
+            continue
+        print(f"{role:<12}{rep['phases'][-1]['seconds']:>11.2f}{rep['rss_bytes'] / 1e6:>9.1f}"
+              f"{rep['modules_loaded']:>9}  {', '.join(rep['heavy_modules']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+sampling.py
+Adaptive per-lot sampling interval for the CV service.
+
+Each analyzed frame reports the lot's occupied/total counts. The interval
+until the next analysis then follows observed activity:
+
+- counts moving fast (>= fast_rate spots per minute)  -> min_interval
+- counts moved (>= change_spots since the last frame) -> interval / backoff
+- counts stable                                       -> interval * backoff
+- lot nearly full (>= near_full of total)             -> at most near_full_interval
+
+always clamped to [min_interval, max_interval]. A quiet lot at 3 AM backs
+off to max_interval within a few analyses; the first change snaps it back.
+
+    CV_SAMPLE_MIN_SECONDS=1  CV_SAMPLE_MAX_SECONDS=60
+"""
+
+import os
+import threading
+
+
+class AdaptiveInterval:
+    def __init__(self, min_interval=1.0, max_interval=60.0, initial=None, backoff=2.0,
+                 change_spots=2, fast_rate=6.0, near_full=0.9, near_full_interval=None):
+        """
+        Args:
+            min_interval / max_interval: bounds on seconds between analyses
+            initial: interval for a lot with no history (default min_interval)
+            backoff: factor the interval grows by per stable analysis (and shrinks by per change)
+            change_spots: smallest count change treated as activity rather than detector jitter
+            fast_rate: spots/minute at which sampling jumps straight to min_interval
+            near_full: occupied/total ratio above which the interval stays short
+            near_full_interval: longest interval while nearly full (default 2 * min_interval)
+        """
+        if not 0 < min_interval <= max_interval:
+            raise ValueError(f"Need 0 < min_interval <= max_interval, got {min_interval}, {max_interval}")
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        self.initial = self._clamp(initial if initial is not None else min_interval)
+        self.backoff = backoff
+        self.change_spots = change_spots
+        self.fast_rate = fast_rate
+        self.near_full = near_full
+        self.near_full_interval = near_full_interval if near_full_interval is not None else 2 * min_interval
+        self._lock = threading.Lock()
+        self._lots = {}  # lot -> {"interval", "occupied", "at"}
+
+    @classmethod
+    def from_env(cls, default):
+        """Bounds from CV_SAMPLE_MIN_SECONDS / CV_SAMPLE_MAX_SECONDS, starting at `default`."""
+        min_interval = float(os.getenv("CV_SAMPLE_MIN_SECONDS", min(1.0, default)))
+        max_interval = float(os.getenv("CV_SAMPLE_MAX_SECONDS", max(60.0, default)))
+        return cls(min_interval, max_interval, initial=default)
+
+    def _clamp(self, interval):
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def interval(self, lot):
+        """Seconds until this lot's next analysis should run."""
+        with self._lock:
+            state = self._lots.get(lot)
+            return state["interval"] if state else self.initial
+
+    def intervals(self):
+        with self._lock:
+            return {lot: state["interval"] for lot, state in self._lots.items()}
+
+    def observe(self, lot, occupied, total, at):
+        """
+        Feed one analysis result (`at` in seconds on the source's clock) and
+        return the new interval.
+        """
+        with self._lock:
+            state = self._lots.get(lot)
+            if state is None:
+                state = self._lots[lot] = {"interval": self.initial, "occupied": occupied, "at": at}
+                return state["interval"]
+
+            interval = state["interval"]
+            change = abs(occupied - state["occupied"])
+            elapsed = at - state["at"]
+            if elapsed <= 0:
+                pass  # source restarted (looping video, reconnect): just rebase
+            elif change >= self.change_spots and change / elapsed * 60 >= self.fast_rate:
+                interval = self.min_interval
+            elif change >= self.change_spots:
+                interval /= self.backoff
+            else:
+                interval *= self.backoff
+
+            if total and occupied / total >= self.near_full:
+                interval = min(interval, self.near_full_interval)
+
+            state.update(interval=self._clamp(interval), occupied=occupied, at=at)
+            return state["interval"]
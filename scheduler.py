@@ -0,0 +1,297 @@
+"""
+scheduler.py
+Single-threaded expiry scheduler for every timed state transition
+(leaving-soon reverts, schedule expiry, ...).
+
+Timers live in one heap driven by one thread that sleeps until the
+earliest deadline - nothing wakes up when nothing is due. When it does
+wake, every due timer is popped and handed to its kind's handler as one
+batch, so a burst of 10k taps expiring together becomes one call per
+kind instead of 10k sleeping threads.
+
+Kinds registered with persist=True are journaled to a JSON file (written
+from the scheduler thread, at most once per JOURNAL_INTERVAL) and
+re-armed on restart. Every process journals its own timers to its own
+file next to `journal_path` (scheduler_journal.<pid>.json) and holds an
+flock on it while it runs; a starting process adopts only the journals
+whose owner is gone, so each timer is restored once, not once per worker.
+"""
+
+import glob
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+JOURNAL_INTERVAL = 1.0  # seconds between journal writes while timers are changing
+RETRY_DELAY = 30.0      # seconds before re-arming a batch whose handler failed
+
+log = logging.getLogger("parkabull.scheduler")
+
+TIMERS_PENDING = metrics.REGISTRY.gauge(
+    "parkabull_scheduler_timers_pending",
+    "Timers waiting to fire by kind",
+    ("kind",),
+)
+TIMERS_FIRED = metrics.REGISTRY.counter(
+    "parkabull_scheduler_timers_fired_total",
+    "Timers delivered to their handler by kind",
+    ("kind",),
+)
+TIMER_BATCHES = metrics.REGISTRY.counter(
+    "parkabull_scheduler_batches_total",
+    "Handler invocations by kind and outcome",
+    ("kind", "outcome"),
+)
+
+
+class Timer:
+    __slots__ = ("due_at", "kind", "key", "payload")
+
+    def __init__(self, due_at, kind, key=None, payload=None):
+        self.due_at = due_at
+        self.kind = kind
+        self.key = key
+        self.payload = payload
+
+    def to_json(self):
+        return [self.due_at, self.kind, self.key, self.payload]
+
+
+class ExpiryScheduler:
+    def __init__(self, journal_path=None, clock=time.time):
+        self.journal_path = journal_path  # base name; this process writes journal_file
+        self.journal_file = None
+        self._journal_lock = None
+        self._clock = clock
+        self._condition = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._handlers = {}     # kind -> (handler, persist)
+        self._unique = set()    # (kind, key) of pending keyed timers
+        self._dirty = False
+        self._last_journal = 0.0
+        self._thread = None
+        self._running = False
+
+    def register(self, kind, handler, persist=False):
+        """
+        handler(timers) is called on the scheduler thread with a list of due
+        Timer objects of this kind. Raising re-arms the whole batch after
+        RETRY_DELAY seconds.
+        """
+        self._handlers[kind] = (handler, persist)
+
+    def schedule(self, due_at, kind, key=None, payload=None):
+        """
+        Arm a timer for unix time `due_at`. Timers with a `key` are
+        deduplicated: scheduling (kind, key) again while one is pending is
+        a no-op. Returns True if a timer was added.
+        """
+        if kind not in self._handlers:
+            raise KeyError(f"No handler registered for timer kind {kind!r}")
+        with self._condition:
+            if key is not None:
+                if (kind, key) in self._unique:
+                    return False
+                self._unique.add((kind, key))
+            self._push(Timer(due_at, kind, key, payload))
+            return True
+
+    def schedule_in(self, delay, kind, key=None, payload=None):
+        return self.schedule(self._clock() + delay, kind, key, payload)
+
+    def _push(self, timer):
+        heapq.heappush(self._heap, (timer.due_at, next(self._seq), timer))
+        TIMERS_PENDING.inc(kind=timer.kind)
+        if self._handlers[timer.kind][1]:
+            self._dirty = True
+        # Wake the loop only if this timer is now the earliest one
+        if self._heap[0][2] is timer:
+            self._condition.notify()
+
+    def pending(self, kind=None):
+        with self._condition:
+            return sum(1 for _, _, t in self._heap if kind is None or t.kind == kind)
+
+    # ============================================
+    # JOURNAL
+    # ============================================
+    def _persisted(self):
+        with self._condition:
+            self._dirty = False
+            return [t.to_json() for _, _, t in self._heap if self._handlers[t.kind][1]]
+
+    def _write_journal(self):
+        if not self.journal_file:
+            return
+        timers = self._persisted()
+        tmp_path = f"{self.journal_file}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(timers, f)
+            os.replace(tmp_path, self.journal_file)
+        except OSError as e:
+            log.warning("⚠️  Could not write scheduler journal: %s", e)
+        self._last_journal = time.monotonic()
+
+    @staticmethod
+    def _unlock(lock, path):
+        # Whoever opens the old lock file after this finds the journal gone and skips it
+        try:
+            os.remove(f"{path}.lock")
+        except OSError:
+            pass
+        lock.close()
+
+    @staticmethod
+    def _lock(path):
+        """Open and flock `path`.lock without blocking; None if another process holds it."""
+        import fcntl
+
+        f = open(f"{path}.lock", "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return None
+        return f
+
+    def _journals(self):
+        """Every process's journal for this base path (plus the old shared one)."""
+        root, ext = os.path.splitext(self.journal_path)
+        return [self.journal_path] + sorted(glob.glob(f"{glob.escape(root)}.*{ext}"))
+
+    def _load_journal(self):
+        """Re-arm the timers of journals whose process is gone (live ones stay locked); returns how many."""
+        if not self.journal_path:
+            return 0
+        restored = 0
+        for path in self._journals():
+            if not os.path.exists(path):
+                continue
+            lock = self._lock(path)
+            if lock is None:
+                continue  # a running process still owns these timers
+            try:
+                if not os.path.exists(path):
+                    continue  # another process adopted it first
+                try:
+                    with open(path) as f:
+                        entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    log.warning("⚠️  Could not read scheduler journal %s: %s", path, e)
+                    entries = []
+                for due_at, kind, key, payload in entries:
+                    if kind in self._handlers:
+                        self.schedule(due_at, kind, key, payload)
+                        restored += 1
+                # They're in this process's heap now and go into its own journal
+                os.remove(path)
+            finally:
+                self._unlock(lock, path)
+        return restored
+
+    def _open_journal(self):
+        root, ext = os.path.splitext(self.journal_path)
+        self.journal_file = f"{root}.{os.getpid()}{ext}"
+        self._journal_lock = self._lock(self.journal_file)
+        if self._journal_lock is None:
+            log.warning("⚠️  Scheduler journal %s is locked; not journaling", self.journal_file)
+            self.journal_file = None
+            return
+        self._dirty = True  # adopted timers get written out under this process's name
+
+    # ============================================
+    # LOOP
+    # ============================================
+    def start(self):
+        """Re-arm journaled timers and start the scheduler thread."""
+        if self._thread is not None:
+            return
+        restored = self._load_journal()
+        if restored:
+            log.info("⏰ Restored %d pending timers from %s", restored, self.journal_path)
+        if self.journal_path:
+            self._open_journal()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="expiry_scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._write_journal()
+        if self.journal_file and not self._persisted():
+            # Nothing to hand over; don't leave an empty journal per past process
+            try:
+                os.remove(self.journal_file)
+            except OSError:
+                pass
+        if self._journal_lock is not None:
+            self._unlock(self._journal_lock, self.journal_file)
+            self._journal_lock = None
+
+    def _pop_due(self):
+        now = self._clock()
+        due = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, _, timer = heapq.heappop(self._heap)
+            TIMERS_PENDING.dec(kind=timer.kind)
+            if timer.key is not None:
+                self._unique.discard((timer.kind, timer.key))
+            if self._handlers[timer.kind][1]:
+                self._dirty = True
+            due.setdefault(timer.kind, []).append(timer)
+        return due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running:
+                    due = self._pop_due()
+                    if due:
+                        break
+                    timeout = self._heap[0][0] - self._clock() if self._heap else None
+                    if self._dirty and self.journal_file:
+                        journal_in = JOURNAL_INTERVAL - (time.monotonic() - self._last_journal)
+                        if journal_in <= 0:
+                            break
+                        timeout = journal_in if timeout is None else min(timeout, journal_in)
+                    self._condition.wait(timeout)
+                else:
+                    return
+            if due:
+                self._dispatch(due)
+            if self._dirty and time.monotonic() - self._last_journal >= JOURNAL_INTERVAL:
+                self._write_journal()
+
+    def _dispatch(self, due):
+        for kind, timers in due.items():
+            handler = self._handlers[kind][0]
+            try:
+                handler(timers)
+                TIMERS_FIRED.inc(len(timers), kind=kind)
+                TIMER_BATCHES.inc(kind=kind, outcome="ok")
+            except Exception as e:
+                TIMER_BATCHES.inc(kind=kind, outcome="error")
+                log.error("❌ %s handler failed for %d timers, retrying in %ss: %s",
+                          kind, len(timers), RETRY_DELAY, e)
+                retry_at = self._clock() + RETRY_DELAY
+                with self._condition:
+                    for timer in timers:
+                        if timer.key is not None:
+                            if (kind, timer.key) in self._unique:
+                                continue
+                            self._unique.add((kind, timer.key))
+                        timer.due_at = retry_at
+                        self._push(timer)
@@ -0,0 +1,207 @@
+"""
+streams.py
+Shared frame buffer behind the MJPEG live streams (/api/lot/<name>/stream).
+
+The CV service draws its latest predictions on a lot's frames and
+JPEG-encodes each one once (at most CV_STREAM_FPS per lot), and only
+while someone is watching that lot. `publish()` wraps the JPEG in its
+multipart part once and keeps just the newest part per lot. Viewers all
+wait on one Condition, as in events.Broadcaster, and always send the
+newest part: a client that can't keep up skips the frames it missed
+instead of queueing them, and another viewer costs a socket write, not
+an encode.
+
+`asubscribe()` is the asyncio flavour used by the ASGI app (one
+asyncio.Event per event loop, like events.py).
+"""
+
+import asyncio
+import threading
+import time
+
+import metrics
+
+BOUNDARY = "frame"
+CONTENT_TYPE = f"multipart/x-mixed-replace; boundary={BOUNDARY}"
+REPEAT_INTERVAL = 5.0  # seconds before a quiet lot's current frame is resent (keeps proxies and sockets honest)
+
+VIEWERS = metrics.REGISTRY.gauge(
+    "parkabull_stream_viewers",
+    "Connected MJPEG stream clients by lot",
+    ("lot",),
+)
+FRAMES = metrics.REGISTRY.counter(
+    "parkabull_stream_frames_total",
+    "Annotated frames received from the CV service for streaming, by lot",
+    ("lot",),
+)
+FRAMES_SKIPPED = metrics.REGISTRY.counter(
+    "parkabull_stream_frames_skipped_total",
+    "Frames a viewer never got because a newer one replaced it first (slow clients), by lot",
+    ("lot",),
+)
+
+
+def stream_key(lot_name):
+    return lot_name.lower()
+
+
+class _Frame:
+    __slots__ = ("seq", "part", "captured_at")
+
+    def __init__(self, seq, jpeg, captured_at):
+        self.seq = seq
+        self.captured_at = captured_at
+        self.part = (
+            f"--{BOUNDARY}\r\n"
+            f"Content-Type: image/jpeg\r\n"
+            f"Content-Length: {len(jpeg)}\r\n\r\n"
+        ).encode("ascii") + jpeg + b"\r\n"
+
+
+class FrameHub:
+    def __init__(self, on_viewers_changed=None, repeat_interval=REPEAT_INTERVAL):
+        """
+        Args:
+            on_viewers_changed: fn({lot: viewers}) called when a lot gains its
+                first viewer or loses its last one (tells the CV service what to encode)
+            repeat_interval: seconds without a new frame before the current one is resent
+        """
+        self.on_viewers_changed = on_viewers_changed
+        self.repeat_interval = repeat_interval
+        self._condition = threading.Condition()
+        self._frames = {}   # lot key -> newest _Frame
+        self._viewers = {}  # lot key -> connected clients
+        self._closed = False
+        self._loops = {}    # event loop -> asyncio.Event its async viewers wait on
+
+    def viewers(self):
+        """{lot key: viewers} for every lot someone is watching."""
+        with self._condition:
+            return dict(self._viewers)
+
+    def publish(self, lot_name, jpeg, captured_at=None):
+        """Make `jpeg` the lot's current frame and wake every viewer."""
+        key = stream_key(lot_name)
+        with self._condition:
+            previous = self._frames.get(key)
+            self._frames[key] = _Frame(previous.seq + 1 if previous else 1, jpeg, captured_at)
+            self._condition.notify_all()
+            self._wake_loops()
+        FRAMES.inc(lot=key)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            self._wake_loops()
+
+    def _wake_loops(self):
+        for loop in list(self._loops):
+            try:
+                loop.call_soon_threadsafe(self._wake_loop, loop)
+            except RuntimeError:  # loop already closed
+                del self._loops[loop]
+
+    def _wake_loop(self, loop):
+        with self._condition:
+            event = self._loops.get(loop)
+            self._loops[loop] = asyncio.Event()
+        if event is not None:
+            event.set()
+
+    def _loop_event(self, loop):
+        with self._condition:
+            event = self._loops.get(loop)
+            if event is None:
+                event = self._loops[loop] = asyncio.Event()
+            return event
+
+    def _open(self, key):
+        with self._condition:
+            count = self._viewers[key] = self._viewers.get(key, 0) + 1
+            viewers = dict(self._viewers)
+        VIEWERS.set(count, lot=key)
+        if count == 1 and self.on_viewers_changed is not None:
+            self.on_viewers_changed(viewers)
+
+    def _leave(self, key):
+        with self._condition:
+            count = self._viewers[key] - 1
+            if count:
+                self._viewers[key] = count
+            else:
+                # Nobody left to watch: the CV service stops encoding, and a new viewer shouldn't see an old frame
+                del self._viewers[key]
+                self._frames.pop(key, None)
+            viewers = dict(self._viewers)
+        VIEWERS.set(count, lot=key)
+        if not count and self.on_viewers_changed is not None:
+            self.on_viewers_changed(viewers)
+
+    def _idle(self, key, last_seq):
+        frame = self._frames.get(key)
+        return (frame is None or frame.seq <= last_seq) and not self._closed
+
+    def _take(self, key, last_seq, repeat):
+        """(part or None, new last_seq); caller holds the lock."""
+        frame = self._frames.get(key)
+        if frame is None:
+            return None, last_seq
+        if frame.seq > last_seq:
+            if last_seq and frame.seq - last_seq > 1:
+                FRAMES_SKIPPED.inc(frame.seq - last_seq - 1, lot=key)
+            return frame.part, frame.seq
+        return (frame.part if repeat else None), last_seq
+
+    def subscribe(self, lot_name):
+        """Generator of multipart JPEG parts for one lot, newest frame only."""
+        key = stream_key(lot_name)
+        self._open(key)
+        try:
+            last_seq = 0
+            last_sent = time.monotonic()
+            while True:
+                with self._condition:
+                    if self._idle(key, last_seq):
+                        self._condition.wait(max(self.repeat_interval - (time.monotonic() - last_sent), 0.0))
+                    part, last_seq = self._take(key, last_seq, time.monotonic() - last_sent >= self.repeat_interval)
+                    closed = self._closed
+
+                if part is not None:
+                    last_sent = time.monotonic()
+                    yield part
+                if closed:
+                    return
+        finally:
+            self._leave(key)
+
+    async def asubscribe(self, lot_name):
+        """Async generator equivalent of `subscribe()` for use on an event loop."""
+        loop = asyncio.get_running_loop()
+        key = stream_key(lot_name)
+        self._open(key)
+        try:
+            last_seq = 0
+            last_sent = time.monotonic()
+            while True:
+                wake = self._loop_event(loop)
+                with self._condition:
+                    idle = self._idle(key, last_seq)
+                if idle:
+                    try:
+                        await asyncio.wait_for(wake.wait(),
+                                               max(self.repeat_interval - (time.monotonic() - last_sent), 0.0))
+                    except asyncio.TimeoutError:
+                        pass
+                with self._condition:
+                    part, last_seq = self._take(key, last_seq, time.monotonic() - last_sent >= self.repeat_interval)
+                    closed = self._closed
+
+                if part is not None:
+                    last_sent = time.monotonic()
+                    yield part
+                if closed:
+                    return
+        finally:
+            self._leave(key)
@@ -0,0 +1,76 @@
+from budget import DemandCounter, InferenceBudget, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_at_its_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock)
+    assert bucket.take() and bucket.take()
+    assert not bucket.take()
+    clock.now = 0.5
+    assert bucket.take()
+    assert not bucket.take()
+
+
+def test_unlimited_budget_always_grants():
+    budget = InferenceBudget(calls_per_second=None)
+    assert all(budget.acquire("a") for _ in range(100))
+
+
+def test_token_goes_to_the_waiting_lot_with_the_highest_priority():
+    clock = FakeClock()
+    budget = InferenceBudget(calls_per_second=1, burst=1, clock=clock)
+    budget.record_demand({"busy": 120}, 60)
+    assert budget.acquire("busy")
+    budget.record_result("quiet", 0, 100)
+    budget._lots["quiet"]["analyzed_at"] = 0.0
+
+    clock.now = 0.5  # both due, no token yet
+    assert not budget.acquire("quiet")
+    assert not budget.acquire("busy")
+    clock.now = 1.0
+    assert not budget.acquire("quiet")  # "busy" is still waiting and is polled more
+    assert budget.acquire("busy")
+    clock.now = 2.0
+    assert budget.acquire("quiet")
+
+
+def test_staleness_eventually_wins():
+    clock = FakeClock()
+    budget = InferenceBudget(calls_per_second=1, burst=1, clock=clock)
+    budget.record_demand({"busy": 600}, 60)
+    budget.acquire("busy")
+    budget._lots["quiet"] = {"demand": 0.0, "demand_at": 0.0, "analyzed_at": 0.0, "fill": 0.0}
+    clock.now = 600.0  # ten minutes since "quiet" was analyzed
+    budget._lots["busy"]["analyzed_at"] = 599.0
+    assert budget.priority("quiet") > budget.priority("busy")
+
+
+def test_refund_and_cancel():
+    clock = FakeClock()
+    budget = InferenceBudget(calls_per_second=1, burst=1, clock=clock)
+    assert budget.acquire("a")
+    budget.refund()
+    assert budget.acquire("a")
+
+    budget.acquire("b")  # waiting, no token
+    budget.cancel("b")
+    clock.now = 1.0
+    assert budget.acquire("c")
+
+
+def test_demand_counter_takes_deltas():
+    counter = DemandCounter()
+    counter.hit("a")
+    counter.hit("a")
+    counter.hit("b")
+    counts, interval = counter.take()
+    assert counts == {"a": 2, "b": 1} and interval >= 0
+    assert counter.take()[0] == {}
@@ -0,0 +1,46 @@
+from email.utils import formatdate
+
+from conditional import VersionTracker, is_not_modified, validator_headers
+
+
+def test_bump_and_observe():
+    now = [1000.0]
+    versions = VersionTracker(clock=lambda: now[0])
+    assert versions.get("a") == (0, 1000.0)
+
+    now[0] = 1010.0
+    assert versions.bump("a") == 1
+    assert versions.get("a") == (1, 1010.0)
+
+    # The first fingerprint is the baseline; only a change bumps
+    assert not versions.observe("a", (5, 10))
+    assert not versions.observe("a", (5, 10))
+    now[0] = 1020.0
+    assert versions.observe("a", (6, 10))
+    assert versions.get("a") == (2, 1020.0)
+
+
+def test_if_none_match():
+    assert is_not_modified({"If-None-Match": '"abc"'}, "abc")
+    assert is_not_modified({"If-None-Match": 'W/"abc"'}, "abc")
+    assert is_not_modified({"If-None-Match": '"x", "abc"'}, "abc")
+    assert is_not_modified({"If-None-Match": "*"}, "abc")
+    assert not is_not_modified({"If-None-Match": '"abd"'}, "abc")
+    assert not is_not_modified({}, "abc")
+
+
+def test_if_modified_since():
+    since = formatdate(1000, usegmt=True)
+    assert is_not_modified({"If-Modified-Since": since}, "abc", last_modified=1000.5)
+    assert not is_not_modified({"If-Modified-Since": since}, "abc", last_modified=1001)
+    assert not is_not_modified({"If-Modified-Since": "yesterday"}, "abc", last_modified=1000)
+    # If-None-Match wins when both are sent
+    assert not is_not_modified({"If-None-Match": '"old"', "If-Modified-Since": since}, "abc", last_modified=1000)
+
+
+def test_validator_headers():
+    headers = validator_headers("abc", 1000)
+    assert headers["ETag"] == '"abc"'
+    assert headers["Last-Modified"] == formatdate(1000, usegmt=True)
+    assert headers["Cache-Control"] == "no-cache"
+    assert "Last-Modified" not in validator_headers("abc")
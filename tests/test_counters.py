@@ -0,0 +1,44 @@
+from counters import DeltaAggregator
+
+
+def test_flush_writes_net_deltas_per_key():
+    written = []
+    counter = DeltaAggregator("test", lambda key, delta: written.append((key, delta)))
+    counter.add("Furnas", 1)
+    counter.add("Furnas", 1)
+    counter.add("Furnas", -1)
+    counter.add("Ketter", 1)
+    counter.add("Ketter", -1)
+
+    assert counter.unflushed("Furnas") == 1
+    assert counter.flush() == 1
+    assert written == [("Furnas", 1)]
+    assert counter.unflushed("Furnas") == 0
+    assert counter.flush() == 0
+
+
+def test_failed_flush_keeps_the_delta():
+    fail = [True]
+
+    def flush(key, delta):
+        if fail[0]:
+            raise ConnectionError("down")
+
+    counter = DeltaAggregator("test", flush)
+    counter.add("Furnas", 2)
+    counter.flush()
+    assert counter.unflushed("Furnas") == 2
+
+    counter.add("Furnas", 1)
+    fail[0] = False
+    counter.flush()
+    assert counter.unflushed("Furnas") == 0
+
+
+def test_stop_flushes_what_is_pending():
+    written = []
+    counter = DeltaAggregator("test", lambda key, delta: written.append((key, delta)), interval=60)
+    counter.start()
+    counter.add("Furnas", 3)
+    counter.stop()
+    assert written == [("Furnas", 3)]
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from cv_ipc import Replies, ResultListener, ResultPublisher, ipc_authkey
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_authkey_is_required(monkeypatch):
+    monkeypatch.delenv("CV_IPC_AUTHKEY", raising=False)
+    with pytest.raises(ValueError):
+        ipc_authkey()
+    with pytest.raises(ValueError):
+        ipc_authkey("secret", ("10.0.0.5", 7000))
+    assert ipc_authkey("secret", ("127.0.0.1", 7000)) == b"secret"
+
+
+def test_stop_drops_connected_services(tmp_path):
+    received = []
+    got = threading.Event()
+    listener = ResultListener(lambda m: (received.append(m), got.set()), str(tmp_path / "cv.sock"), "secret")
+    listener.start()
+    publisher = ResultPublisher(listener.address, "secret")
+    try:
+        assert publisher.send({"type": "stats", "lot": "a"})
+        assert got.wait(5)
+        wait_for(lambda: listener.connections == 1)
+        assert listener.broadcast({"type": "demand"})
+        wait_for(lambda: publisher.receive() == [{"type": "demand"}])
+
+        listener.stop()
+        assert not listener.broadcast({"type": "demand"})
+        assert listener.connections == 0
+        wait_for(lambda: not any(t.name == "cv_ipc_conn" and t.is_alive() for t in threading.enumerate()))
+    finally:
+        publisher.close()
+        listener.stop()
+    assert received == [{"type": "stats", "lot": "a"}]
+
+
+def test_broadcast_drops_instead_of_blocking_on_a_service_that_isnt_reading(tmp_path):
+    listener = ResultListener(lambda m: None, str(tmp_path / "cv.sock"), "secret")
+    listener.start()
+    publisher = ResultPublisher(listener.address, "secret")
+    try:
+        assert publisher.send({"type": "stats", "lot": "a"})
+        wait_for(lambda: listener.connections == 1)
+        big = {"type": "demand", "lots": {f"lot{i}": i for i in range(20000)}}
+        started = time.monotonic()
+        results = [listener.broadcast(big) for _ in range(200)]
+        assert time.monotonic() - started < 1.0
+        assert not all(results)  # the socket buffer and the outbox filled up
+    finally:
+        publisher.close()
+        listener.stop()
+
+
+def test_concurrent_broadcasts_arrive_whole(tmp_path):
+    # FrameHub calls broadcast() from request threads and the ASGI event loop at once
+    listener = ResultListener(lambda m: None, str(tmp_path / "cv.sock"), "secret")
+    listener.start()
+    publisher = ResultPublisher(listener.address, "secret")
+    try:
+        assert publisher.send({"type": "stats", "lot": "a"})
+        wait_for(lambda: listener.connections == 1)
+
+        def send(n):
+            for i in range(5):
+                wait_for(lambda: listener.broadcast({"type": "stream", "lots": {f"lot{n}": i}}))
+
+        threads = [threading.Thread(target=send, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        received = []
+        wait_for(lambda: received.extend(publisher.receive()) or len(received) == 40)
+        assert all(message["type"] == "stream" for message in received)
+    finally:
+        publisher.close()
+        listener.stop()
+
+
+def test_replies_are_matched_to_their_requests(tmp_path):
+    replies = Replies()
+    listener = ResultListener(replies.resolve, str(tmp_path / "cv.sock"), "secret")
+    listener.start()
+    publisher = ResultPublisher(listener.address, "secret")
+    try:
+        assert publisher.send({"type": "stats", "lot": "a"})
+        wait_for(lambda: listener.connections == 1)
+        request_id = replies.expect()
+        listener.broadcast({"type": "profile", "id": request_id})
+
+        requests = []
+        wait_for(lambda: requests.extend(publisher.receive()) or requests)
+        publisher.send({"type": "profile", "id": "someone-else", "result": "no"})
+        publisher.send({"type": "profile", "id": requests[0]["id"], "result": "yes"})
+        assert replies.wait(request_id, 5)["result"] == "yes"
+        assert replies.wait(replies.expect(), 0.01) is None
+    finally:
+        publisher.close()
+        listener.stop()
@@ -0,0 +1,105 @@
+import pytest
+
+from departures import DepartureIndex
+
+
+def make_index(rows):
+    return DepartureIndex(lambda lot_id: [time for lot, time in rows if lot == lot_id])
+
+
+def test_add_to_a_cold_lot_counts_the_new_row_once():
+    # The row is written before add() is called, so a load already includes it
+    rows = [(1, "23:59:00")]
+    index = make_index(rows)
+    index.add(1, "23:59:00")
+    assert index.next_departures(1, after_minute=0) == [{"time": "23:59", "count": 1}]
+
+
+def test_add_to_a_loaded_lot_counts_in_place():
+    rows = [(1, "23:59:00")]
+    index = make_index(rows)
+    index.next_departures(1, after_minute=0)
+
+    rows.append((1, "23:59:00"))
+    index.add(1, "23:59:00")
+    rows.append((1, "23:58:00"))
+    index.add(1, "23:58:00")
+    assert index.next_departures(1, after_minute=0) == [{"time": "23:58", "count": 1},
+                                                        {"time": "23:59", "count": 2}]
+
+
+def test_add_rejects_bad_times():
+    index = make_index([])
+    assert not index.add(1, "25:00")
+    assert not index.add(1, "soon")
+
+
+def test_expire():
+    index = make_index([(1, "23:58:00"), (1, "23:59:00"), (1, "23:59:00")])
+    index.next_departures(1)
+    assert index.expire(before_minute=23 * 60 + 59) == 1
+    assert index.next_departures(1, after_minute=0) == [{"time": "23:59", "count": 2}]
+
+
+def test_add_during_a_load_is_picked_up_by_a_reload():
+    rows = [(1, "23:58:00")]
+    loads = []
+
+    def loader(lot_id):
+        snapshot = [time for lot, time in rows if lot == lot_id]
+        loads.append(len(snapshot))
+        if len(loads) == 1:
+            # Another request writes and records a row after this load read the table
+            rows.append((1, "23:59:00"))
+            index.add(1, "23:59:00")
+        return snapshot
+
+    index = DepartureIndex(loader)
+    assert index.next_departures(1, after_minute=0) == [{"time": "23:58", "count": 1}]
+    assert index.next_departures(1, after_minute=0) == [{"time": "23:58", "count": 1},
+                                                        {"time": "23:59", "count": 1}]
+    assert loads == [1, 2]
+    assert index.next_departures(1, after_minute=0)[1]["count"] == 1
+    assert len(loads) == 2
+
+
+def test_prime_reloads_lots_added_to_during_the_query():
+    rows = [(1, "23:58:00"), (2, "23:58:00")]
+    index = make_index(rows)
+    generations = index.generations()
+    times = {lot_id: [time for lot, time in rows if lot == lot_id] for lot_id in (1, 2)}
+    rows.append((1, "23:59:00"))
+    index.add(1, "23:59:00")
+    index.prime(times, generations)
+    assert index.needs_load([1, 2]) == [1]
+    assert index.cached_departures(1, after_minute=0) == [{"time": "23:58", "count": 1}]
+    assert len(index.next_departures(1, after_minute=0)) == 2
+
+
+def test_expired_index_is_served_when_the_reload_fails():
+    now = [0.0]
+    rows = [(1, "23:59:00")]
+    down = []
+
+    def loader(lot_id):
+        if down:
+            raise ConnectionError("datastore down")
+        return [time for lot, time in rows if lot == lot_id]
+
+    index = DepartureIndex(loader, max_age=60, clock=lambda: now[0])
+    index.next_departures(1, after_minute=0)
+    now[0] = 120
+    down.append(True)
+    assert index.needs_load([1]) == [1]
+    assert index.next_departures(1, after_minute=0) == [{"time": "23:59", "count": 1}]
+    assert index.cached_departures(1, after_minute=0) == [{"time": "23:59", "count": 1}]
+    assert index.cached_departures(2) == []
+
+
+def test_failed_first_load_raises():
+    def loader(lot_id):
+        raise ConnectionError("datastore down")
+
+    index = DepartureIndex(loader)
+    with pytest.raises(ConnectionError):
+        index.next_departures(1)
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+from events import ALL_TOPICS, Broadcaster, lot_topic
+
+
+def test_subscriber_gets_only_its_topics():
+    events = Broadcaster()
+    stream = events.subscribe({lot_topic("A")})
+    assert next(stream).startswith(b"retry:")
+    assert events.subscriber_count == 1
+
+    events.publish(lot_topic("b"), {"lot": "b"})
+    events.publish(lot_topic("a"), {"lot": "a"})
+    chunk = next(stream)
+    assert b'"lot":"a"' in chunk and b'"lot":"b"' not in chunk
+
+    stream.close()
+    assert events.subscriber_count == 0
+
+
+def test_resume_from_last_event_id():
+    events = Broadcaster()
+    first = events.publish("t", {"n": 1})
+    events.publish("t", {"n": 2})
+    events.publish("t", {"n": 3})
+    stream = events.subscribe(ALL_TOPICS, last_event_id=first)
+    next(stream)
+    chunk = next(stream)
+    assert b'"n":1' not in chunk
+    assert chunk.index(b'"n":2') < chunk.index(b'"n":3')
+    stream.close()
+
+
+def test_reset_when_the_client_missed_more_than_the_history():
+    events = Broadcaster(history_size=2)
+    for n in range(5):
+        events.publish("t", {"n": n})
+    stream = events.subscribe(ALL_TOPICS, last_event_id=1)
+    next(stream)
+    assert b"event: reset" in next(stream)
+    stream.close()
+
+    # An id from before a restart resets too, in the preamble
+    stream = events.subscribe(ALL_TOPICS, last_event_id=100)
+    assert b"event: reset" in next(stream)
+    stream.close()
+
+
+def test_heartbeat_while_idle():
+    events = Broadcaster(heartbeat_interval=0.05)
+    stream = events.subscribe()
+    next(stream)
+    assert next(stream) == b": heartbeat\n\n"
+    stream.close()
+
+
+def test_async_subscriber_wakes_on_publish_from_another_thread():
+    events = Broadcaster(heartbeat_interval=5)
+
+    async def read_one():
+        stream = events.asubscribe({"t"})
+        await stream.__anext__()
+        threading.Timer(0.05, events.publish, args=("t", {"n": 1})).start()
+        chunk = await asyncio.wait_for(stream.__anext__(), 2)
+        await stream.aclose()
+        return chunk
+
+    assert b'"n":1' in asyncio.run(read_one())
+    assert events.subscriber_count == 0
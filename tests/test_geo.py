@@ -0,0 +1,66 @@
+import pytest
+
+from geo import GridIndex, LotLocations, distance_m
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+ROWS = [
+    {"name": "A", "latitude": 40.0000, "longitude": -75.0000},
+    {"name": "B", "latitude": 40.0050, "longitude": -75.0000},  # ~556 m north
+    {"name": "C", "latitude": 40.0500, "longitude": -75.0000},  # ~5.6 km north
+    {"name": "D", "latitude": None, "longitude": None},
+]
+
+
+def test_nearby_matches_a_full_scan():
+    index = GridIndex(((r["name"], r["latitude"], r["longitude"]) for r in ROWS[:3]))
+    hits = index.nearby(40.0, -75.0, 1000)
+    assert [key for _, key in hits] == ["A", "B"]
+    assert hits[1][0] == pytest.approx(distance_m(40.0, -75.0, 40.005, -75.0))
+    assert [key for _, key in index.nearby(40.0, -75.0, 10000, limit=2)] == ["A", "B"]
+
+
+def test_within():
+    locations = LotLocations(lambda: ROWS)
+    assert locations.within("B", 40.0, -75.0, 1000) is True
+    assert locations.within("C", 40.0, -75.0, 1000) is False
+    assert locations.within("D", 40.0, -75.0, 1000) is None
+
+
+def test_stale_index_survives_a_failed_reload():
+    clock = FakeClock()
+    rows = list(ROWS)
+    calls = []
+
+    def loader():
+        calls.append(clock.now)
+        if len(calls) > 1:
+            raise ConnectionError("datastore down")
+        return rows
+
+    locations = LotLocations(loader, max_age=60, clock=clock)
+    assert len(locations.nearby(40.0, -75.0, 1000)) == 2
+    clock.now = 120
+    assert len(locations.nearby(40.0, -75.0, 1000)) == 2
+    assert len(locations.nearby(40.0, -75.0, 1000)) == 2
+    assert calls == [0, 120]  # the failed reload counts as fresh for another max_age
+
+
+def test_new_lots_invalidate_the_index():
+    rows = list(ROWS)
+    locations = LotLocations(lambda: rows)
+    locations.nearby(40.0, -75.0, 1000)
+
+    locations.notice(["A", "B", "C", "D"])
+    rows.append({"name": "E", "latitude": 40.0001, "longitude": -75.0})
+    assert len(locations.nearby(40.0, -75.0, 1000)) == 2  # still the old index
+
+    locations.notice(["A", "E"])
+    assert [key for _, key in locations.nearby(40.0, -75.0, 1000)] == ["A", "E", "B"]
@@ -0,0 +1,45 @@
+import pytest
+
+from ids import SEQUENCE_BITS, WORKER_BITS, IdGenerator
+from leases import FileLockBackend, claim_slot
+
+
+def worker_of(id_):
+    return (id_ >> SEQUENCE_BITS) & ((1 << WORKER_BITS) - 1)
+
+
+def test_ids_increase_and_carry_the_worker_id():
+    ids = IdGenerator(worker_id=7)
+    issued = [ids.next_id() for _ in range(10000)]
+    assert issued == sorted(set(issued))
+    assert {worker_of(id_) for id_ in issued} == {7}
+
+
+def test_worker_id_is_required(monkeypatch):
+    monkeypatch.delenv("WORKER_ID", raising=False)
+    with pytest.raises(ValueError):
+        IdGenerator()
+    monkeypatch.setenv("WORKER_ID", "3")
+    assert IdGenerator().worker_id == 3
+    with pytest.raises(ValueError):
+        IdGenerator(worker_id=1 << WORKER_BITS)
+
+
+def test_processes_claim_distinct_worker_ids(tmp_path, monkeypatch):
+    monkeypatch.delenv("WORKER_ID", raising=False)
+    backends = [FileLockBackend(str(tmp_path)) for _ in range(3)]
+    generators = [IdGenerator(claim=lambda b=backend: claim_slot("worker-id", b, 1 << WORKER_BITS))
+                  for backend in backends]
+    workers = [worker_of(ids.next_id()) for ids in generators]
+    assert workers == [0, 1, 2]
+    for ids in generators:
+        ids._lease.stop()
+
+
+def test_ids_stop_when_the_worker_id_lease_is_lost(tmp_path, monkeypatch):
+    monkeypatch.delenv("WORKER_ID", raising=False)
+    ids = IdGenerator(claim=lambda: claim_slot("worker-id", FileLockBackend(str(tmp_path)), 4))
+    ids.next_id()
+    ids._lease.stop()
+    with pytest.raises(RuntimeError):
+        ids.next_id()
@@ -0,0 +1,108 @@
+import time
+
+from leases import FileLockBackend, LeaderElector, RepositoryLeaseBackend
+from repository import SQLiteRepository
+
+
+class FlakyBackend:
+    def __init__(self, timeout=0.0, latency=0.0):
+        self.failing = False
+        self.timeout = timeout
+        self.latency = latency
+
+    def acquire(self, job, holder, ttl):
+        if self.failing:
+            raise ConnectionError("datastore down")
+        time.sleep(self.latency)
+        return True
+
+    def release(self, job, holder):
+        pass
+
+
+def make_elector(backend, events, ttl=0.3, heartbeat=0.1):
+    return LeaderElector("test", backend, on_elected=lambda: events.append("elected"),
+                         on_demoted=lambda: events.append("demoted"), ttl=ttl, heartbeat=heartbeat)
+
+
+def test_steps_down_once_renewals_fail_past_the_grace_window():
+    backend = FlakyBackend()
+    events = []
+    elector = make_elector(backend, events)
+    elector.step()
+    assert elector.is_leader
+
+    backend.failing = True
+    elector.step()
+    assert elector.is_leader  # a single failure is within ttl - heartbeat
+
+    deadline = time.monotonic() + 2
+    while elector.is_leader and time.monotonic() < deadline:
+        time.sleep(0.05)
+        elector.step()
+    assert not elector.is_leader
+    assert events == ["elected", "demoted"]
+
+
+def test_grace_window_runs_from_when_the_last_renewal_started():
+    # The lease was written at the start of a slow renewal, so it has less left than the ttl
+    backend = FlakyBackend(latency=0.2)
+    events = []
+    elector = make_elector(backend, events)
+    elector.step()
+    backend.failing = True
+    elector.step()
+    assert events == ["elected", "demoted"]
+
+
+def test_grace_window_leaves_room_for_the_next_attempt_to_time_out():
+    backend = FlakyBackend(timeout=0.15)
+    events = []
+    elector = make_elector(backend, events)
+    elector.step()
+    time.sleep(0.06)
+    backend.failing = True
+    elector.step()
+    assert events == ["elected", "demoted"]
+
+
+def test_file_lock_has_one_leader(tmp_path):
+    first, second = FileLockBackend(str(tmp_path)), FileLockBackend(str(tmp_path))
+    events_a, events_b = [], []
+    a, b = make_elector(first, events_a), make_elector(second, events_b)
+    a.step()
+    b.step()
+    assert a.is_leader and not b.is_leader
+
+    a.stop()
+    b.step()
+    assert b.is_leader
+    assert events_a == ["elected", "demoted"]
+    b.stop()
+
+
+def test_db_lease_has_one_leader(tmp_path):
+    repo = SQLiteRepository(str(tmp_path / "parkabull.db"))
+    a = make_elector(RepositoryLeaseBackend(repo), [])
+    b = make_elector(RepositoryLeaseBackend(repo), [])
+    a.step()
+    b.step()
+    assert a.is_leader and not b.is_leader
+
+    a.stop()
+    b.step()
+    assert b.is_leader
+    b.stop()
+
+
+def test_failed_start_gives_up_leadership(tmp_path):
+    def fail():
+        raise RuntimeError("boom")
+
+    elector = LeaderElector("test", FileLockBackend(str(tmp_path)), on_elected=fail, ttl=0.3, heartbeat=0.1)
+    elector.step()
+    assert not elector.is_leader
+    other = make_elector(FileLockBackend(str(tmp_path)), [])
+    other.step()
+    assert other.is_leader
+    other.stop()
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("cv2")
+
+from computer_vision.live_capture import LatestFrameGrabber, capture_target, is_live_source
+
+
+class FakeCapture:
+    """Delivers `frames` frames, then fails like a dropped stream."""
+
+    def __init__(self, frames, opened=True):
+        self.frames = frames
+        self.opened = opened
+        self.released = False
+
+    def isOpened(self):
+        return self.opened
+
+    def set(self, prop, value):
+        return True
+
+    def get(self, prop):
+        return 0.0
+
+    def read(self):
+        if self.frames <= 0:
+            return False, None
+        self.frames -= 1
+        return True, object()
+
+    def release(self):
+        self.released = True
+
+
+def test_live_sources():
+    assert is_live_source("rtsp://cam/stream") and is_live_source("0")
+    assert not is_live_source("public/parking_lot_video_slow.mp4")
+    assert capture_target("0") == 0 and capture_target("rtsp://cam") == "rtsp://cam"
+
+
+def test_reconnects_after_the_source_drops():
+    # Fails to open once, then drops after 3 frames, then stays up
+    captures = [FakeCapture(0, opened=False), FakeCapture(3), FakeCapture(10 ** 6)]
+    opened = []
+    reconnected = threading.Event()
+
+    def open_capture(target):
+        cap = captures[min(len(opened), len(captures) - 1)]
+        opened.append(cap)
+        if len(opened) == 3:
+            reconnected.set()
+        return cap
+
+    grabber = LatestFrameGrabber("rtsp://cam", open_capture=open_capture, reconnect_delay=0.01)
+    grabber.start()
+    try:
+        assert grabber.wait_for_frame(5) is not None
+        assert reconnected.wait(5)
+        deadline = time.monotonic() + 5
+        while (grabber.latest(after=3) is None or not grabber.connected) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        seq, frame, captured_at = grabber.latest(after=3)
+        assert frame is not None and captured_at is not None
+        assert grabber.latest(after=seq + 10 ** 9) is None
+    finally:
+        grabber.stop()
+
+    grabbed, reconnects = grabber.take_counts()
+    assert grabbed > 3
+    assert reconnects == 1
+    assert captures[0].released and captures[1].released
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from lot_cache import LotCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrent_misses_share_one_load():
+    calls = []
+    release = threading.Event()
+
+    def loader(name):
+        calls.append(name)
+        release.wait(5)
+        return {"id": 1, "occupancy": 3}
+
+    cache = LotCache(loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("Furnas"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert calls == ["Furnas"]
+    assert results == [{"id": 1, "occupancy": 3}] * 8
+
+
+def test_waiters_see_the_load_error():
+    release = threading.Event()
+
+    def loader(name):
+        release.wait(5)
+        raise ConnectionError("down")
+
+    cache = LotCache(loader)
+    errors = []
+
+    def get():
+        try:
+            cache.get("Furnas")
+        except ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=get) for _ in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(errors) == 4
+
+
+def test_hits_until_ttl_then_reloads():
+    clock = FakeClock()
+    calls = []
+    cache = LotCache(lambda name: calls.append(name) or {"occupancy": len(calls)}, ttl=10, clock=clock)
+
+    assert cache.get("Furnas") == {"occupancy": 1}
+    clock.now = 9
+    assert cache.get("Furnas") == {"occupancy": 1}
+    clock.now = 11
+    assert cache.get("Furnas") == {"occupancy": 2}
+
+
+def test_serves_last_known_state_when_the_reload_fails():
+    clock = FakeClock()
+    state = {"occupancy": 5}
+
+    def loader(name):
+        if clock.now > 10:
+            raise ConnectionError("down")
+        return dict(state)
+
+    cache = LotCache(loader, ttl=10, clock=clock)
+    cache.get("Furnas")
+    clock.now = 20
+    assert cache.get("Furnas") == {"occupancy": 5}
+    with pytest.raises(ConnectionError):
+        cache.get("Ketter")
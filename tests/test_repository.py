@@ -0,0 +1,129 @@
+import sqlite3
+
+import pytest
+
+import repository
+from repository import SQLiteRepository
+
+
+@pytest.fixture
+def repo(tmp_path):
+    return SQLiteRepository(str(tmp_path / "parkabull.db"))
+
+
+def test_lot_round_trip(repo):
+    created = repo.create_lot("Furnas", 50, occupancy=10, latitude=43.0, longitude=-78.8)
+    assert repo.get_lot("Furnas") == {"id": created["id"], "name": "Furnas", "occupancy": 10,
+                                      "max_occupancy": 50, "leaving_soon": 0}
+    assert repo.get_lot("Nowhere") is None
+
+    repo.set_occupancy("Furnas", 42)
+    assert repo.get_lot("Furnas")["occupancy"] == 42
+    assert [lot["name"] for lot in repo.list_lots()] == ["Furnas"]
+    assert repo.lot_locations() == [{"name": "Furnas", "latitude": 43.0, "longitude": -78.8}]
+
+
+def test_leaving_soon_never_goes_negative(repo):
+    repo.create_lot("Furnas", 50)
+    assert repo.add_leaving_soon("Furnas", 3) == 3
+    assert repo.add_leaving_soon("Furnas", -5) == 0
+    assert repo.add_leaving_soon("Nowhere", 1) == 0
+
+
+def test_schedules(repo):
+    a = repo.create_lot("A", 10)["id"]
+    b = repo.create_lot("B", 10)["id"]
+    repo.insert_schedules([{"id": 1, "lot_id": a, "time": "09:30"},
+                           {"id": 2, "lot_id": a, "time": "08:15:00"},
+                           {"id": 3, "lot_id": b, "time": "17:00:00"}])
+
+    assert repo.schedule_times(a) == ["08:15:00", "09:30:00"]
+    by_lot = repo.schedule_times_by_lot([a, b])
+    assert sorted(by_lot[a]) == ["08:15:00", "09:30:00"] and by_lot[b] == ["17:00:00"]
+    assert repo.distinct_schedule_times() == {"08:15:00", "09:30:00", "17:00:00"}
+
+    # "HH:MM" cutoffs are normalized so they compare like times
+    repo.delete_schedules_before("09:00")
+    assert repo.schedule_times(a) == ["09:30:00"]
+
+
+def test_schedules_need_an_existing_lot(repo):
+    with pytest.raises(sqlite3.IntegrityError):
+        repo.insert_schedules([{"id": 1, "lot_id": 999, "time": "09:00"}])
+
+
+def test_leases(repo):
+    assert repo.acquire_lease("cv", "a", ttl=30)
+    assert repo.acquire_lease("cv", "a", ttl=30)  # renewal
+    assert not repo.acquire_lease("cv", "b", ttl=30)
+    repo.release_lease("cv", "a")
+    assert repo.acquire_lease("cv", "b", ttl=30)
+
+
+def test_expired_lease_can_be_taken_over(repo):
+    assert repo.acquire_lease("cv", "a", ttl=-1)
+    assert repo.acquire_lease("cv", "b", ttl=30)
+
+
+def test_adds_coordinates_to_old_databases(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE lots (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE, "
+                 "occupancy INTEGER NOT NULL DEFAULT 0, max_occupancy INTEGER NOT NULL DEFAULT 0, "
+                 "leaving_soon INTEGER NOT NULL DEFAULT 0)")
+    conn.execute("INSERT INTO lots (name, max_occupancy) VALUES ('Furnas', 50)")
+    conn.commit()
+    conn.close()
+
+    repo = SQLiteRepository(path)
+    assert repo.lot_locations() == [{"name": "Furnas", "latitude": None, "longitude": None}]
+
+
+class FakeQuery:
+    """Just enough of a PostgREST select builder: filters are ignored, range() pages."""
+
+    def __init__(self, rows, ranges):
+        self.rows = rows
+        self.ranges = ranges
+        self.start, self.end = 0, None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        return self
+
+    def in_(self, column, values):
+        return self
+
+    def order(self, column):
+        return self
+
+    def range(self, start, end):
+        self.ranges.append((start, end))
+        self.start, self.end = start, end
+        return self
+
+    def execute(self):
+        class Response:
+            data = self.rows[self.start:self.end + 1]
+        return Response()
+
+
+class FakeClient:
+    def __init__(self, rows):
+        self.rows = rows
+        self.ranges = []
+
+    def table(self, name):
+        return FakeQuery(self.rows, self.ranges)
+
+
+def test_supabase_selects_read_every_page(monkeypatch):
+    monkeypatch.setattr(repository, "PAGE_SIZE", 1000)
+    client = FakeClient([{"lot_id": i % 3, "time": f"{i % 24:02d}:00:00"} for i in range(2500)])
+    repo = repository.SupabaseRepository(client)
+    times = repo.schedule_times_by_lot([0, 1, 2])
+    assert sum(len(t) for t in times.values()) == 2500
+    assert client.ranges == [(0, 999), (1000, 1999), (2000, 2999)]
+    assert len(repo.distinct_schedule_times()) == 24
@@ -0,0 +1,136 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+import pytest
+
+from resilience import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, DeadlineExceeded, Policy)
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def flaky(failures, result="ok"):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise ConnectionError("down")
+        return result
+
+    return fn, calls
+
+
+def test_retries_until_success():
+    fn, calls = flaky(2)
+    info = {}
+    assert Policy("test", attempts=3, base_delay=0.001).call(fn, info=info) == "ok"
+    assert len(calls) == 3 and info["attempts"] == 3
+
+
+def test_gives_up_after_the_last_attempt():
+    fn, calls = flaky(5)
+    with pytest.raises(ConnectionError):
+        Policy("test", attempts=3, base_delay=0.001).call(fn)
+    assert len(calls) == 3
+
+
+def test_non_idempotent_calls_are_not_retried():
+    fn, calls = flaky(1)
+    with pytest.raises(ConnectionError):
+        Policy("test", attempts=3, base_delay=0.001).call(fn, retry=False)
+    assert len(calls) == 1
+
+
+def test_attempt_timeout_is_cut_to_the_deadline():
+    policy = Policy("test", deadline=0.2, attempt_timeout=10, attempts=3, base_delay=0.001)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        policy.call(lambda: time.sleep(1))
+    assert time.monotonic() - started < 0.5
+
+
+def test_hedge_answers_when_the_primary_hangs():
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            return "primary"
+        return "hedge"
+
+    info = {}
+    try:
+        assert Policy("test", attempt_timeout=5, hedge_after=0.05).call(fn, info=info) == "hedge"
+        assert info["hedge_winner"] == "hedge"
+    finally:
+        release.set()
+
+
+def test_attempts_run_in_the_callers_context():
+    token = request_id.set("req-1")
+    try:
+        seen = Policy("test", attempt_timeout=5, hedge_after=0.01).call(lambda: request_id.get())
+    finally:
+        request_id.reset(token)
+    assert seen == "req-1"
+
+
+def test_breaker_opens_then_probes():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30, clock=clock)
+    policy = Policy("test", breaker=breaker)
+    fn, calls = flaky(2)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            policy.call(fn)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        policy.call(fn)
+    assert len(calls) == 2  # rejected without calling out
+
+    clock.now = 31
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()  # one probe at a time
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert policy.call(fn) == "ok"
+
+
+def test_failed_probe_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now = 31
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_async_call_retries_within_the_deadline():
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("down")
+        return "ok"
+
+    assert asyncio.run(Policy("test", attempts=2, base_delay=0.001, deadline=5).acall(fn)) == "ok"
+
+    async def hang():
+        await asyncio.sleep(5)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(Policy("test", deadline=0.05).acall(hang))
@@ -0,0 +1,41 @@
+import pytest
+
+from sampling import AdaptiveInterval
+
+
+def test_stable_lot_backs_off_to_the_max():
+    sampler = AdaptiveInterval(min_interval=1, max_interval=8)
+    at = 0
+    assert sampler.observe("a", 10, 100, at) == 1
+    for expected in (2, 4, 8, 8):
+        at += sampler.interval("a")
+        assert sampler.observe("a", 10, 100, at) == expected
+
+
+def test_change_shrinks_and_fast_change_snaps_to_the_min():
+    sampler = AdaptiveInterval(min_interval=1, max_interval=60, initial=32, fast_rate=6)
+    sampler.observe("a", 10, 100, 0)
+    assert sampler.observe("a", 12, 100, 60) == 16   # 2 spots in a minute: activity, not fast
+    assert sampler.observe("a", 22, 100, 70) == 1    # 10 spots in 10 seconds
+    assert sampler.observe("a", 23, 100, 71) == 2    # 1 spot is detector jitter
+
+
+def test_near_full_caps_the_interval():
+    sampler = AdaptiveInterval(min_interval=1, max_interval=60, initial=30)
+    sampler.observe("a", 95, 100, 0)
+    assert sampler.observe("a", 95, 100, 30) == 2
+
+
+def test_source_restart_rebases():
+    sampler = AdaptiveInterval(min_interval=1, max_interval=60, initial=4)
+    sampler.observe("a", 10, 100, 100)
+    assert sampler.observe("a", 50, 100, 0) == 4
+    assert sampler.intervals() == {"a": 4}
+
+
+def test_bounds_are_checked(monkeypatch):
+    with pytest.raises(ValueError):
+        AdaptiveInterval(min_interval=5, max_interval=1)
+    monkeypatch.setenv("CV_SAMPLE_MAX_SECONDS", "30")
+    sampler = AdaptiveInterval.from_env(2.0)
+    assert (sampler.min_interval, sampler.max_interval, sampler.interval("new")) == (1.0, 30.0, 2.0)
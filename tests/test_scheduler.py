@@ -0,0 +1,98 @@
+import fcntl
+import json
+import os
+import threading
+
+from scheduler import ExpiryScheduler
+
+
+def make_scheduler(journal_path, fired):
+    scheduler = ExpiryScheduler(journal_path=str(journal_path))
+    scheduler.register("revert", lambda timers: fired.extend(t.payload for t in timers), persist=True)
+    scheduler.register("tick", lambda timers: None)
+    return scheduler
+
+
+def test_batches_due_timers_per_kind():
+    batches = []
+    done = threading.Event()
+    scheduler = ExpiryScheduler()
+    scheduler.register("revert", lambda timers: (batches.append([t.payload for t in timers]), done.set()))
+    for lot in ("A", "B", "A"):
+        scheduler.schedule(0, "revert", payload=lot)
+    scheduler.start()
+    try:
+        assert done.wait(5)
+        assert batches == [["A", "B", "A"]]
+    finally:
+        scheduler.stop()
+
+
+def test_keyed_timers_are_deduplicated():
+    scheduler = ExpiryScheduler()
+    scheduler.register("tick", lambda timers: None)
+    assert scheduler.schedule_in(60, "tick", key="k")
+    assert not scheduler.schedule_in(60, "tick", key="k")
+    assert scheduler.pending("tick") == 1
+
+
+def test_journal_survives_a_restart(tmp_path):
+    journal = tmp_path / "scheduler_journal.json"
+    first = make_scheduler(journal, [])
+    first.start()
+    first.schedule_in(60, "revert", payload="Furnas")
+    first.schedule_in(60, "tick", key="not journaled")
+    first.stop()
+
+    fired = []
+    second = make_scheduler(journal, fired)
+    second.start()
+    try:
+        assert second.pending("revert") == 1
+        assert second.pending("tick") == 0
+    finally:
+        second.stop()
+
+
+def test_dead_process_journal_is_restored_once(tmp_path):
+    journal = tmp_path / "scheduler_journal.json"
+    # Left behind by a worker that crashed
+    (tmp_path / "scheduler_journal.12345.json").write_text(json.dumps([[0, "revert", None, "Furnas"]]))
+
+    fired = []
+    first = make_scheduler(journal, fired)
+    first.start()
+    second = make_scheduler(journal, [])
+    second.start()
+    try:
+        assert first.pending("revert") + len(fired) == 1
+        assert second.pending("revert") == 0
+        assert not (tmp_path / "scheduler_journal.12345.json").exists()
+    finally:
+        first.stop()
+        second.stop()
+
+
+def test_live_process_journal_is_left_alone(tmp_path):
+    journal = tmp_path / "scheduler_journal.json"
+    owned = tmp_path / "scheduler_journal.12345.json"
+    owned.write_text(json.dumps([[0, "revert", None, "Furnas"]]))
+    with open(f"{owned}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)  # its owner is still running
+
+        scheduler = make_scheduler(journal, [])
+        scheduler.start()
+        try:
+            assert scheduler.pending("revert") == 0
+            assert owned.exists()
+        finally:
+            scheduler.stop()
+
+
+def test_stop_removes_an_empty_journal(tmp_path):
+    scheduler = make_scheduler(tmp_path / "scheduler_journal.json", [])
+    scheduler.start()
+    journal_file = scheduler.journal_file
+    scheduler.stop()
+    assert journal_file.endswith(f".{os.getpid()}.json")
+    assert not os.path.exists(journal_file)
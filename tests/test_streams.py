@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+from streams import BOUNDARY, FrameHub
+
+
+def test_first_viewer_and_last_leaver_report_viewers():
+    changes = []
+    hub = FrameHub(on_viewers_changed=changes.append, repeat_interval=5)
+    first, second = hub.subscribe("Lot A"), hub.subscribe("lot a")
+    hub.publish("LOT A", b"jpeg-1")
+    assert next(first).startswith(f"--{BOUNDARY}\r\n".encode())
+    assert next(second).endswith(b"jpeg-1\r\n")
+    assert hub.viewers() == {"lot a": 2}
+
+    first.close()
+    second.close()
+    assert changes == [{"lot a": 1}, {}]
+    assert hub.viewers() == {}
+
+
+def test_slow_viewer_skips_to_the_newest_frame():
+    hub = FrameHub(repeat_interval=5)
+    stream = hub.subscribe("a")
+    hub.publish("a", b"one")
+    assert next(stream).endswith(b"one\r\n")
+    hub.publish("a", b"two")
+    hub.publish("a", b"three")
+    assert next(stream).endswith(b"three\r\n")
+    stream.close()
+
+
+def test_quiet_lot_repeats_its_frame():
+    hub = FrameHub(repeat_interval=0.05)
+    stream = hub.subscribe("a")
+    hub.publish("a", b"one")
+    assert next(stream) == next(stream)
+    stream.close()
+
+
+def test_last_leaver_drops_the_frame():
+    hub = FrameHub(repeat_interval=0.05)
+    stream = hub.subscribe("a")
+    hub.publish("a", b"old")
+    next(stream)
+    stream.close()
+
+    stream = hub.subscribe("a")
+    threading.Timer(0.1, hub.publish, args=("a", b"new")).start()
+    assert next(stream).endswith(b"new\r\n")
+    stream.close()
+
+
+def test_async_viewer_wakes_on_publish_and_close():
+    hub = FrameHub(repeat_interval=5)
+
+    async def watch():
+        stream = hub.asubscribe("a")
+        threading.Timer(0.05, hub.publish, args=("a", b"one")).start()
+        part = await asyncio.wait_for(stream.__anext__(), 2)
+        threading.Timer(0.05, hub.close).start()
+        rest = [chunk async for chunk in stream]
+        return part, rest
+
+    part, rest = asyncio.run(watch())
+    assert part.endswith(b"one\r\n")
+    assert rest == []
+    assert hub.viewers() == {}
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from resilience import DeadlineExceeded
+from write_buffer import BufferedInserter
+
+
+class FakeTable:
+    def __init__(self, error=None):
+        self.rows = []
+        self.calls = []
+        self.error = error
+        self.release = threading.Event()
+        self.release.set()
+
+    def insert(self, rows):
+        self.release.wait(5)
+        self.calls.append(len(rows))
+        if self.error is not None:
+            raise self.error
+        if any(row["id"] < 0 for row in rows):
+            raise ValueError("bad row")
+        self.rows.extend(rows)
+
+
+def insert_concurrently(inserter, submissions):
+    errors = [None] * len(submissions)
+
+    def submit(index, rows):
+        try:
+            inserter.insert(rows)
+        except Exception as e:
+            errors[index] = e
+
+    threads = [threading.Thread(target=submit, args=(i, rows)) for i, rows in enumerate(submissions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_concurrent_submissions_share_a_batch():
+    table = FakeTable()
+    table.release.clear()
+    inserter = BufferedInserter("test", table.insert, max_delay=0.2)
+    timer = threading.Timer(0.1, table.release.set)
+    timer.start()
+    errors = insert_concurrently(inserter, [[{"id": i}] for i in range(5)])
+    assert errors == [None] * 5
+    assert sorted(row["id"] for row in table.rows) == list(range(5))
+    assert len(table.calls) < 5
+
+
+def test_a_bad_submission_fails_only_its_own_request():
+    table = FakeTable()
+    table.release.clear()
+    inserter = BufferedInserter("test", table.insert, max_delay=0.2)
+    timer = threading.Timer(0.1, table.release.set)
+    timer.start()
+    errors = insert_concurrently(inserter, [[{"id": 1}], [{"id": -1}], [{"id": 2}, {"id": 3}]])
+    assert errors[0] is None and errors[2] is None
+    assert isinstance(errors[1], ValueError)
+    assert sorted(row["id"] for row in table.rows) == [1, 2, 3]
+
+
+def test_timed_out_batches_are_not_retried():
+    table = FakeTable(error=DeadlineExceeded("slow"))
+    inserter = BufferedInserter("test", table.insert, max_delay=0.2)
+    errors = insert_concurrently(inserter, [[{"id": 1}], [{"id": 2}]])
+    assert all(isinstance(e, DeadlineExceeded) for e in errors)
+    assert sum(table.calls) == 2
+
+
+def test_insert_gives_up_after_its_timeout():
+    table = FakeTable()
+    table.release.clear()
+    inserter = BufferedInserter("test", table.insert, max_delay=0.0, timeout=0.05)
+    with pytest.raises(TimeoutError):
+        inserter.insert([{"id": 1}])
+    table.release.set()
@@ -0,0 +1,216 @@
+"""
+tracing.py
+Lightweight span instrumentation for API requests and CV pipeline ticks.
+
+Spans nest through a context variable, so anything called inside a span
+becomes its child. `propagate()` carries the active span into worker
+threads. Finished spans are exported in batches to a local JSON-lines file,
+one OTLP/JSON `resourceSpans` document per line.
+
+Enable by setting TRACE_EXPORT_PATH (e.g. "traces.jsonl").
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+SERVICE_NAME = "parkabull-api"
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+EXPORT_BATCH_SIZE = 256
+EXPORT_INTERVAL = 2.0  # seconds between flushes of a partial batch
+
+# OTLP span kinds / status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span = contextvars.ContextVar("parkabull_current_span", default=None)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()]
+
+
+class Span:
+    """A timed unit of work with a parent, attributes and a status."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "kind",
+                 "attributes", "start_ns", "end_ns", "status", "status_message")
+
+    def __init__(self, name, parent=None, kind=SPAN_KIND_INTERNAL, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent else ""
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = 0
+        self.status_message = ""
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_error(self, exc):
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if _exporter is not None:
+            _exporter.export(self)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status, "message": self.status_message},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+class _NoopSpan:
+    """Stand-in used when tracing is disabled, so call sites need no checks."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def record_error(self, exc):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonLinesExporter:
+    """Writes finished spans to a file from a background thread."""
+
+    def __init__(self, path, service_name=SERVICE_NAME):
+        self.path = path
+        self.service_name = service_name
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        self._queue.put(span)
+
+    def _write(self, batch):
+        document = {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({
+                    "service.name": self.service_name,
+                    "process.pid": os.getpid(),
+                })},
+                "scopeSpans": [{
+                    "scope": {"name": "parkabull.tracing"},
+                    "spans": [span.to_otlp() for span in batch],
+                }],
+            }]
+        }
+        try:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(document, separators=(",", ":")) + "\n")
+        except OSError as e:
+            logging.getLogger("parkabull.tracing").warning("⚠️  Warning: Could not write traces: %s", e)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + EXPORT_INTERVAL
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            if len(batch) >= EXPORT_BATCH_SIZE or (batch and time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + EXPORT_INTERVAL
+
+
+_exporter = JsonLinesExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+
+
+def enabled():
+    return _exporter is not None
+
+
+def current_span():
+    return _current_span.get()
+
+
+def start_span(name, kind=SPAN_KIND_INTERNAL, **attributes):
+    """
+    Start a span as a child of the active one and make it active.
+    Returns (span, token); pass the token to `finish_span`.
+    """
+    if _exporter is None:
+        return NOOP_SPAN, None
+    span = Span(name, parent=_current_span.get(), kind=kind, attributes=attributes)
+    return span, _current_span.set(span)
+
+
+def finish_span(span, token):
+    """End a span started with `start_span` and restore its parent."""
+    span.end()
+    if token is not None:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Token was created in another context (e.g. a different thread)
+            _current_span.set(None)
+
+
+@contextmanager
+def span(name, kind=SPAN_KIND_INTERNAL, **attributes):
+    """Trace the enclosed block as a child of the active span."""
+    current, token = start_span(name, kind=kind, **attributes)
+    try:
+        yield current
+    except Exception as e:
+        current.record_error(e)
+        raise
+    finally:
+        finish_span(current, token)
+
+
+def propagate(target):
+    """Wrap `target` so it runs in the caller's trace context (for threads)."""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(target, *args, **kwargs)
+
+    return run
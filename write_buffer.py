@@ -0,0 +1,115 @@
+"""
+write_buffer.py
+Group-commit buffer for row inserts.
+
+Request threads hand rows to `insert()` and wait; a single writer thread
+collects everything that arrives within `max_delay` seconds (up to
+`max_batch` rows) and writes it with one multi-row insert. A burst of
+submissions therefore costs one database round trip per batch rather
+than one per request, while each caller still learns whether its own
+rows were written. If a batch insert is rejected, each submission in it
+is retried on its own, so one bad row fails only the request it came in.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+import metrics
+import resilience
+
+log = logging.getLogger("parkabull.write_buffer")
+
+BATCH_SIZE = metrics.REGISTRY.histogram(
+    "parkabull_insert_batch_rows",
+    "Rows per buffered multi-row insert",
+    ("table",),
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+
+class _Request:
+    __slots__ = ("rows", "done", "error")
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.done = threading.Event()
+        self.error = None
+
+
+class BufferedInserter:
+    def __init__(self, table, insert, max_batch=500, max_delay=0.02, timeout=10.0):
+        """
+        Args:
+            table: table name, for metrics and logs
+            insert: fn(rows) that writes a list of row dicts in one call
+            max_batch: flush as soon as this many rows are waiting
+            max_delay: seconds to wait for more rows after the first one arrives
+            timeout: seconds insert() waits for its rows; must outlast `insert`'s own
+                deadline, or a caller can be told its rows failed while they're still being written
+        """
+        self.table = table
+        self._insert = insert
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"{self.table}_inserter", daemon=True)
+                    self._thread.start()
+
+    def insert(self, rows, timeout=None):
+        """Queue `rows` and block until they're written; re-raises the insert's error."""
+        if not rows:
+            return
+        self._ensure_started()
+        request = _Request(list(rows))
+        self._queue.put(request)
+        if not request.done.wait(self.timeout if timeout is None else timeout):
+            raise TimeoutError(f"Timed out waiting for {self.table} insert")
+        if request.error is not None:
+            raise request.error
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            rows = len(batch[0].rows)
+            deadline = time.monotonic() + self.max_delay
+            while rows < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                rows += len(request.rows)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        rows = [row for request in batch for row in request.rows]
+        error = None
+        try:
+            self._insert(rows)
+            BATCH_SIZE.observe(len(rows), table=self.table)
+        except Exception as e:
+            # A timed-out batch may have been written, and an open circuit would fail every retry
+            if len(batch) > 1 and not resilience.is_timeout(e) and not isinstance(e, resilience.CircuitOpenError):
+                log.warning("⚠️  Buffered insert of %d %s rows failed (%s), retrying each submission on its own",
+                            len(rows), self.table, e)
+                for request in batch:
+                    self._flush([request])
+                return
+            log.error("❌ Buffered insert of %d %s rows failed: %s", len(rows), self.table, e)
+            error = e
+        for request in batch:
+            request.error = error
+            request.done.set()